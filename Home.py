@@ -5,7 +5,7 @@
 import random
 import streamlit as st
 
-from src.models_load import load_models
+from src.jobs import get_worker_pool
 from src.utils import create_clickable_blog_post_with_image, blog_posts
 from styles.styles import spacer
 from src.tutorial_utils import ensure_tutorial_mockups
@@ -39,10 +39,11 @@ def main():
         """, unsafe_allow_html=True
     )
 
-    # Load models on startup
-    if 'models' not in st.session_state:
-        with st.spinner("Loading AI models (this may take a minute)..."):
-            st.session_state.models = load_models()
+    # Start the analysis workers on startup; each worker process loads the models itself
+    if 'workers_started' not in st.session_state:
+        with st.spinner("Starting analysis workers..."):
+            get_worker_pool()
+            st.session_state.workers_started = True
             # Generate mockup images for the tutorial if they don't exist
             ensure_tutorial_mockups()
 
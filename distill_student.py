@@ -0,0 +1,183 @@
+# distill_student.py
+"""
+Distil a small student from one of the vision models, for the cascade in src/cascade.py
+
+Usage:
+    python distill_student.py violence DATA_DIR [--backbone resnet18] [--epochs 10] [--shard-dir DIR]
+    python distill_student.py nudity DATA_DIR [--backbone mobilenet_v3_small]
+    python distill_student.py nudity DATA_DIR --report-only
+
+DATA_DIR has one folder per class: frame folders per video for violence (as read by
+VideoFrameDataset), images for nudity. The data is split like create_datasets (seed 42).
+The student is trained on the same deterministic, non-augmented view of the frames the
+teacher's logits are computed on, so every target matches the input it is paired with.
+Teacher logits are cached in --work-dir under a key of the dataset, split settings and
+teacher model file, so changing any of them computes them again. The student is trained
+with train_model and DistillationLoss and saved to STUDENT_MODELS[kind], where
+src/models_load.py picks it up.
+
+Both models are then run on the test split, and the recall retained and the compute
+saved at each escalation threshold are printed and written next to the student as JSON.
+"""
+
+# library imports
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import torch
+import torch.nn as nn
+import torchvision.models as models
+from torch.utils.data import Dataset, Subset
+from torchvision import datasets
+
+from resnet_helper_functions import (DistillationLoss, ResNetLSTM, collect_logits, create_dataloaders,
+                                     create_datasets, define_transforms, train_model)
+from src.cascade import cascade_report, format_cascade_report, forward_seconds, harmful_class_index
+from src.models_load import STUDENT_MODELS, VISUAL_MODELS
+
+BACKBONES = ('resnet18', 'resnet34', 'mobilenet_v3_small')
+# Probability from which the app counts an input as harmful (sequence check, nudity_label)
+DECISION_THRESHOLDS = {'violence': 0.5, 'nudity': 0.85}
+
+class TeacherLogitsDataset(Dataset):
+    """Adds the teacher's cached logits to the (inputs, label) samples of a dataset"""
+    def __init__(self, dataset, teacher_logits):
+        self.dataset = dataset
+        self.teacher_logits = torch.from_numpy(teacher_logits).float()
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        inputs, label = self.dataset[idx]
+        return inputs, label, self.teacher_logits[idx]
+
+def build_student(kind, backbone, num_classes, lstm_hidden_size=256, lstm_num_layers=1):
+    """ImageNet-pretrained student: a ResNetLSTM for violence windows, a frame classifier for nudity"""
+    base = getattr(models, backbone)(weights="DEFAULT")
+    if kind == 'violence':
+        if not backbone.startswith('resnet'):
+            raise ValueError("The violence student is a ResNetLSTM and needs a ResNet backbone")
+        return ResNetLSTM(base, lstm_hidden_size, lstm_num_layers, num_classes)
+    if backbone.startswith('resnet'):
+        base.fc = nn.Linear(base.fc.in_features, num_classes)
+    else:
+        base.classifier[-1] = nn.Linear(base.classifier[-1].in_features, num_classes)
+    return base
+
+def create_image_datasets(data_dir, train_perc, val_perc):
+    """
+    Split an image folder dataset with the same seed as create_datasets
+
+    All splits use the eval transforms: the cached teacher logits are only valid for the
+    exact images they were computed on.
+    """
+    eval_images = datasets.ImageFolder(data_dir, transform=define_transforms()['val'])
+
+    dataset_size = len(eval_images)
+    train_size = int(train_perc * dataset_size)
+    val_size = int(val_perc * dataset_size)
+    indices = torch.randperm(dataset_size, generator=torch.Generator().manual_seed(42)).tolist()
+
+    train_dataset = Subset(eval_images, indices[:train_size])
+    val_dataset = Subset(eval_images, indices[train_size:train_size + val_size])
+    test_dataset = Subset(eval_images, indices[train_size + val_size:])
+    return train_dataset, val_dataset, test_dataset, eval_images.classes
+
+def teacher_logits_path(args, teacher_path, split):
+    """Cache file of the teacher's logits, keyed on everything that changes them"""
+    key = json.dumps({
+        "kind": args.kind, "data_dir": os.path.abspath(args.data_dir), "split": split,
+        "sequence_length": args.sequence_length, "stride": args.stride,
+        "shard_dir": os.path.abspath(args.shard_dir) if args.shard_dir else None,
+        "teacher": os.path.abspath(teacher_path), "teacher_mtime": os.path.getmtime(teacher_path),
+    }, sort_keys=True)
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(args.work_dir, f"teacher_{args.kind}_{split}_{digest}.npz")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distil a student model for the vision model cascade.")
+    parser.add_argument("kind", choices=sorted(VISUAL_MODELS))
+    parser.add_argument("data_dir", help="Dataset directory with one folder per class")
+    parser.add_argument("--backbone", choices=BACKBONES, default="resnet18")
+    parser.add_argument("-o", "--output", help="Student model path (default: STUDENT_MODELS[kind])")
+    parser.add_argument("--work-dir", default=os.path.join("saves", "distill"),
+                        help="Directory for cached teacher logits and training plots")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--lr", type=float, default=1e-4)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--alpha", type=float, default=0.7, help="Weight of the distillation term")
+    parser.add_argument("--sequence-length", type=int, default=16, help="Frames per window (violence)")
+    parser.add_argument("--stride", type=int, default=4, help="Step between windows (violence)")
+    parser.add_argument("--shard-dir", help="Pre-decoded frame shards to read (violence)")
+    parser.add_argument("--num-workers", type=int, default=2)
+    parser.add_argument("--amp", action="store_true", help="Train with mixed precision")
+    parser.add_argument("--report-only", action="store_true", help="Skip training and report on the saved student")
+    args = parser.parse_args(argv)
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    teacher_path, class_names = VISUAL_MODELS[args.kind]
+    output = args.output or STUDENT_MODELS[args.kind]
+    teacher = torch.load(teacher_path, map_location=device, weights_only=False)
+    teacher.eval()
+
+    if args.kind == 'violence':
+        train_dataset, val_dataset, test_dataset, dataset_classes, _ = create_datasets(
+            args.data_dir, 0.7, 0.15, 0.15, sequence_length=args.sequence_length, stride=args.stride,
+            shard_dir=args.shard_dir)
+        # Deterministic view for training too (the splits share one dataset), see the module docstring
+        train_dataset.dataset.transform = define_transforms()['val']
+        train_dataset.dataset.temporal_augment = False
+    else:
+        train_dataset, val_dataset, test_dataset, dataset_classes = create_image_datasets(args.data_dir, 0.7, 0.15)
+    if list(dataset_classes) != list(class_names):
+        print(f"Class folders {dataset_classes} don't match the teacher's classes {class_names}")
+        return 1
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    if not args.report_only:
+        # Teacher outputs on the training split, in dataset order
+        train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=args.batch_size, shuffle=False,
+                                                   num_workers=args.num_workers)
+        teacher_logits, _ = collect_logits(teacher, train_loader, device, class_names,
+                                           teacher_logits_path(args, teacher_path, "train"))
+        dataloaders, dataset_sizes = create_dataloaders(TeacherLogitsDataset(train_dataset, teacher_logits),
+                                                        val_dataset, test_dataset, args.batch_size,
+                                                        num_workers=args.num_workers)
+        student = build_student(args.kind, args.backbone, len(class_names))
+        optimizer = torch.optim.AdamW(student.parameters(), lr=args.lr, weight_decay=1e-4)
+        scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=2)
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        train_model(student, output, DistillationLoss(args.temperature, args.alpha), optimizer, dataloaders,
+                    dataset_sizes, scheduler=scheduler, device=device, num_epochs=args.epochs,
+                    plot_path=os.path.join(args.work_dir, f"student_{args.kind}_training.png"), amp=args.amp)
+
+    # Recall retained vs compute saved on the test split
+    student = torch.load(output, map_location=device, weights_only=False)
+    student.eval()
+    test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=args.batch_size, shuffle=False,
+                                              num_workers=args.num_workers)
+    student_logits, labels = collect_logits(student, test_loader, device, class_names)
+    teacher_logits, _ = collect_logits(teacher, test_loader, device, class_names,
+                                       teacher_logits_path(args, teacher_path, "test"))
+    batch = next(iter(test_loader))[0].to(device)
+    cost_ratio = forward_seconds(student, batch) / forward_seconds(teacher, batch)
+    decision_threshold = DECISION_THRESHOLDS[args.kind]
+    rows = cascade_report(student_logits, teacher_logits, labels, harmful_class_index(class_names),
+                          decision_threshold=decision_threshold, cost_ratio=cost_ratio)
+    print(f"\nStudent forward pass costs {cost_ratio:.1%} of the teacher's")
+    print(format_cascade_report(rows))
+
+    report_path = os.path.splitext(output)[0] + "_cascade_report.json"
+    with open(report_path, "w") as f:
+        json.dump({"kind": args.kind, "student": output, "teacher": teacher_path, "cost_ratio": cost_ratio,
+                   "decision_threshold": decision_threshold, "rows": rows}, f, indent=2)
+    print(f"Report written to {report_path}; enable the cascade with BUDDYGUARD_CASCADE_THRESHOLD=<threshold>")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,35 +1,29 @@
 # pages/1__Upload & Process.py
 
 import glob
-import logging
 import os
-import time
 import streamlit as st
 from pytubefix import YouTube
 from slugify import slugify
 
 # Import custom modules
-from src.proc_audio import extract_audio, transcribe_audio, display_transcription_with_timestamps
-from src.proc_nudity import extract_nudity_sequences
-from src.proc_text import classify_text
-from src.proc_video import combine_frames_to_video
-from src.proc_video_sequence import extract_frame_sequences
+from src.jobs import DONE, FAILED, CANCELLED, FINISHED_STATES, get_worker_pool
+from src.pipeline import DETECTION_MODES
+from src.proc_audio import display_transcription_with_timestamps
+from src.retention import get_janitor
+from src.uploads import stream_upload_to_disk, check_video_duration
 from src.utils import (
     is_portrait_video,
-    get_total_frames,
-    calculate_average_scores,
-    weighted_fusion,
-    save_results,
     get_detected_sequences,
-    get_video_duration
+    show_sequence_clip,
+    get_video_duration,
+    get_history_store
 )
 from styles.styles import spacer
 
 # --- Initialize Session State ---
 if 'uploaded_video' not in st.session_state:
     st.session_state.uploaded_video = None
-if 'cancel_processing' not in st.session_state:
-    st.session_state.cancel_processing = False
 if 'processing_complete' not in st.session_state:
     st.session_state.processing_complete = False
 if 'show_results' not in st.session_state:
@@ -40,202 +34,80 @@ if 'output_dir' not in st.session_state:
     st.session_state.output_dir = None
 if 'download_progress' not in st.session_state:
     st.session_state.download_progress = None
-if 'models' not in st.session_state:
-    st.session_state.models = None
-
-# At the top of your file
-CLEANUP_TEMP_FILES = True  # Can be made configurable via st.toggle()
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+if 'saved_upload_id' not in st.session_state:
+    st.session_state.saved_upload_id = None
 
 # --- Helper Functions ---
-def analyze_video(video_path, output_dir, models, mode="Violence + Audio Detection"):
-    """Analyzes the video content with automatic cleanup of temporary files.
-
-    Args:
-        video_path: Path to the video file
-        output_dir: Directory to store processed files
-        models: Dictionary of loaded models
-        mode: Detection mode ("Violence + Audio Detection" or "Nudity + Audio Detection")
-    """
-    start_time = time.time()
-    progress_bar = st.progress(0)
-    processing_status = st.empty()
-    st.session_state.cancel_processing = False
-    total_frames = get_total_frames(video_path)
-    total_work = total_frames + 2  # Frames + audio processing + final processing
-    current_work = [0]
-
-    def update_progress(increment=1):
-        current_work[0] += increment
-        progress_percentage = min(current_work[0] / total_work, 1.0)
-        progress_bar.progress(progress_percentage)
-        if st.session_state.cancel_processing:
-            st.warning("Process cancelled by user")
-            st.stop()
-
-    try:
-        with processing_status.container():
-            st.spinner(f"Analyzing video: {os.path.basename(video_path)}")
-            if st.button("Cancel Process", type="secondary", use_container_width=True, key="cancel_btn"):
-                st.session_state.cancel_processing = True
-                st.warning("Cancelling process...")
-                st.stop()
-
-            # Common processing steps for both modes
-            with st.spinner("Extracting audio..."):
-                audio_path = os.path.join(output_dir, "output_audio.wav")
-                extract_audio(video_path, audio_path)
-                update_progress()
-
-            with st.spinner("Transcribing audio..."):
-                transcription = transcribe_audio(audio_path, models['whisper_model'])
-                update_progress()
-
-            with st.spinner("Analyzing text content..."):
-                text_label, harmful_conf_text, safe_conf_text, highlighted_text = classify_text(
-                    transcription, models['bert_model'], models['tokenizer'], models['device']
-                )
-                update_progress()
-
-            # Mode-specific video processing
-            with st.spinner("Analyzing video frames..."):
-                frames_path = os.path.join(output_dir, "processed_frames")
-
-                if mode == "Violence + Audio Detection":
-                    frame_count, predictions_per_frame, confidence_scores_by_class, harmful_sequences = extract_frame_sequences(
-                        video_path,
-                        frames_path,
-                        models['violence_model'],
-                        models['violence_class_names'],
-                        sequence_length=16,
-                        progress_callback=lambda: progress_with_cancel_check(update_progress),
-                    )
-                    # Prepare scores for violence mode
-                    harmful_score_visual = confidence_scores_by_class.get('Violence', 0.0)
-                    safe_score_visual = confidence_scores_by_class.get('Safe', 0.0)
-                else:  # Nudity + Text mode
-                    frame_count, predictions_per_frame, confidence_scores_by_class, harmful_sequences = extract_nudity_sequences(
-                        video_path,
-                        frames_path,
-                        models['nudity_model'],
-                        models['nudity_class_names'],
-                        sequence_length=16,
-                        progress_callback=lambda: progress_with_cancel_check(update_progress),
-                    )
-                    # Prepare scores for nudity mode
-                    harmful_score_visual = confidence_scores_by_class.get('nude', 0.0)
-                    safe_score_visual = confidence_scores_by_class.get('safe', 0.0)
-
-            with st.spinner("Calculating final results..."):
-                bert_scores = {
-                    'safe': safe_conf_text,
-                    'harmful': harmful_conf_text
-                }
-
-                # With:
-                if mode == "Violence + Audio Detection":
-                    visual_scores = {
-                        'safe': safe_score_visual,
-                        'harmful': harmful_score_visual
-                    }
-                else:  # Nudity + Audio Detection mode
-                    visual_scores = {
-                        'safe': safe_score_visual,
-                        'nude': harmful_score_visual  # Use 'nude' key for nudity mode
-                    }
-
-                # Use mode-specific fusion
-                final_prediction, final_confidence = weighted_fusion(
-                    bert_scores,
-                    visual_scores,
-                    mode="violence" if mode == "Violence + Audio Detection" else "nudity"
-                )
-
-            with st.spinner("Generating processed video..."):
-                processed_video_path = os.path.join(output_dir, f"processed_{os.path.basename(output_dir)}.mp4")
-                combine_frames_to_video(frames_path, processed_video_path, frame_count, audio_path)
-                update_progress()
-
-            # Prepare results dictionary
-            results = {
-                "mode": mode,
-                "harmful_score_visual": harmful_score_visual,
-                "safe_score_visual": safe_score_visual,
-                "visual_scores": visual_scores,
-                "harmful_conf_text": harmful_conf_text,
-                "safe_conf_text": safe_conf_text,
-                "bert_scores": bert_scores,
-                "final_prediction": final_prediction,
-                "final_confidence": final_confidence,
-                "transcription": transcription,
-                "highlighted_text": highlighted_text,
-                "processing_time": time.time() - start_time,
-            }
-
-            # Add mode-specific keys for backward compatibility
-            if mode == "Violence + Audio Detection":
-                results.update({
-                    "harmful_score_resnet": harmful_score_visual,
-                    "safe_score_resnet": safe_score_visual,
-                    "resnet_scores": visual_scores
-                })
-            else:
-                results.update({
-                    "nude_score": harmful_score_visual,
-                    "safe_score_nudity": safe_score_visual
-                })
-
-            save_results(output_dir, os.path.basename(output_dir), results)
+def submit_analysis(video_path, output_dir, mode="Violence + Audio Detection", options=None):
+    """Queues the video for analysis by the background workers and returns the job id.
 
-            if CLEANUP_TEMP_FILES:
-                cleanup_temp_files(output_dir)
+    The job id is also put in the URL so a page reload can pick the job up again.
+    options are passed to the job (e.g. {"profile": True}).
+    """
+    pool = get_worker_pool()
+    pool.ensure_alive()
+    job_id = pool.queue.enqueue(video_path, output_dir, mode, options)
+    st.session_state.job_id = job_id
+    st.query_params["job"] = job_id
+    return job_id
+
+@st.fragment(run_every=1.0)
+def show_job_progress(job_id):
+    """Polls a queued job and shows its progress until it finishes."""
+    queue = get_worker_pool().queue
+    job = queue.get(job_id)
+    if job is None:
+        st.error("Analysis job not found.")
+        return
 
-            return results, processed_video_path
+    if job['status'] in FINISHED_STATES:
+        # Rerun the whole page so the results section picks up the finished job
+        st.rerun()
 
-    except Exception as e:
-        st.error(f"Error during processing: {str(e)}")
-        # Attempt cleanup even if processing failed
-        try:
-            cleanup_temp_files(output_dir)
-        except Exception as cleanup_error:
-            st.warning(f"Additional error during cleanup: {str(cleanup_error)}")
-        raise e
+    st.progress(job['progress'], text=job['message'] or "Waiting for a free worker...")
+    if st.button("Cancel Process", type="secondary", use_container_width=True, key="cancel_btn"):
+        queue.request_cancel(job_id)
+        st.warning("Cancelling process...")
 
-def cleanup_temp_files(output_dir):
-    """Remove temporary files after video processing while preserving essential results."""
-    try:
-        # Files to remove
-        temp_files = [
-            os.path.join(output_dir, "video.mp4"),  # Original video
-            os.path.join(output_dir, "output_audio.wav"),  # Temporary audio
-            os.path.join(output_dir, f"{os.path.basename(output_dir)}.mp4")  # Original uploaded file if exists
-        ]
-
-        # Directories to clean
-        temp_dirs = [
-            os.path.join(output_dir, "processed_frames")  # Frame images
-        ]
-
-        # Remove files
-        for file_path in temp_files:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logging.info(f"Removed temporary file: {file_path}")
-
-        # Clean directories (remove contents but keep directory structure)
-        for dir_path in temp_dirs:
-            if os.path.exists(dir_path):
-                for file_name in os.listdir(dir_path):
-                    file_path = os.path.join(dir_path, file_name)
-                    try:
-                        if os.path.isfile(file_path) and not file_name.endswith('.gif'):  # Keep GIFs
-                            os.remove(file_path)
-                            logging.info(f"Removed temporary frame: {file_path}")
-                    except Exception as e:
-                        st.warning(f"Couldn't remove {file_path}: {str(e)}")
+def collect_job_results(job_id):
+    """Loads the results of a finished job into session state."""
+    job = get_worker_pool().queue.get(job_id)
+    st.session_state.job_id = None
+    if job is None:
+        return
+    # Let the janitor apply the retention policy now that history has grown
+    get_janitor().wake()
+    if job['status'] == DONE:
+        results = get_history_store().get_result(job['video_name'])
+        if results:
+            st.session_state.processing_complete = True
+            st.session_state.show_results = True
+            st.session_state.processed_video_path = job['processed_video_path']
+            st.session_state.analysis_results = results
+            processing_time = results['processing_time']
+            minutes, seconds = divmod(processing_time, 60)
+            time_str = f"{int(minutes)}m {int(seconds)}s" if minutes > 0 else f"{int(seconds)} seconds"
+            st.success(f"Analysis complete! Processing time: {time_str}")
+            st.balloons()
+    elif job['status'] == CANCELLED:
+        st.warning("Process cancelled by user")
+    elif job['status'] == FAILED:
+        st.error(f"Error during processing: {job['error']}")
 
-    except Exception as e:
-        st.warning(f"Cleanup warning: {str(e)}")
-        raise
+def restore_job_from_url():
+    """Re-attaches to a job after a page reload using the job id in the URL."""
+    job_id = st.query_params.get("job")
+    if not job_id or st.session_state.job_id or st.session_state.uploaded_video:
+        return
+    job = get_worker_pool().queue.get(job_id)
+    if job is None:
+        return
+    st.session_state.uploaded_video = job['video_path']
+    st.session_state.video_name = job['video_name']
+    st.session_state.output_dir = job['output_dir']
+    st.session_state.job_id = job_id
 
 def display_results(results, output_dir, mode="Violence + Audio Detection"):
     """Displays the analysis results in the Streamlit app."""
@@ -421,7 +293,7 @@ def display_results(results, output_dir, mode="Violence + Audio Detection"):
                     if i + col_idx < len(sequences):
                         with cols[col_idx]:
                             st.markdown(f"**Sequence {i + col_idx + 1}**")
-                            st.image(sequences[i + col_idx]['gif_path'], use_container_width=True)
+                            show_sequence_clip(sequences[i + col_idx]['clip_path'])
 
     with tab3:
         display_transcription_with_timestamps(results['transcription'], "results_video_player")
@@ -437,10 +309,7 @@ def download_youtube_video(youtube_url):
         )
 
         # Check duration before downloading
-        if yt.length < 10:
-            raise ValueError(f"Video is too short ({yt.length} seconds). Minimum length is 10 seconds.")
-        if yt.length > 180:
-            raise ValueError(f"Video is too long ({yt.length} seconds). Maximum length is 180 seconds.")
+        check_video_duration(yt.length)
 
         video_stream = yt.streams.filter(file_extension='mp4').first()
         if video_stream:
@@ -509,47 +378,40 @@ def processing_output_exists(output_dir):
 
     return False
 
-def progress_with_cancel_check(update_fn):
-    """Wrapper for progress callback that checks for cancellation."""
-    if st.session_state.cancel_processing:
-        st.warning("Process cancelled by user")
-        st.stop()
-    update_fn()
-
 def save_uploaded_video(uploaded_file):
-    """Saves the uploaded video file and returns the local file path and video name."""
+    """Streams the uploaded video file to disk and returns the local file path and video name."""
     video_name = slugify(os.path.splitext(uploaded_file.name)[0], lowercase=False, max_length=50)
     # Only create new folder if processing output exists in existing folder
     output_dir, video_name = get_unique_output_dir("output", video_name, check_processing_output=True)
     video_path = os.path.join(output_dir, f"{video_name}.mp4")
 
     with st.spinner("Saving uploaded video..."):
-        with open(video_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-
-        # Check video duration
-        duration = get_video_duration(video_path)
-        if duration < 10:
-            os.remove(video_path)
-            os.rmdir(output_dir)  # Clean up the empty directory
-            raise ValueError(f"Video is too short ({duration:.1f} seconds). Minimum length is 10 seconds.")
-        if duration > 180:
-            os.remove(video_path)
+        try:
+            # Over-long videos are rejected as soon as the header arrives; the minimum
+            # is only checked on the complete file, whose duration is not an estimate
+            metadata = stream_upload_to_disk(
+                uploaded_file, video_path,
+                validate=lambda meta: check_video_duration(meta['duration']),
+                validate_partial=lambda meta: check_video_duration(meta['duration'], min_duration=0)
+            )
+            if metadata is None:
+                # Header could not be read by ffprobe; fall back to the full-file probe
+                check_video_duration(get_video_duration(video_path))
+        except ValueError:
+            if os.path.exists(video_path):
+                os.remove(video_path)
             os.rmdir(output_dir)  # Clean up the empty directory
-            raise ValueError(f"Video is too long ({duration:.1f} seconds). Maximum length is 180 seconds.")
+            raise
 
     return video_path, video_name, output_dir
 
 # --- Main Streamlit App ---
 def main():
     st.title("Analyze Video")
-    # Load models
-    # Use pre-loaded models instead of loading here
-    if 'models' not in st.session_state or st.session_state.models is None:
-        st.error("AI models failed to load. Please refresh the page.")
-        return
-
-    models = st.session_state.models  # Use the pre-loaded models
+    # Analysis runs in background worker processes that hold the models
+    pool = get_worker_pool()
+    pool.ensure_alive()
+    restore_job_from_url()
 
     logo_path = "images/Buddyguard_4_3.png"
     st.html("""
@@ -577,7 +439,7 @@ def main():
     st.subheader("Detection Mode")
     detection_mode = st.radio(
         "Select detection type:",
-        ("Violence + Audio Detection", "Nudity + Audio Detection"),
+        DETECTION_MODES,
         index=0,
         horizontal=True
     )
@@ -596,7 +458,9 @@ def main():
                 key="file_uploader"
             )
 
-            if uploaded_file is not None:
+            # Reruns (e.g. job polling) keep the same upload; only save a new file once
+            if uploaded_file is not None and uploaded_file.file_id != st.session_state.saved_upload_id:
+                st.session_state.saved_upload_id = uploaded_file.file_id
                 if uploaded_file.size > 500 * 1024 * 1024:
                     st.error("File too large. Maximum size is 500MB.")
                 else:
@@ -651,24 +515,25 @@ def main():
                 else:
                     st.video(video_path)
 
+        if st.session_state.job_id is not None:
+            job = pool.queue.get(st.session_state.job_id)
+            if job is not None and job['status'] not in FINISHED_STATES:
+                show_job_progress(st.session_state.job_id)
+            else:
+                collect_job_results(st.session_state.job_id)
         # Only show process button if not already processed
-        if not st.session_state.processing_complete:
+        elif not st.session_state.processing_complete:
+            # Hidden debug option, shown with ?debug=1 in the URL
+            profile_job = st.query_params.get("debug") == "1" and st.checkbox(
+                "Profile model forward passes", key="profile_job",
+                help="Saves a torch profiler trace and operator table in the video's output folder"
+            )
             if st.button("Analyze Video", type="primary", use_container_width=True, key="analyze_btn"):
                 st.session_state.processing_complete = False
                 st.session_state.show_results = False
-                results, processed_video_path = analyze_video(
-                    st.session_state.uploaded_video, st.session_state.output_dir, models, detection_mode
-                )
-                if results:
-                    st.session_state.processing_complete = True
-                    st.session_state.show_results = True
-                    st.session_state.processed_video_path = processed_video_path
-                    st.session_state.analysis_results = results
-                    processing_time = results['processing_time']
-                    minutes, seconds = divmod(processing_time, 60)
-                    time_str = f"{int(minutes)}m {int(seconds)}s" if minutes > 0 else f"{int(seconds)} seconds"
-                    st.success(f"Analysis complete! Processing time: {time_str}")
-                    st.balloons()
+                submit_analysis(st.session_state.uploaded_video, st.session_state.output_dir, detection_mode,
+                                options={"profile": bool(profile_job)})
+                st.rerun()
 
     st.markdown("---")
 
@@ -688,7 +553,8 @@ def main():
                 else:
                     st.video(processed_video_path)
 
-        display_results(st.session_state.analysis_results, st.session_state.output_dir, detection_mode)
+        results = st.session_state.analysis_results
+        display_results(results, st.session_state.output_dir, results.get('mode', detection_mode))
 
         spacer(20)
 
@@ -697,11 +563,12 @@ def main():
             st.session_state.uploaded_video = None
             st.session_state.processing_complete = False
             st.session_state.show_results = False
-            st.session_state.cancel_processing = False
             st.session_state.video_name = None
             st.session_state.output_dir = None
             st.session_state.analysis_results = None
             st.session_state.processed_video_path = None
+            st.session_state.job_id = None
+            st.query_params.clear()
             st.rerun()
 
 
@@ -6,9 +6,12 @@ import torchvision
 import torchvision.transforms as transforms
 import time
 import copy
+import hashlib
+import json
 import os
+import numpy as np
 from PIL import Image
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, Subset
 import torch.nn as nn
 import torchvision.models as models
 from sklearn.metrics import confusion_matrix, classification_report, precision_recall_curve, auc
@@ -48,8 +51,97 @@ def define_transforms():
 
     return data_transforms
 
+FRAME_INDEX_FILE = ".frame_index.json"
+FRAME_INDEX_VERSION = 1
+
+def list_classes(data_dir):
+    """Class folders of a dataset directory, in os.listdir order"""
+    return [d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d))]
+
+def list_frame_numbers(video_path):
+    """Sorted (frame number, file name) pairs of the frame_<n>.jpg/png files in a video folder"""
+    frames = {}
+    for f in os.listdir(video_path):
+        if f.lower().endswith(('.jpg', '.png')) and f.startswith('frame_'):
+            try:
+                frames.setdefault(int(f.split('_')[1].split('.')[0]), f)
+            except (IndexError, ValueError):
+                continue
+    return sorted(frames.items())
+
+def _load_frame_index(index_path):
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if index.get("version") == FRAME_INDEX_VERSION else None
+
+def _index_is_current(index, data_dir):
+    # Adding or removing a video or frame changes the mtime of its parent directory. data_dir's
+    # own mtime also changes when the index is written there, so its classes are compared instead
+    try:
+        return sorted(index["classes"]) == sorted(list_classes(data_dir)) and all(os.stat(os.path.join(data_dir, rel)).st_mtime_ns == mtime
+                   for rel, mtime in index["mtimes"].items())
+    except OSError:
+        return False
+
+def scan_frame_index(data_dir, use_cache=True):
+    """
+    Frame numbers of every video folder of a dataset, cached in data_dir/.frame_index.json
+
+    The cache is reused while the class folders are the same and the modification times of
+    the class and video folders are unchanged. Otherwise only the video folders that changed are
+    listed again and the cache is rewritten.
+
+    Args:
+        data_dir: Directory with class folders containing video frame folders
+        use_cache: Read and write the cache file
+
+    Returns:
+        Dict of class name to a dict of video folder name to sorted frame numbers
+    """
+    index_path = os.path.join(data_dir, FRAME_INDEX_FILE)
+    previous = _load_frame_index(index_path) if use_cache else None
+    if previous is not None and _index_is_current(previous, data_dir):
+        return previous["classes"]
+
+    old_mtimes = previous["mtimes"] if previous else {}
+    old_classes = previous["classes"] if previous else {}
+    mtimes = {}
+    classes = {}
+    rescanned = 0
+    for target_class in list_classes(data_dir):
+        target_dir = os.path.join(data_dir, target_class)
+        mtimes[target_class] = os.stat(target_dir).st_mtime_ns
+        videos = classes[target_class] = {}
+        for video_folder in os.listdir(target_dir):
+            video_path = os.path.join(target_dir, video_folder)
+            if not os.path.isdir(video_path):
+                continue
+            rel = os.path.join(target_class, video_folder)
+            mtimes[rel] = os.stat(video_path).st_mtime_ns
+            cached = old_classes.get(target_class, {}).get(video_folder)
+            if cached is not None and old_mtimes.get(rel) == mtimes[rel]:
+                videos[video_folder] = cached
+            else:
+                videos[video_folder] = [num for num, _ in list_frame_numbers(video_path)]
+                rescanned += 1
+
+    if use_cache:
+        try:
+            with open(index_path + ".tmp", "w") as f:
+                json.dump({"version": FRAME_INDEX_VERSION, "mtimes": mtimes, "classes": classes}, f)
+            os.replace(index_path + ".tmp", index_path)
+        except OSError as e:
+            print(f"Warning: Couldn't write the frame index to {index_path}: {e}")
+    print(f"Indexed {data_dir}: listed {rescanned} video folders, "
+          f"{sum(len(v) for v in classes.values()) - rescanned} unchanged")
+    return classes
+
 class VideoFrameDataset(Dataset):
-    def __init__(self, data_dir, transform=None, sequence_length=16, stride=4, temporal_augment=True):
+    def __init__(self, data_dir, transform=None, sequence_length=16, stride=4, temporal_augment=True,
+                 cache_index=True):
         """
         Enhanced video frame dataset with temporal augmentation and stride sampling
 
@@ -59,13 +151,15 @@ class VideoFrameDataset(Dataset):
             sequence_length: Number of frames per sequence
             stride: Step size when sampling frames (lower = more overlap)
             temporal_augment: Whether to apply temporal augmentation
+            cache_index: Reuse the folder scan cached in data_dir (see scan_frame_index)
         """
         self.data_dir = data_dir
         self.transform = transform
         self.sequence_length = sequence_length
         self.stride = stride
         self.temporal_augment = temporal_augment
-        self.classes = os.listdir(data_dir)
+        self.frame_index = scan_frame_index(data_dir, use_cache=cache_index)
+        self.classes = list(self.frame_index)
         self.class_to_idx = {cls: i for i, cls in enumerate(self.classes)}
         self.samples = self._make_dataset()
 
@@ -75,22 +169,8 @@ class VideoFrameDataset(Dataset):
             class_index = self.class_to_idx[target_class]
             target_dir = os.path.join(self.data_dir, target_class)
 
-            for video_folder in os.listdir(target_dir):
+            for video_folder, frames in self.frame_index[target_class].items():
                 video_path = os.path.join(target_dir, video_folder)
-                if not os.path.isdir(video_path):
-                    continue
-
-                # Get all valid frames
-                frames = []
-                for f in os.listdir(video_path):
-                    if f.lower().endswith(('.jpg', '.png')) and f.startswith('frame_'):
-                        try:
-                            frame_num = int(f.split('_')[1].split('.')[0])
-                            frames.append(frame_num)
-                        except (IndexError, ValueError):
-                            continue
-
-                frames = sorted(frames)
 
                 # Only add samples if we have enough frames
                 if len(frames) >= self.sequence_length:
@@ -106,10 +186,8 @@ class VideoFrameDataset(Dataset):
     def __len__(self):
         return len(self.samples)
 
-    def __getitem__(self, idx):
-        video_path, start_frame, class_index = self.samples[idx]
-        frames = []
-
+    def _frame_indices(self):
+        """Offsets of the frames to load within a window"""
         # Temporal augmentation: randomly skip frames or change playback speed
         frame_indices = list(range(self.sequence_length))
         if self.temporal_augment and self.transform == 'train':
@@ -123,7 +201,13 @@ class VideoFrameDataset(Dataset):
                 # Pad if needed
                 while len(frame_indices) < self.sequence_length:
                     frame_indices.append(frame_indices[-1])
+        return frame_indices
+
+    def __getitem__(self, idx):
+        video_path, start_frame, class_index = self.samples[idx]
+        frames = []
 
+        frame_indices = self._frame_indices()
         for i in frame_indices:
             frame_num = start_frame + i
             # Try both padded and non-padded formats
@@ -153,12 +237,280 @@ class VideoFrameDataset(Dataset):
         frames = torch.stack(frames)
         return frames, class_index
 
-def create_datasets(data_dir, train_perc, val_perc, test_perc, sequence_length=16, stride=4):
+SHARD_INDEX_FILE = "index.json"
+SHARD_SIZE = 256  # Shorter side of the stored frames, the size the transforms resize to anyway
+
+def convert_to_frame_shards(data_dir, shard_dir, size=SHARD_SIZE, overwrite=False):
+    """
+    One-time conversion of a frame folder dataset into per-video uint8 array shards
+
+    Every video folder of data_dir/<class>/ becomes shard_dir/<class>/<video>.npy, an
+    (N, H, W, 3) RGB array of its frames in frame order, resized so the shorter side
+    is `size`. shard_dir/index.json lists the classes and the frame count of every
+    shard; FrameShardDataset builds its windows from it. Videos already converted
+    are skipped unless overwrite is set, so an interrupted conversion can be resumed.
+
+    Returns:
+        Path of the index file
+    """
+    resize = transforms.Resize(size)
+    classes = list_classes(data_dir)  # Same class order as VideoFrameDataset
+    videos = []
+    for target_class in classes:
+        target_dir = os.path.join(data_dir, target_class)
+        os.makedirs(os.path.join(shard_dir, target_class), exist_ok=True)
+        for video_folder in sorted(os.listdir(target_dir)):
+            video_path = os.path.join(target_dir, video_folder)
+            if not os.path.isdir(video_path):
+                continue
+            frame_files = [f for _, f in list_frame_numbers(video_path)]
+            if not frame_files:
+                continue
+            shard_name = os.path.join(target_class, f"{video_folder}.npy")
+            shard_path = os.path.join(shard_dir, shard_name)
+
+            if overwrite or not os.path.exists(shard_path):
+                first = np.asarray(resize(Image.open(os.path.join(video_path, frame_files[0])).convert('RGB')))
+                tmp_path = shard_path + ".tmp"
+                shard = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                                  shape=(len(frame_files),) + first.shape)
+                shard[0] = first
+                for i, f in enumerate(frame_files[1:], start=1):
+                    frame = resize(Image.open(os.path.join(video_path, f)).convert('RGB'))
+                    if frame.size != (first.shape[1], first.shape[0]):
+                        frame = frame.resize((first.shape[1], first.shape[0]))  # Keep one shape per video
+                    shard[i] = np.asarray(frame)
+                shard.flush()
+                del shard
+                os.replace(tmp_path, shard_path)
+                print(f"Converted {video_path} ({len(frame_files)} frames)")
+
+            videos.append({"path": shard_name, "class": target_class, "frames": len(frame_files)})
+
+    index_path = os.path.join(shard_dir, SHARD_INDEX_FILE)
+    with open(index_path + ".tmp", "w") as f:
+        json.dump({"classes": classes, "size": size, "videos": videos}, f)
+    os.replace(index_path + ".tmp", index_path)
+    return index_path
+
+class FrameShardDataset(VideoFrameDataset):
+    def __init__(self, shard_dir, transform=None, sequence_length=16, stride=4, temporal_augment=True):
+        """
+        VideoFrameDataset over the shards written by convert_to_frame_shards
+
+        Windows are sliced straight out of memory-mapped arrays, so no JPEG is decoded
+        while training; frames go through the same transforms as VideoFrameDataset.
+
+        Args:
+            shard_dir: Directory with the shards and their index.json
+            transform: Image transforms to apply
+            sequence_length: Number of frames per sequence
+            stride: Step size when sampling frames (lower = more overlap)
+            temporal_augment: Whether to apply temporal augmentation
+        """
+        self.data_dir = shard_dir
+        self.transform = transform
+        self.sequence_length = sequence_length
+        self.stride = stride
+        self.temporal_augment = temporal_augment
+        with open(os.path.join(shard_dir, SHARD_INDEX_FILE), "r") as f:
+            self.index = json.load(f)
+        self.classes = self.index["classes"]
+        self.class_to_idx = {cls: i for i, cls in enumerate(self.classes)}
+        self.samples = self._make_dataset()
+        self._shards = {}  # Opened lazily, once per DataLoader worker
+
+    def _make_dataset(self):
+        samples = []
+        for video_index, video in enumerate(self.index["videos"]):
+            if video["frames"] >= self.sequence_length:
+                for i in range(0, video["frames"] - self.sequence_length + 1, self.stride):
+                    samples.append((video_index, i, self.class_to_idx[video["class"]]))
+            else:
+                print(f"Warning: Skipping {video['path']} - only {video['frames']} frames available")
+        return samples
+
+    def _shard(self, video_index):
+        shard = self._shards.get(video_index)
+        if shard is None:
+            path = os.path.join(self.data_dir, self.index["videos"][video_index]["path"])
+            shard = self._shards[video_index] = np.load(path, mmap_mode='r')
+        return shard
+
+    def __getstate__(self):
+        # Memory maps are not sent to DataLoader workers; each worker opens its own
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
+
+    def __getitem__(self, idx):
+        video_index, start, class_index = self.samples[idx]
+        window = self._shard(video_index)[[start + i for i in self._frame_indices()]]  # Copies only these frames
+        if self.transform:
+            frames = [self.transform(Image.fromarray(frame)) for frame in window]
+        else:
+            frames = list(torch.from_numpy(window).permute(0, 3, 1, 2).float().div(255))
+        return torch.stack(frames), class_index
+
+FEATURE_STORE_FILE = "features.npy"
+
+class _FrameListDataset(Dataset):
+    # Single frames for extract_feature_store: file paths or (shard path, frame index) pairs
+    def __init__(self, items, transform):
+        self.items = items
+        self.transform = transform
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
+
+    def __getitem__(self, idx):
+        item = self.items[idx]
+        if isinstance(item, str):
+            return self.transform(Image.open(item).convert('RGB'))
+        path, frame_index = item
+        if path not in self._shards:
+            self._shards[path] = np.load(path, mmap_mode='r')
+        return self.transform(Image.fromarray(np.asarray(self._shards[path][frame_index])))
+
+def extract_feature_store(model, source_dir, store_dir, batch_size=64, device="cpu", num_workers=2):
+    """
+    Run the ResNet backbone of a ResNetLSTM once over every frame and store the features
+
+    For fine-tuning with a frozen backbone: FeatureWindowDataset serves windows of the
+    stored features, so the head trains without decoding a frame or running the CNN.
+    Frames get the validation transforms, since augmented frames can't be cached.
+
+    Args:
+        model: ResNetLSTM whose backbone is used
+        source_dir: Frame folder dataset, or a shard directory from convert_to_frame_shards
+        store_dir: Output directory; gets features.npy (float16, one row per frame) and index.json
+        batch_size: Frames per forward pass
+
+    Returns:
+        Path of the index file
+    """
+    videos = []
+    if os.path.exists(os.path.join(source_dir, SHARD_INDEX_FILE)):
+        with open(os.path.join(source_dir, SHARD_INDEX_FILE), "r") as f:
+            shard_index = json.load(f)
+        classes = shard_index["classes"]
+        for video in shard_index["videos"]:
+            shard_path = os.path.join(source_dir, video["path"])
+            videos.append((video["class"], os.path.splitext(video["path"])[0],
+                           [(shard_path, i) for i in range(video["frames"])]))
+    else:
+        classes = list_classes(source_dir)
+        for target_class in classes:
+            target_dir = os.path.join(source_dir, target_class)
+            for video_folder in sorted(os.listdir(target_dir)):
+                video_path = os.path.join(target_dir, video_folder)
+                if os.path.isdir(video_path):
+                    frame_paths = [os.path.join(video_path, f) for _, f in list_frame_numbers(video_path)]
+                    if frame_paths:
+                        videos.append((target_class, os.path.join(target_class, video_folder), frame_paths))
+
+    items = [item for _, _, video_items in videos for item in video_items]
+    loader = torch.utils.data.DataLoader(_FrameListDataset(items, define_transforms()['val']),
+                                         batch_size=batch_size, shuffle=False, num_workers=num_workers,
+                                         pin_memory=torch.cuda.is_available())
+    os.makedirs(store_dir, exist_ok=True)
+    store_path = os.path.join(store_dir, FEATURE_STORE_FILE)
+    tmp_path = store_path + ".tmp"
+    model = model.to(device)
+    model.eval()
+
+    since = time.time()
+    store = None
+    offset = 0
+    with torch.no_grad():
+        for inputs in loader:
+            features = model.resnet(inputs.to(device, non_blocking=True)).flatten(1)
+            if store is None:
+                store = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float16,
+                                                  shape=(len(items), features.size(1)))
+            store[offset:offset + len(features)] = features.cpu().numpy()
+            offset += len(features)
+    if store is None:
+        raise ValueError(f"No frames found in {source_dir}")
+    store.flush()
+    del store
+    os.replace(tmp_path, store_path)
+    print(f"Extracted features of {len(items)} frames in {time.time() - since:.0f}s")
+
+    index = {"classes": classes, "videos": []}
+    offset = 0
+    for target_class, name, video_items in videos:
+        index["videos"].append({"path": name, "class": target_class, "frames": len(video_items), "offset": offset})
+        offset += len(video_items)
+    index_path = os.path.join(store_dir, SHARD_INDEX_FILE)
+    with open(index_path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_path + ".tmp", index_path)
+    return index_path
+
+class FeatureWindowDataset(FrameShardDataset):
+    def __init__(self, store_dir, sequence_length=16, stride=4, temporal_augment=True):
+        """
+        Windows of per-frame backbone features written by extract_feature_store
+
+        Items are (sequence_length, feature_size) float tensors, which ResNetLSTM takes in
+        place of frames, so train_model and test_model work on them unchanged.
+
+        Args:
+            store_dir: Directory with features.npy and its index.json
+            sequence_length: Number of frames per sequence
+            stride: Step size when sampling frames (lower = more overlap)
+            temporal_augment: Whether to apply temporal augmentation
+        """
+        super().__init__(store_dir, transform=None, sequence_length=sequence_length, stride=stride,
+                         temporal_augment=temporal_augment)
+
+    def _shard(self, video_index):
+        store = self._shards.get(FEATURE_STORE_FILE)
+        if store is None:
+            store = self._shards[FEATURE_STORE_FILE] = np.load(os.path.join(self.data_dir, FEATURE_STORE_FILE),
+                                                               mmap_mode='r')
+        video = self.index["videos"][video_index]
+        return store[video["offset"]:video["offset"] + video["frames"]]
+
+    def __getitem__(self, idx):
+        video_index, start, class_index = self.samples[idx]
+        window = self._shard(video_index)[[start + i for i in self._frame_indices()]]
+        return torch.from_numpy(window.astype(np.float32)), class_index
+
+def create_datasets(data_dir, train_perc, val_perc, test_perc, sequence_length=16, stride=4, shard_dir=None,
+                    feature_dir=None):
+    """
+    Split the dataset into train, validation and test sets
+
+    If shard_dir is given, frames are read from pre-decoded shards there (see
+    convert_to_frame_shards), which are created from data_dir on first use.
+    If feature_dir is given, the datasets yield windows of stored backbone features
+    instead of frames (see extract_feature_store), for training the head only.
+    """
     data_transforms = define_transforms()
 
-    full_dataset = VideoFrameDataset(data_dir, transform=data_transforms['train'],
-                                     sequence_length=sequence_length, stride=stride,
-                                     temporal_augment=True)
+    if feature_dir:
+        if not os.path.exists(os.path.join(feature_dir, SHARD_INDEX_FILE)):
+            raise FileNotFoundError(f"No feature store in {feature_dir}; create it with extract_feature_store")
+        full_dataset = FeatureWindowDataset(feature_dir, sequence_length=sequence_length, stride=stride,
+                                            temporal_augment=True)
+    elif shard_dir:
+        if not os.path.exists(os.path.join(shard_dir, SHARD_INDEX_FILE)):
+            convert_to_frame_shards(data_dir, shard_dir)
+        full_dataset = FrameShardDataset(shard_dir, transform=data_transforms['train'],
+                                         sequence_length=sequence_length, stride=stride,
+                                         temporal_augment=True)
+    else:
+        full_dataset = VideoFrameDataset(data_dir, transform=data_transforms['train'],
+                                         sequence_length=sequence_length, stride=stride,
+                                         temporal_augment=True)
 
     # Calculate sizes
     dataset_size = len(full_dataset)
@@ -181,13 +533,30 @@ def create_datasets(data_dir, train_perc, val_perc, test_perc, sequence_length=1
 
     return train_dataset, val_dataset, test_dataset, class_names, num_classes
 
-def create_dataloaders(train_dataset, val_dataset, test_dataset, batch_size, num_workers=2):
+def create_dataloaders(train_dataset, val_dataset, test_dataset, batch_size, num_workers=2, pin_memory=None,
+                       persistent_workers=True, prefetch_factor=4):
+    """
+    DataLoaders for the three splits
+
+    Args:
+        pin_memory: Page-locked batches for faster host-to-GPU copies; defaults to
+            whether CUDA is available
+        persistent_workers: Keep the worker processes (and their open files) alive
+            between epochs instead of restarting them for every pass
+        prefetch_factor: Batches loaded ahead by each worker
+    """
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+    loader_kwargs = {'num_workers': num_workers, 'pin_memory': pin_memory}
+    if num_workers > 0:  # Both options are only valid with worker processes
+        loader_kwargs.update(persistent_workers=persistent_workers, prefetch_factor=prefetch_factor)
+
     train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=batch_size, shuffle=True,
-                                               num_workers=num_workers, drop_last=True)
+                                               drop_last=True, **loader_kwargs)
     val_loader = torch.utils.data.DataLoader(val_dataset, batch_size=batch_size, shuffle=False,
-                                            num_workers=num_workers)
+                                            **loader_kwargs)
     test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size, shuffle=False,
-                                              num_workers=num_workers)
+                                              **loader_kwargs)
 
     dataloaders = {'train': train_loader, 'val': val_loader, 'test': test_loader}
     dataset_sizes = {'train': len(train_dataset), 'val': len(val_dataset), 'test': len(test_dataset)}
@@ -233,13 +602,20 @@ class ResNetLSTM(nn.Module):
         # Batch normalization
         self.bn = nn.BatchNorm1d(256)
 
-    def forward(self, x):
+    def extract_features(self, x):
+        """Per-frame backbone features: (batch, seq, C, H, W) -> (batch, seq, feature_size)"""
         batch_size, seq_length, c, h, w = x.size()
 
         # CNN feature extraction
         x = x.view(batch_size * seq_length, c, h, w)
         x = self.resnet(x)
-        x = x.view(batch_size, seq_length, -1)
+        return x.view(batch_size, seq_length, -1)
+
+    def forward(self, x):
+        # Frames go through the backbone; (batch, seq, feature_size) inputs are stored
+        # backbone features (see FeatureWindowDataset) and go straight to the LSTM
+        if x.dim() == 5:
+            x = self.extract_features(x)
 
         # LSTM for temporal modeling
         lstm_out, (h_n, _) = self.lstm(x)  # lstm_out: (batch_size, seq_len, hidden_size*2)
@@ -261,6 +637,16 @@ class ResNetLSTM(nn.Module):
 
         return x
 
+def freeze_backbone(model):
+    """
+    Freeze the ResNet backbone of a ResNetLSTM for head-only training
+
+    Returns:
+        The parameters that are still trainable, to pass to the optimizer
+    """
+    model.resnet.requires_grad_(False)
+    return [p for p in model.parameters() if p.requires_grad]
+
 class FocalLoss(nn.Module):
     def __init__(self, gamma=2.0, alpha=None):
         super(FocalLoss, self).__init__()
@@ -281,18 +667,69 @@ class FocalLoss(nn.Module):
 
         return loss.mean()
 
+def _channels_last_input(module, args):
+    # Forward pre-hook of the ResNet backbone: (B*T, C, H, W) frames in channels-last layout
+    return (args[0].contiguous(memory_format=torch.channels_last),) + tuple(args[1:])
+
+class DistillationLoss(nn.Module):
+    def __init__(self, temperature=2.0, alpha=0.7):
+        """
+        Knowledge distillation loss for training a student against a teacher's outputs
+
+        Blends the KL divergence to the teacher's temperature-softened probabilities
+        (weight alpha) with cross entropy on the true labels. Without teacher logits,
+        e.g. in the validation phase of train_model, it is plain cross entropy.
+
+        Args:
+            temperature: Softening temperature of both distributions
+            alpha: Weight of the distillation term
+        """
+        super(DistillationLoss, self).__init__()
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def forward(self, input, target, teacher_logits=None):
+        ce_loss = nn.functional.cross_entropy(input, target)
+        if teacher_logits is None:
+            return ce_loss
+        kd_loss = nn.functional.kl_div(
+            nn.functional.log_softmax(input / self.temperature, dim=1),
+            nn.functional.softmax(teacher_logits.float() / self.temperature, dim=1),
+            reduction='batchmean'
+        ) * self.temperature ** 2
+        return self.alpha * kd_loss + (1 - self.alpha) * ce_loss
+
 def train_model(model, model_dir, criterion, optimizer, dataloaders, dataset_sizes, scheduler=None, device="cpu",
-                num_epochs=20, grad_clip_val=1.0, patience=5, plot_path=None):
+                num_epochs=20, grad_clip_val=1.0, patience=5, plot_path=None, amp=False, channels_last=False,
+                accumulation_steps=1):
     """
     Enhanced training function with:
     - Gradient clipping
     - Early stopping
     - Learning rate scheduling
     - Better tracking of metrics
+    - Optional mixed precision, channels-last backbone and gradient accumulation
+    - Per-epoch throughput
+
+    Batches may carry extra tensors after the labels (e.g. teacher logits for
+    DistillationLoss); they are passed to the criterion after the labels.
+
+    Args:
+        amp: Autocast the forward passes, to bfloat16 on CPU or float16 with a GradScaler on CUDA
+        channels_last: Run the ResNet backbone (weights and input frames) in channels-last layout
+        accumulation_steps: Batches whose gradients are accumulated before each optimizer step
     """
     model = model.to(device)
     since = time.time()
 
+    device_type = torch.device(device).type
+    amp_dtype = torch.float16 if device_type == 'cuda' else torch.bfloat16
+    scaler = torch.cuda.amp.GradScaler(enabled=amp and device_type == 'cuda')
+    channels_last_hook = None
+    if channels_last and hasattr(model, 'resnet'):
+        model.resnet.to(memory_format=torch.channels_last)
+        channels_last_hook = model.resnet.register_forward_pre_hook(_channels_last_input)
+
     # Initialize best model weights and accuracy
     best_model_wts = copy.deepcopy(model.state_dict())
     best_acc = 0.0
@@ -322,33 +759,56 @@ def train_model(model, model_dir, criterion, optimizer, dataloaders, dataset_siz
             running_corrects = 0
             all_preds = []
             all_labels = []
+            num_batches = len(dataloaders[phase])
+            phase_start = time.perf_counter()
+            data_wait = 0.0
+            samples_seen = 0
+            frames_seen = 0
 
-            # Iterate over data
-            for inputs, labels in dataloaders[phase]:
-                inputs = inputs.to(device)
-                labels = labels.to(device)
+            # Zero gradients
+            optimizer.zero_grad()
 
-                # Zero gradients
-                optimizer.zero_grad()
+            # Iterate over data
+            wait_start = time.perf_counter()
+            for batch_index, (inputs, labels, *targets) in enumerate(dataloaders[phase]):
+                data_wait += time.perf_counter() - wait_start
+                inputs = inputs.to(device, non_blocking=True)
+                labels = labels.to(device, non_blocking=True)
+                # Extra dataset outputs (e.g. teacher logits) are passed on to the criterion
+                targets = [target.to(device, non_blocking=True) for target in targets]
 
                 # Forward pass
                 with torch.set_grad_enabled(phase == 'train'):
-                    outputs = model(inputs)
+                    with torch.autocast(device_type, dtype=amp_dtype, enabled=amp):
+                        outputs = model(inputs)
+                        loss = criterion(outputs, labels, *targets)
                     _, preds = torch.max(outputs, 1)
-                    loss = criterion(outputs, labels)
 
                     # Backward pass + optimize only in training
                     if phase == 'train':
-                        loss.backward()
-                        # Gradient clipping to prevent exploding gradients
-                        torch.nn.utils.clip_grad_norm_(model.parameters(), grad_clip_val)
-                        optimizer.step()
+                        scaler.scale(loss / accumulation_steps).backward()
+                        if (batch_index + 1) % accumulation_steps == 0 or batch_index + 1 == num_batches:
+                            scaler.unscale_(optimizer)
+                            # Gradient clipping to prevent exploding gradients
+                            torch.nn.utils.clip_grad_norm_(model.parameters(), grad_clip_val)
+                            scaler.step(optimizer)
+                            scaler.update()
+                            optimizer.zero_grad()
 
                 # Statistics
+                samples_seen += inputs.size(0)
+                frames_seen += inputs.size(0) * (inputs.size(1) if inputs.dim() in (3, 5) else 1)
                 running_loss += loss.item() * inputs.size(0)
                 running_corrects += torch.sum(preds == labels.data)
                 all_preds.extend(preds.cpu().numpy())
                 all_labels.extend(labels.cpu().numpy())
+                wait_start = time.perf_counter()
+
+            # Throughput (loss.item() synchronizes, so GPU work is included)
+            phase_time = time.perf_counter() - phase_start
+            print(f'{phase} throughput: {samples_seen / phase_time:.1f} clips/s, '
+                  f'{frames_seen / phase_time:.1f} frames/s ({phase_time:.0f}s, '
+                  f'{100 * data_wait / phase_time:.0f}% waiting for data)')
 
             # Calculate epoch metrics
             epoch_loss = running_loss / dataset_sizes[phase]
@@ -402,6 +862,8 @@ def train_model(model, model_dir, criterion, optimizer, dataloaders, dataset_siz
 
     # Load best model weights
     model.load_state_dict(best_model_wts)
+    if channels_last_hook is not None:
+        channels_last_hook.remove()
 
     # Plot training curves
     if plot_path:
@@ -447,36 +909,85 @@ def train_model(model, model_dir, criterion, optimizer, dataloaders, dataset_siz
 
     return model
 
-def test_model(model, dataloaders, device, class_names, plot_path=None, pr_curve_path=None):
+def _sample_list(dataset):
+    """Identifiers of the samples of a dataset (or nested Subset), in order"""
+    if isinstance(dataset, Subset):
+        samples = _sample_list(dataset.dataset)
+        return [samples[i] for i in dataset.indices]
+    return list(getattr(dataset, "samples", range(len(dataset))))
+
+def _root_dataset(dataset):
+    while isinstance(dataset, Subset):
+        dataset = dataset.dataset
+    return dataset
+
+def logits_cache_key(model, dataset, class_names):
+    """Fingerprint of the model weights, dataset samples and classes a logits cache is valid for"""
+    hasher = hashlib.sha1()
+    for name, tensor in model.state_dict().items():
+        tensor = tensor.detach().cpu()
+        if tensor.is_floating_point():
+            tensor = tensor.float()  # numpy has no bfloat16
+        hasher.update(name.encode("utf-8"))
+        hasher.update(tensor.numpy().tobytes())
+    hasher.update(repr(_sample_list(dataset)).encode("utf-8"))
+    hasher.update(repr(getattr(_root_dataset(dataset), "sequence_length", None)).encode("utf-8"))
+    hasher.update(repr([str(name) for name in class_names]).encode("utf-8"))
+    return hasher.hexdigest()
+
+def collect_logits(model, dataloader, device, class_names, logits_path=None):
     """
-    Enhanced test function with:
-    - Precision-Recall curve
-    - More detailed metrics
-    - Confusion matrix visualization
+    Model outputs (logits) and labels for every sample of a dataloader
+
+    With logits_path, they are saved there as .npz (logits, labels, class_names, cache_key) and
+    loaded from it on later calls instead of running the model again, so thresholds can be
+    tuned on them as often as needed (python -m src.calibration frames LOGITS). The cache is
+    only used while its key (logits_cache_key: model weights, dataset samples and classes)
+    matches, so a retrained model or another split computes the logits again.
+
+    Returns:
+        (logits, labels) numpy arrays of shape (N, num_classes) and (N,)
     """
+    cache_key = logits_cache_key(model, dataloader.dataset, class_names) if logits_path else None
+    if logits_path and os.path.exists(logits_path):
+        cached = np.load(logits_path)
+        if "cache_key" in cached and str(cached["cache_key"]) == cache_key:
+            print(f"Using cached logits from {logits_path}")
+            return cached["logits"], cached["labels"]
+        print(f"Ignoring {logits_path}: it was saved for another model, dataset or classes")
+
     model = model.to(device)
     model.eval()
 
-    all_preds = []
+    all_logits = []
     all_labels = []
-    all_probs = []  # For PR curve
-
     with torch.no_grad():
-        for inputs, labels in dataloaders["test"]:
-            inputs = inputs.to(device)
-            labels = labels.to(device)
-            outputs = model(inputs)
-            probs = torch.nn.functional.softmax(outputs, dim=1)
-            _, preds = torch.max(outputs, 1)
-
-            all_preds.extend(preds.cpu().numpy())
-            all_labels.extend(labels.cpu().numpy())
-            all_probs.extend(probs.cpu().numpy())
-
-    # Convert to numpy arrays
-    all_preds = np.array(all_preds)
-    all_labels = np.array(all_labels)
-    all_probs = np.array(all_probs)
+        for inputs, labels in dataloader:
+            outputs = model(inputs.to(device))
+            all_logits.append(outputs.float().cpu().numpy())
+            all_labels.append(labels.numpy())
+    logits = np.concatenate(all_logits)
+    labels = np.concatenate(all_labels)
+
+    if logits_path:
+        os.makedirs(os.path.dirname(logits_path) or ".", exist_ok=True)
+        with open(logits_path, "wb") as f:  # A file object keeps np.savez from appending .npz
+            np.savez(f, logits=logits, labels=labels, class_names=np.array(class_names),
+                     cache_key=np.array(cache_key))
+        print(f"Logits saved to {logits_path}")
+    return logits, labels
+
+def test_model(model, dataloaders, device, class_names, plot_path=None, pr_curve_path=None, logits_path=None):
+    """
+    Enhanced test function with:
+    - Precision-Recall curve
+    - More detailed metrics
+    - Confusion matrix visualization
+    - Optional logits cache (see collect_logits)
+    """
+    logits, all_labels = collect_logits(model, dataloaders["test"], device, class_names, logits_path)
+    all_probs = torch.softmax(torch.from_numpy(logits), dim=1).numpy()  # For PR curve
+    all_preds = logits.argmax(axis=1)
 
     # Generate confusion matrix
     cm = confusion_matrix(all_labels, all_preds)
@@ -0,0 +1,71 @@
+# src/annotation.py
+"""In-place frame annotation with pre-rendered label patches.
+
+Class labels such as "Violence (0.87)" repeat across frames, so each one is
+rasterized once into an alpha patch and blended straight into the frame
+buffer that goes to the encoder, instead of copying the frame and running
+cv2.putText on the copy every time.
+"""
+
+
+# IMPORTS
+# ________________________________________________________________
+from datetime import timedelta
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+@lru_cache(maxsize=2048)
+def _label_patch(text, scale, thickness, line_type):
+    """Alpha mask (H x W x 1, float32) of a rendered text and the offset of its origin."""
+    (width, height), baseline = cv2.getTextSize(text, FONT, scale, thickness)
+    pad = thickness + 1
+    mask = np.zeros((height + baseline + 2 * pad, width + 2 * pad), np.uint8)
+    cv2.putText(mask, text, (pad, height + pad), FONT, scale, 255, thickness, line_type)
+    alpha = (mask.astype(np.float32) / 255.0)[..., None]
+    alpha.setflags(write=False)
+    return alpha, pad, height + pad
+
+
+def draw_label(frame, text, org, scale, color, thickness=2, line_type=cv2.LINE_AA):
+    """
+    Draw `text` into `frame` in place, like cv2.putText with the same arguments.
+
+    The rendered text is cached per (text, scale, thickness, line_type), so a
+    repeated label costs one small blend over its bounding box.
+    """
+    alpha, offset_x, offset_y = _label_patch(text, scale, thickness, line_type)
+    x0, y0 = org[0] - offset_x, org[1] - offset_y
+    height, width = frame.shape[:2]
+    left, top = max(x0, 0), max(y0, 0)
+    right, bottom = min(x0 + alpha.shape[1], width), min(y0 + alpha.shape[0], height)
+    if left >= right or top >= bottom:
+        return frame
+    alpha = alpha[top - y0:bottom - y0, left - x0:right - x0]
+    roi = frame[top:bottom, left:right]
+    blended = roi * (1.0 - alpha) + np.asarray(color, np.float32) * alpha + 0.5
+    np.copyto(roi, blended, casting="unsafe")
+    return frame
+
+
+def format_timestamp(frame_number, fps):
+    """h:mm:ss position of a frame."""
+    return str(timedelta(seconds=frame_number / fps if fps else 0)).split('.')[0]
+
+
+def annotate_clip_frame(frame, label, color, frame_number, fps):
+    """Label, time and frame number sized for the small frames of a sequence clip (in place)."""
+    height = frame.shape[0]
+    draw_label(frame, label, (10, 24), 0.6, color, 2)
+    cv2.putText(frame, f"Time: {format_timestamp(frame_number, fps)}", (10, 46),
+                FONT, 0.45, (255, 255, 255), 1, cv2.LINE_AA)
+    cv2.putText(frame, f"Frame: {frame_number}", (10, height - 12),
+                FONT, 0.45, (255, 255, 255), 1, cv2.LINE_AA)
+    return frame
+
+# END
+# ________________________________________________________________
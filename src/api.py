@@ -0,0 +1,242 @@
+# src/api.py
+"""HTTP inference API for BuddyGuard.
+
+Usage:
+    python -m src.api [--host 127.0.0.1] [--port 8000] [--max-jobs 4]
+
+Endpoints:
+    POST /analyze          JSON {"video_path": ..., "mode": "violence"|"nudity", "render_video": false}
+                           or a raw video body with ?mode=... (Content-Type: video/*)
+    GET  /status/<job_id>  Job state and progress
+    GET  /result/<job_id>  Results of a finished job
+    GET  /health           Liveness check and batching statistics
+    GET  /metrics          Prometheus metrics (src/metrics.py)
+
+Jobs run in a thread pool inside this process so that frame batches and BERT
+inputs from concurrent requests can be merged into shared forward passes.
+"""
+
+
+# IMPORTS
+# ________________________________________________________________
+import argparse
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from src.batching import batched_bert, batched_classifier
+from src.metrics import CONTENT_TYPE, REGISTRY
+from src.pipeline import NUDITY_MODE, VIOLENCE_MODE, run_analysis
+from src.uploads import MAX_UPLOAD_BYTES, stream_upload_to_disk
+from src.utils import NumpyTypeEncoder
+
+MODE_CHOICES = {"violence": VIOLENCE_MODE, "nudity": NUDITY_MODE}
+API_OUTPUT_ROOT = os.path.join("output", "api")
+
+
+class AnalysisService:
+    """Runs analysis jobs against one set of models with cross-request batching."""
+
+    def __init__(self, models, max_jobs=4, max_batch_size=32, max_wait_ms=5, output_root=API_OUTPUT_ROOT):
+        # Whisper is not batched; serialize calls to the shared pipeline instead
+        self.models = dict(models, whisper_model=_serialized(models['whisper_model']))
+        self.output_root = output_root
+        device = models['device']
+        self.infer_fns = {
+            'violence': batched_classifier(models['violence_model'], device, max_batch_size, max_wait_ms),
+            'nudity': batched_classifier(models['nudity_model'], device, max_batch_size, max_wait_ms),
+            'bert': batched_bert(models['bert_model'], device, models['tokenizer'].pad_token_id,
+                                 max_batch_size=16, max_wait_ms=max_wait_ms),
+        }
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="api-job")
+
+    def submit(self, video_path, mode=VIOLENCE_MODE, render_video=False, output_dir=None):
+        job_id = uuid.uuid4().hex
+        output_dir = output_dir or os.path.join(self.output_root, job_id)
+        os.makedirs(output_dir, exist_ok=True)
+        job = {
+            "id": job_id, "video_path": video_path, "output_dir": output_dir, "mode": mode,
+            "status": "queued", "progress": 0.0, "message": None, "error": None,
+            "results": None, "created_at": time.time(),
+        }
+        with self._lock:
+            self.jobs[job_id] = job
+        self._executor.submit(self._run, job, render_video)
+        return job_id
+
+    def _run(self, job, render_video):
+        def on_progress(done, total):
+            job["progress"] = done / total if total else 0.0
+
+        def on_status(message):
+            job["message"] = message
+
+        job["status"] = "running"
+        try:
+            results, processed_video_path = run_analysis(
+                job["video_path"], job["output_dir"], self.models, job["mode"],
+                progress_callback=on_progress, status_callback=on_status,
+                render_video=render_video, save_gifs=render_video, save_history=False,
+                infer_fns=self.infer_fns,
+            )
+            results["processed_video_path"] = processed_video_path
+            job["results"] = results
+            job["status"] = "done"
+            job["progress"] = 1.0
+        except Exception as e:
+            traceback.print_exc()
+            job["error"] = str(e)
+            job["status"] = "failed"
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def stats(self):
+        return {
+            name: {"recent_batch_sizes": fn.batcher.batch_sizes[-10:]}
+            for name, fn in self.infer_fns.items()
+        }
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    service = None  # Set by create_server
+
+    def do_GET(self):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if parts == ["health"]:
+            return self._send_json(200, {"status": "ok", "batching": self.service.stats()})
+        if parts == ["metrics"]:
+            body = REGISTRY.expose().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if len(parts) == 2 and parts[0] in ("status", "result"):
+            job = self.service.get(parts[1])
+            if job is None:
+                return self._send_json(404, {"error": "Unknown job"})
+            if parts[0] == "status":
+                return self._send_json(200, {k: job[k] for k in ("id", "status", "progress", "message", "error")})
+            if job["status"] != "done":
+                return self._send_json(409, {"error": f"Job is {job['status']}", "status": job["status"]})
+            return self._send_json(200, {"id": job["id"], "results": job["results"]})
+        return self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/analyze":
+            return self._send_json(404, {"error": "Not found"})
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        content_type = self.headers.get("Content-Type", "")
+        try:
+            if content_type.startswith("application/json"):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                video_path = body.get("video_path")
+                if not video_path or not os.path.isfile(video_path):
+                    return self._send_json(400, {"error": "video_path must point to an existing file"})
+                job_id = self.service.submit(
+                    video_path, _parse_mode(body.get("mode", "violence")), bool(body.get("render_video", False))
+                )
+            else:
+                job_id = self._submit_upload(query)
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        return self._send_json(202, {"job_id": job_id})
+
+    def _submit_upload(self, query):
+        length = int(self.headers.get("Content-Length", 0))
+        if length <= 0:
+            raise ValueError("Empty request body")
+        if length > MAX_UPLOAD_BYTES:
+            raise ValueError(f"Video file is too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)}MB.")
+        mode = _parse_mode(query.get("mode", "violence"))
+        upload_dir = os.path.join(self.service.output_root, uuid.uuid4().hex)
+        os.makedirs(upload_dir, exist_ok=True)
+        video_path = os.path.join(upload_dir, "video.mp4")
+        stream_upload_to_disk(_LimitedReader(self.rfile, length), video_path)
+        render_video = query.get("render_video", "false").lower() in ("1", "true", "yes")
+        return self.service.submit(video_path, mode, render_video, output_dir=upload_dir)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, cls=NumpyTypeEncoder).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _LimitedReader:
+    """Reads at most `length` bytes from a socket file so a request body ends cleanly."""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.stream.read(size)
+        self.remaining -= len(data)
+        return data
+
+
+def _serialized(fn):
+    lock = threading.Lock()
+
+    def call(*args, **kwargs):
+        with lock:
+            return fn(*args, **kwargs)
+    return call
+
+
+def _parse_mode(mode):
+    if mode not in MODE_CHOICES:
+        raise ValueError(f"mode must be one of {sorted(MODE_CHOICES)}")
+    return MODE_CHOICES[mode]
+
+
+def create_server(models, host="127.0.0.1", port=8000, **service_kwargs):
+    """Build (but do not start) the HTTP server around a set of loaded models."""
+    handler = type("BoundApiHandler", (ApiHandler,), {"service": AnalysisService(models, **service_kwargs)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the BuddyGuard analysis pipeline over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-jobs", type=int, default=4, help="Videos analysed concurrently")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5, help="How long a batch waits to fill up")
+    args = parser.parse_args(argv)
+
+    from src.models_load import load_models
+    server = create_server(load_models(), args.host, args.port, max_jobs=args.max_jobs,
+                           max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    print(f"Serving BuddyGuard API on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
+
+# END
+# ________________________________________________________________
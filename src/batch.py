@@ -0,0 +1,202 @@
+# src/batch.py
+"""Headless batch analysis of video files.
+
+Usage:
+    python -m src.batch INPUT [INPUT ...] --output results.jsonl [--workers 2] [--mode nudity]
+
+INPUT can be a directory (searched recursively), a glob pattern or a file.
+Each analysed video is appended to the JSONL output as soon as it finishes,
+so an interrupted run picks up where it stopped when started again.
+"""
+
+
+# IMPORTS
+# ________________________________________________________________
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+from slugify import slugify
+
+from src.processes import spawn_context
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".webm", ".mpg", ".mkv")
+MODE_CHOICES = {
+    "violence": "Violence + Audio Detection",
+    "nudity": "Nudity + Audio Detection",
+}
+
+# Per-process state for the pool workers
+_worker_models = None
+_worker_options = None
+
+
+def collect_videos(inputs):
+    """Expand directories, glob patterns and file paths into a sorted list of video files."""
+    videos = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                for file in files:
+                    if file.lower().endswith(VIDEO_EXTENSIONS):
+                        videos.add(os.path.abspath(os.path.join(root, file)))
+        else:
+            for path in glob.glob(item, recursive=True):
+                if os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS):
+                    videos.add(os.path.abspath(path))
+    return sorted(videos)
+
+
+def load_completed(output_path):
+    """Return the video paths already recorded as successfully analysed in a JSONL file."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partially written line from an interrupted run
+            if record.get("status") == "ok":
+                completed.add(record["video_path"])
+    return completed
+
+
+def work_dir_for(video_path, work_root):
+    """Unique output directory per input file, stable across runs."""
+    digest = hashlib.sha1(video_path.encode("utf-8")).hexdigest()[:8]
+    name = slugify(os.path.splitext(os.path.basename(video_path))[0], lowercase=False, max_length=50)
+    return os.path.join(work_root, f"{name}-{digest}")
+
+
+def _init_worker(options):
+    global _worker_models, _worker_options
+    from src.models_load import load_models
+    _worker_options = options
+    _worker_models = load_models()
+
+
+def _analyze_one(video_path):
+    from src.pipeline import run_analysis
+    from src.retention import OUTPUT_ROOT
+
+    options = _worker_options
+    # Videos added to the history live in output/<name> like uploads, where the History
+    # page and retention look for their files; the others use the batch work directory
+    output_dir = work_dir_for(video_path, OUTPUT_ROOT if options["save_history"] else options["work_dir"])
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.time()
+    record = {"video_path": video_path, "video_name": os.path.basename(output_dir)}
+    try:
+        results, processed_video_path = run_analysis(
+            video_path, output_dir, _worker_models, options["mode"],
+            render_video=options["render_video"],
+            save_gifs=options["save_gifs"],
+            save_history=options["save_history"],
+            profile=options["profile"],
+        )
+        record.update({
+            "status": "ok",
+            "frames": results["frame_count"],
+            "processed_video_path": processed_video_path,
+            "results": results,
+        })
+    except Exception as e:
+        record.update({"status": "error", "error": str(e)})
+    finally:
+        if not (options["render_video"] or options["save_gifs"] or options["profile"] or options["save_history"]):
+            # Nothing worth keeping on disk for this video
+            shutil.rmtree(output_dir, ignore_errors=True)
+    record["elapsed"] = time.time() - start
+    return record
+
+
+def run_batch(videos, output_path, mode, workers=1, work_dir=os.path.join("output", "batch"),
+              render_video=False, save_gifs=False, save_history=False, profile=False, log=print):
+    """Analyse videos with a pool of worker processes and append one JSON line per video.
+
+    Returns a summary dict with counts and throughput.
+    """
+    from src.utils import NumpyTypeEncoder
+
+    options = {
+        "mode": mode,
+        "work_dir": work_dir,
+        "render_video": render_video,
+        "save_gifs": save_gifs,
+        "save_history": save_history,
+        "profile": profile,
+    }
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    start = time.time()
+    summary = {"ok": 0, "error": 0, "frames": 0}
+    context = spawn_context()
+    with context.Pool(processes=workers, initializer=_init_worker, initargs=(options,)) as pool, \
+            open(output_path, "a") as out:
+        for index, record in enumerate(pool.imap_unordered(_analyze_one, videos), start=1):
+            out.write(json.dumps(record, cls=NumpyTypeEncoder) + "\n")
+            out.flush()
+            summary[record["status"]] += 1
+            summary["frames"] += record.get("frames", 0)
+            log(f"[{index}/{len(videos)}] {record['status']:5s} {record['elapsed']:7.1f}s  {record['video_path']}")
+
+    elapsed = time.time() - start
+    summary["elapsed"] = elapsed
+    summary["videos_per_min"] = (summary["ok"] + summary["error"]) / elapsed * 60 if elapsed else 0.0
+    summary["frames_per_sec"] = summary["frames"] / elapsed if elapsed else 0.0
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse a batch of videos without the Streamlit UI.")
+    parser.add_argument("inputs", nargs="+", help="Video files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file results are appended to")
+    parser.add_argument("-m", "--mode", choices=sorted(MODE_CHOICES), default="violence")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--work-dir", default=os.path.join("output", "batch"),
+                        help="Directory for intermediate and rendered files (with --save-history, "
+                             "files are kept in output/ next to the uploads instead)")
+    parser.add_argument("--render-video", action="store_true", help="Also produce the annotated video")
+    parser.add_argument("--save-gifs", action="store_true", help="Also save GIFs of detected sequences")
+    parser.add_argument("--save-history", action="store_true", help="Also add results to the History page")
+    parser.add_argument("--profile", action="store_true",
+                        help="Save a torch profiler trace of the model forward passes in each work directory")
+    parser.add_argument("--no-resume", action="store_true", help="Re-analyse videos already in the output file")
+    args = parser.parse_args(argv)
+
+    videos = collect_videos(args.inputs)
+    if not args.no_resume:
+        completed = load_completed(args.output)
+        skipped = [video for video in videos if video in completed]
+        videos = [video for video in videos if video not in completed]
+        if skipped:
+            print(f"Resuming: skipping {len(skipped)} videos already in {args.output}")
+    if not videos:
+        print("No videos to analyse.")
+        return 0
+
+    print(f"Analysing {len(videos)} videos with {args.workers} workers ({args.mode} mode)")
+    summary = run_batch(
+        videos, args.output, MODE_CHOICES[args.mode], workers=args.workers, work_dir=args.work_dir,
+        render_video=args.render_video, save_gifs=args.save_gifs, save_history=args.save_history,
+        profile=args.profile,
+    )
+    print(f"Done: {summary['ok']} ok, {summary['error']} failed in {summary['elapsed']:.1f}s "
+          f"({summary['videos_per_min']:.2f} videos/min, {summary['frames_per_sec']:.1f} frames/s)")
+    return 0 if summary["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# END
+# ________________________________________________________________
@@ -0,0 +1,126 @@
+# src/batching.py
+
+
+# IMPORTS
+# ________________________________________________________________
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+
+class DynamicBatcher:
+    """Merges items submitted from many threads into batched calls.
+
+    A background thread waits for the first item, then keeps collecting until
+    `max_batch_size` items are queued or `max_wait_ms` has passed, and hands
+    the whole list to `process_fn`, which must return one result per item.
+    """
+
+    def __init__(self, process_fn, max_batch_size=32, max_wait_ms=5, name="batcher"):
+        self.process_fn = process_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batch_sizes = []  # Recent batch sizes, for monitoring
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit_async(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def submit(self, item):
+        """Submit one item and block until its result is ready."""
+        return self.submit_async(item).result()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            items = [item for item, _ in pending]
+            try:
+                results = self.process_fn(items)
+                for (_, future), result in zip(pending, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+            self.batch_sizes = (self.batch_sizes + [len(items)])[-100:]
+
+
+def batched_classifier(model, device, max_batch_size=32, max_wait_ms=5):
+    """
+    Wrap a vision model so concurrent callers share forward passes.
+
+    Returns an infer_fn(input_tensor) -> logits usable as the `infer_fn`
+    argument of the frame extractors. Inputs from different callers are
+    concatenated along the batch dimension, so they must have the same
+    per-sample shape (e.g. 3x224x224 frames or 16x3x224x224 windows).
+    """
+    def process(inputs):
+        sizes = [tensor.shape[0] for tensor in inputs]
+        batch = torch.cat([tensor.to(device) for tensor in inputs], dim=0)
+        with torch.no_grad():
+            outputs = model(batch)
+        return list(torch.split(outputs, sizes, dim=0))
+
+    batcher = DynamicBatcher(process, max_batch_size, max_wait_ms, name=f"batcher-{type(model).__name__}")
+    def infer_fn(input_tensor):
+        return batcher.submit(input_tensor)
+
+    infer_fn.batcher = batcher
+    return infer_fn
+
+
+def batched_bert(bert_model, device, pad_token_id=0, max_batch_size=16, max_wait_ms=5):
+    """
+    Wrap the BERT classifier so concurrent texts share forward passes.
+
+    Returns a forward_fn(input_ids, attention_mask) -> (logits, attentions)
+    usable as the `forward_fn` argument of classify_text. Inputs are right
+    padded to the longest sequence in the batch and the outputs are sliced
+    back to each caller's own length, so padding does not change the result.
+    """
+    def process(items):
+        lengths = [input_ids.shape[1] for input_ids, _ in items]
+        max_length = max(lengths)
+        input_ids = torch.full((len(items), max_length), pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(items), max_length), dtype=torch.long)
+        for row, (ids, mask) in enumerate(items):
+            input_ids[row, :ids.shape[1]] = ids[0]
+            attention_mask[row, :mask.shape[1]] = mask[0]
+
+        with torch.no_grad():
+            logits, attentions = bert_model(
+                input_ids=input_ids.to(device), attention_mask=attention_mask.to(device)
+            )
+
+        results = []
+        for row, length in enumerate(lengths):
+            sample_attentions = tuple(layer[row:row + 1, :, :length, :length] for layer in attentions)
+            results.append((logits[row:row + 1], sample_attentions))
+        return results
+
+    batcher = DynamicBatcher(process, max_batch_size, max_wait_ms, name="batcher-bert")
+
+    def forward_fn(input_ids, attention_mask):
+        return batcher.submit((input_ids.cpu(), attention_mask.cpu()))
+
+    forward_fn.batcher = batcher
+    return forward_fn
+
+# END
+# ________________________________________________________________
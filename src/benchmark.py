@@ -0,0 +1,459 @@
+# src/benchmark.py
+"""End-to-end benchmark of the analysis stages on synthetic videos.
+
+Usage:
+    python -m src.benchmark [--resolutions 360p 720p] [--fps 30] [--durations 10]
+                            [--orientations landscape portrait] [--audio both]
+                            [--models stub|real] [--output benchmark.json]
+                            [--baseline saves/benchmark_baseline.json] [--save-baseline]
+
+Every case (one synthetic video) runs in a fresh worker process, so peak RSS
+is measured per case. Each stage reports wall time, CPU time (including
+ffmpeg child processes), the number of items it handled (frames, seconds of
+audio, pages) with a rate, and the peak RSS of the worker after the stage.
+
+Stub models are tiny stand-ins with the same interfaces as the real ones,
+so timings show the cost of the pipeline around the models; use
+--models real to include inference. A run is compared with a stored
+baseline report when one exists, and the exit code is 1 if any stage got
+slower (or bigger) than the tolerance allows. Baselines are per machine:
+save one with --save-baseline before comparing.
+"""
+
+
+# IMPORTS
+# ________________________________________________________________
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import time
+import wave
+
+from src.instrumentation import peak_rss_mb
+from src.processes import spawn_context
+
+STAGES = (
+    "extract_audio",
+    "transcribe_audio",
+    "classify_text",
+    "extract_nudity_sequences",
+    "extract_frame_sequences",
+    "combine_frames_to_video",
+    "save_to_pdf",
+)
+AUDIO_STAGES = ("extract_audio", "transcribe_audio", "classify_text")
+BENCHMARK_ROOT = os.path.join("output", "benchmark")
+DEFAULT_BASELINE = os.path.join("saves", "benchmark_baseline.json")
+SEQUENCE_LENGTH = 16  # Same as src/pipeline.py
+
+
+# Stub models
+# ________________________________________________________________
+def load_stub_models():
+    """Stand-ins for load_models() that cost next to nothing and need no downloads."""
+    import torch
+    import torch.nn as nn
+
+    class StubVisualModel(nn.Module):
+        """Scores how red the (normalized RGB) frames are, so the red section of a synthetic video is detected."""
+
+        def __init__(self, harmful_index):
+            super().__init__()
+            self.scale = nn.Parameter(torch.tensor(3.0))
+            self.harmful_index = harmful_index
+
+        def forward(self, x):
+            # (batch, C, H, W) or (batch, frames, C, H, W)
+            red = x[..., 0, :, :].flatten(1).mean(1)
+            blue = x[..., 2, :, :].flatten(1).mean(1)
+            score = self.scale * (red - blue)
+            return torch.stack([-score, score] if self.harmful_index == 1 else [score, -score], dim=1)
+
+    class StubBert(nn.Module):
+        def __init__(self, vocab_size=30522, hidden=32):
+            super().__init__()
+            self.vocab_size = vocab_size
+            self.embedding = nn.Embedding(vocab_size, hidden)
+            self.classifier = nn.Linear(hidden, 2)
+
+        def forward(self, input_ids, attention_mask):
+            hidden = self.embedding(input_ids % self.vocab_size)
+            attention = torch.softmax(hidden @ hidden.transpose(1, 2) / hidden.shape[-1] ** 0.5, dim=-1)
+            return self.classifier(hidden.mean(1)), (attention.unsqueeze(1),)
+
+    class Encoding(dict):
+        def to(self, device):
+            return Encoding({key: value.to(device) for key, value in self.items()})
+
+    class StubTokenizer:
+        """Whitespace tokenizer with a growing vocabulary, in place of BertTokenizer."""
+
+        pad_token_id = 0
+
+        def __init__(self, max_length=512):
+            self.max_length = max_length
+            self.tokens = ["[PAD]", "[CLS]", "[SEP]"]
+            self.vocab = {token: index for index, token in enumerate(self.tokens)}
+
+        def _id(self, word):
+            if word not in self.vocab:
+                self.vocab[word] = len(self.tokens)
+                self.tokens.append(word)
+            return self.vocab[word]
+
+        def __call__(self, text, truncation=True, padding=True, return_tensors="pt"):
+            words = text.lower().split()[:self.max_length - 2]
+            input_ids = torch.tensor([[1] + [self._id(word) for word in words] + [2]])
+            return Encoding(input_ids=input_ids, attention_mask=torch.ones_like(input_ids))
+
+        def convert_ids_to_tokens(self, ids):
+            return [self.tokens[index] for index in ids.tolist()]
+
+    def stub_whisper(audio_path, return_timestamps=True):
+        """One fixed sentence per 5 seconds of audio, in the ASR pipeline's output format."""
+        with wave.open(audio_path, "rb") as f:
+            duration = f.getnframes() / f.getframerate()
+        text = " this is a synthetic sentence for the benchmark"
+        chunks = [{"timestamp": (start, min(start + 5.0, duration)), "text": text}
+                  for start in range(0, int(duration), 5)]
+        return {"text": "".join(chunk["text"] for chunk in chunks), "chunks": chunks}
+
+    torch.manual_seed(0)
+    return {
+        'tokenizer': StubTokenizer(),
+        'bert_model': StubBert().eval(),
+        'whisper_model': stub_whisper,
+        'violence_model': StubVisualModel(harmful_index=1).eval(),
+        'nudity_model': StubVisualModel(harmful_index=0).eval(),
+        'violence_class_names': ['Safe', 'Violence'],
+        'nudity_class_names': ['nude', 'safe'],
+        'device': "cpu"
+    }
+
+
+# Measurements
+# ________________________________________________________________
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def measure(fn):
+    """Run fn() and return (its result, wall seconds, CPU seconds including child processes)."""
+    wall, cpu = time.perf_counter(), _cpu_seconds()
+    value = fn()
+    return value, time.perf_counter() - wall, _cpu_seconds() - cpu
+
+
+# Cases
+# ________________________________________________________________
+def case_id(case):
+    return (f"{case['resolution']}-{case['orientation']}-{case['fps']:g}fps-{case['duration']:g}s-"
+            f"{'audio' if case['audio'] else 'silent'}")
+
+
+def build_cases(resolutions, fps_values, durations, orientations, audio_values):
+    return [
+        {"resolution": resolution, "fps": fps, "duration": duration, "orientation": orientation, "audio": audio}
+        for resolution, fps, duration, orientation, audio
+        in itertools.product(resolutions, fps_values, durations, orientations, audio_values)
+    ]
+
+
+def _run_stages(case, models, video_path, work_dir, stages):
+    """Run the stages once on a clean work directory; returns {stage: measurement}."""
+    from src.proc_audio import extract_audio, transcribe_audio
+    from src.proc_nudity import extract_nudity_sequences
+    from src.proc_text import classify_text
+    from src.proc_video import combine_frames_to_video
+    from src.proc_video_sequence import extract_frame_sequences
+    from src.utils import REPORTS_DIR, save_to_pdf, weighted_fusion
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    audio_path = os.path.join(work_dir, "output_audio.wav")
+    frames_dir = os.path.join(work_dir, "processed_frames")
+    report_name = f"benchmark-{case_id(case)}"
+    state = {"transcription": [], "text": (None, 0.0, 1.0, ""), "frame_count": 0, "violence": {}}
+
+    def run_extract_audio():
+        extract_audio(video_path, audio_path)
+        return case["duration"], "audio_s"
+
+    def run_transcribe_audio():
+        state["transcription"] = transcribe_audio(audio_path, models['whisper_model'])
+        return case["duration"], "audio_s"
+
+    def run_classify_text():
+        state["text"] = classify_text(state["transcription"], models['bert_model'], models['tokenizer'],
+                                      models['device'])
+        return 1, "transcripts"
+
+    def run_extract_nudity_sequences():
+        frame_count, _, _, _ = extract_nudity_sequences(
+            video_path, os.path.join(work_dir, "nudity_frames"), models['nudity_model'],
+            models['nudity_class_names'], sequence_length=SEQUENCE_LENGTH,
+        )
+        return frame_count, "frames"
+
+    def run_extract_frame_sequences():
+        frame_count, _, scores, _ = extract_frame_sequences(
+            video_path, frames_dir, models['violence_model'], models['violence_class_names'],
+            sequence_length=SEQUENCE_LENGTH,
+        )
+        state["frame_count"], state["violence"] = frame_count, scores
+        return frame_count, "frames"
+
+    def run_combine_frames_to_video():
+        combine_frames_to_video(frames_dir, os.path.join(work_dir, "processed.mp4"), state["frame_count"],
+                                audio_path, frame_rate=case["fps"])
+        return state["frame_count"], "frames"
+
+    def run_save_to_pdf():
+        _, harmful_text, safe_text, highlighted_text = state["text"]
+        harmful_visual = state["violence"].get('Violence', 0.0)
+        safe_visual = state["violence"].get('Safe', 0.0)
+        final_prediction, final_confidence = weighted_fusion(
+            {'safe': safe_text, 'harmful': harmful_text}, {'safe': safe_visual, 'harmful': harmful_visual}
+        )
+        results = {
+            "mode": "Violence + Audio Detection",
+            "harmful_conf_text": harmful_text,
+            "safe_conf_text": safe_text,
+            "harmful_score_resnet": harmful_visual,
+            "safe_score_resnet": safe_visual,
+            "final_prediction": final_prediction,
+            "final_confidence": final_confidence,
+            "transcription": state["transcription"],
+            "highlighted_text": highlighted_text,
+            "frame_count": state["frame_count"],
+        }
+        shutil.rmtree(os.path.join(REPORTS_DIR, report_name), ignore_errors=True)  # Never hit the report cache
+        save_to_pdf(report_name, os.path.join(work_dir, "report.pdf"), results)
+        return 1, "pages"
+
+    runners = {
+        "extract_audio": run_extract_audio,
+        "transcribe_audio": run_transcribe_audio,
+        "classify_text": run_classify_text,
+        "extract_nudity_sequences": run_extract_nudity_sequences,
+        "extract_frame_sequences": run_extract_frame_sequences,
+        "combine_frames_to_video": run_combine_frames_to_video,
+        "save_to_pdf": run_save_to_pdf,
+    }
+    # Later stages need the output of earlier ones, so every stage up to the last selected one runs
+    last = max(STAGES.index(stage) for stage in stages)
+    measurements = {}
+    try:
+        for stage in STAGES[:last + 1]:
+            if stage in AUDIO_STAGES and not case["audio"]:
+                measurements[stage] = {"skipped": "no audio track"}
+                continue
+            (items, unit), seconds, cpu_seconds = measure(runners[stage])
+            measurements[stage] = {
+                "seconds": seconds,
+                "cpu_seconds": cpu_seconds,
+                "items": items,
+                "unit": unit,
+                "items_per_sec": items / seconds if seconds else 0.0,
+                "peak_rss_mb": peak_rss_mb() or 0.0,
+            }
+    finally:
+        shutil.rmtree(os.path.join(REPORTS_DIR, report_name), ignore_errors=True)
+    return {stage: measurements[stage] for stage in stages if stage in measurements}
+
+
+def run_case(case, video_path, options):
+    """Worker process entry: load the models and run the stages `repeat` times; keeps the median."""
+    if options["models"] == "real":
+        from src.models_load import load_models
+        models, load_seconds, _ = measure(load_models)
+    else:
+        models, load_seconds, _ = measure(load_stub_models)
+    work_dir = os.path.join(options["work_dir"], "runs", case_id(case))
+    try:
+        runs = [_run_stages(case, models, video_path, work_dir, options["stages"]) for _ in range(options["repeat"])]
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {str(e)}", "model_load_seconds": load_seconds}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    stages = {}
+    for stage, first in runs[0].items():
+        if "skipped" in first:
+            stages[stage] = first
+            continue
+        seconds = statistics.median(run[stage]["seconds"] for run in runs)
+        stages[stage] = dict(
+            first,
+            seconds=seconds,
+            cpu_seconds=statistics.median(run[stage]["cpu_seconds"] for run in runs),
+            items_per_sec=first["items"] / seconds if seconds else 0.0,
+            peak_rss_mb=max(run[stage]["peak_rss_mb"] for run in runs),
+        )
+    return {
+        "model_load_seconds": load_seconds,
+        "peak_rss_mb": peak_rss_mb() or 0.0,
+        "peak_child_rss_mb": peak_rss_mb(children=True) or 0.0,
+        "stages": stages,
+    }
+
+
+def machine_info(models):
+    import torch
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "cpu_count": os.cpu_count(),
+        "cuda": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+        "models": models,
+    }
+
+
+def run_benchmark(cases, models="stub", stages=STAGES, repeat=1, work_dir=BENCHMARK_ROOT, log=print):
+    """Generate (or reuse) the synthetic videos and benchmark every case. Returns the report dict."""
+    from src.synthetic_video import make_synthetic_video
+
+    options = {"models": models, "stages": list(stages), "repeat": max(1, repeat), "work_dir": work_dir}
+    report = {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": machine_info(models),
+        "cases": {},
+    }
+    # One process per case (maxtasksperchild=1) keeps peak RSS per case
+    context = spawn_context()
+    with context.Pool(processes=1, maxtasksperchild=1) as pool:
+        for index, case in enumerate(cases, start=1):
+            name = case_id(case)
+            video_path = os.path.join(work_dir, "videos", f"{name}.mp4")
+            if not os.path.exists(video_path):
+                make_synthetic_video(video_path, case["resolution"], case["fps"], case["duration"],
+                                     case["orientation"], case["audio"])
+            result = pool.apply(run_case, (case, video_path, options))
+            report["cases"][name] = dict(case=case, **result)
+            log(f"[{index}/{len(cases)}] {name}: {result.get('error', 'done')}")
+    return report
+
+
+# Baseline comparison
+# ________________________________________________________________
+def compare_reports(report, baseline, tolerance=0.2):
+    """
+    Compare stage timings and memory with a baseline report.
+
+    A stage is a regression when its wall time or peak RSS is more than
+    `tolerance` (a fraction) above the baseline, and an improvement when its
+    wall time is more than `tolerance` below it.
+
+    Returns:
+        List of dicts with case, stage, metric, baseline, current, ratio and status
+    """
+    rows = []
+    for name, result in report["cases"].items():
+        baseline_stages = baseline.get("cases", {}).get(name, {}).get("stages", {})
+        for stage, current in result.get("stages", {}).items():
+            previous = baseline_stages.get(stage)
+            if not previous or "skipped" in current or "skipped" in previous:
+                continue
+            for metric in ("seconds", "peak_rss_mb"):
+                ratio = current[metric] / previous[metric] if previous[metric] else 1.0
+                if ratio > 1 + tolerance:
+                    status = "regression"
+                elif metric == "seconds" and ratio < 1 - tolerance:
+                    status = "improvement"
+                else:
+                    status = "ok"
+                rows.append({"case": name, "stage": stage, "metric": metric, "baseline": previous[metric],
+                             "current": current[metric], "ratio": ratio, "status": status})
+    return rows
+
+
+def format_report(report):
+    lines = [f"{'case':36s} {'stage':26s} {'seconds':>8s} {'rate':>14s} {'RSS MB':>8s}"]
+    for name, result in report["cases"].items():
+        if "error" in result:
+            lines.append(f"{name:36s} error: {result['error']}")
+            continue
+        for stage, m in result["stages"].items():
+            if "skipped" in m:
+                lines.append(f"{name:36s} {stage:26s} skipped ({m['skipped']})")
+                continue
+            rate = f"{m['items_per_sec']:.1f} {m['unit']}/s"
+            lines.append(f"{name:36s} {stage:26s} {m['seconds']:8.3f} {rate:>14s} {m['peak_rss_mb']:8.0f}")
+    return "\n".join(lines)
+
+
+def load_report(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_report(report, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analysis stages on synthetic videos.")
+    parser.add_argument("--resolutions", nargs="+", default=["360p", "720p"], choices=["360p", "720p", "1080p"])
+    parser.add_argument("--fps", nargs="+", type=float, default=[30])
+    parser.add_argument("--durations", nargs="+", type=float, default=[10], help="Video lengths in seconds")
+    parser.add_argument("--orientations", nargs="+", default=["landscape", "portrait"],
+                        choices=["landscape", "portrait"])
+    parser.add_argument("--audio", choices=["with", "without", "both"], default="both",
+                        help="Synthetic videos with a speech-like audio track, without, or both")
+    parser.add_argument("--models", choices=["stub", "real"], default="stub")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case; the median is reported")
+    parser.add_argument("--work-dir", default=BENCHMARK_ROOT, help="Directory for the videos and stage outputs")
+    parser.add_argument("-o", "--output", default=os.path.join(BENCHMARK_ROOT, "benchmark.json"),
+                        help="JSON report to write")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline report to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before failing (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    audio_values = {"with": [True], "without": [False], "both": [True, False]}[args.audio]
+    cases = build_cases(args.resolutions, args.fps, args.durations, args.orientations, audio_values)
+    print(f"Benchmarking {len(cases)} cases with {args.models} models")
+    report = run_benchmark(cases, models=args.models, stages=args.stages, repeat=args.repeat,
+                           work_dir=args.work_dir)
+    print(format_report(report))
+
+    failed = any("error" in result for result in report["cases"].values())
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        baseline = load_report(args.baseline)
+        if baseline.get("machine") != report["machine"]:
+            print(f"Warning: {args.baseline} was recorded on a different machine or with other models")
+        rows = compare_reports(report, baseline, args.tolerance)
+        report["comparison"] = {"baseline": args.baseline, "tolerance": args.tolerance, "rows": rows}
+        changed = [row for row in rows if row["status"] != "ok"]
+        for row in changed:
+            print(f"{row['status']:11s} {row['case']} {row['stage']} {row['metric']}: "
+                  f"{row['baseline']:.3f} -> {row['current']:.3f} ({row['ratio']:.2f}x)")
+        print(f"Compared with {args.baseline}: {len(changed)} of {len(rows)} measurements changed")
+        failed = failed or any(row["status"] == "regression" for row in rows)
+
+    save_report(report, args.output)
+    print(f"Report written to {args.output}")
+    if args.save_baseline:
+        save_report(report, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# END
+# ________________________________________________________________
@@ -0,0 +1,248 @@
+# src/calibration.py
+"""Threshold and fusion weight sweeps on cached model outputs.
+
+Usage:
+    python -m src.calibration frames LOGITS.npz [--positive-class Violence] [--argmax]
+                             [--target-recall 0.9] [--output points.json]
+    python -m src.calibration fusion RESULTS.jsonl --harmful-dir violence [--harmful-dir nsfw]
+                             [--target-recall 0.9] [--output points.json]
+
+`frames` sweeps the decision threshold on the test set logits cached by
+resnet_helper_functions.test_model(..., logits_path=LOGITS.npz): window
+scores of the violence model (the 0.5 sequence threshold of
+summarize_violence_predictions) or frame scores of the nudity model (the
+0.85 threshold of nudity_label; pass --argmax, since a frame only counts as
+nude when 'nude' also has the highest probability).
+
+`fusion` sweeps the BERT weight and decision threshold of weighted_fusion
+together, on the per-video text and visual scores in the JSONL written by
+python -m src.batch. A video is labelled harmful when one of its parent
+directories is named by --harmful-dir.
+
+Every sweep is computed at once from the cached scores, so no model runs
+while tuning. The report lists the operating points with the best F1, the
+best precision at the target recall and the current default.
+"""
+
+
+# IMPORTS
+# ________________________________________________________________
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+DEFAULT_THRESHOLDS = np.round(np.linspace(0.01, 0.99, 99), 2)
+DEFAULT_BERT_WEIGHTS = np.round(np.linspace(0.0, 1.0, 21), 2)
+CURRENT_DEFAULTS = {
+    "violence_sequence_threshold": 0.5,
+    "nudity_threshold": 0.85,
+    "fusion_bert_weight": 0.4,
+    "fusion_threshold": 0.5,
+}
+
+
+def softmax(logits):
+    logits = np.asarray(logits, dtype=np.float64)
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def positive_scores(logits, positive_index, argmax=False):
+    """
+    Probability of the positive class per sample.
+
+    Args:
+        logits: (N, num_classes) model outputs
+        positive_index: Index of the harmful class
+        argmax: Score 0 where another class wins the argmax, like nudity_label
+    """
+    probabilities = softmax(logits)
+    scores = probabilities[:, positive_index]
+    if argmax:
+        scores = np.where(probabilities.argmax(axis=1) == positive_index, scores, 0.0)
+    return scores
+
+
+def threshold_sweep(scores, labels, thresholds=DEFAULT_THRESHOLDS):
+    """
+    Confusion counts and metrics of `score > threshold` for every threshold.
+
+    Scores are sorted once and each threshold's counts come from a cumulative
+    sum, so the cost is O(N log N) whatever the number of thresholds.
+
+    Returns:
+        Dict of arrays, one value per threshold
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    labels = np.asarray(labels).astype(bool)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    order = np.argsort(scores, kind="stable")
+    positives_at_or_below = np.concatenate(([0], np.cumsum(labels[order])))
+    at_or_below = np.searchsorted(scores[order], thresholds, side="right")
+
+    total, total_positive = len(scores), int(labels.sum())
+    tp = total_positive - positives_at_or_below[at_or_below]
+    fp = (total - at_or_below) - tp
+    fn = total_positive - tp
+    tn = total - total_positive - fp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        fpr = np.where(fp + tn > 0, fp / (fp + tn), 0.0)
+    return {
+        "threshold": thresholds, "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+        "precision": precision, "recall": recall, "f1": f1, "fpr": fpr,
+        "accuracy": (tp + tn) / max(total, 1),
+    }
+
+
+def fused_scores(bert_harmful, visual_harmful, bert_weights, mode="violence"):
+    """
+    Combined harmful score of src.utils.weighted_fusion for every video and BERT weight.
+
+    Returns:
+        Array of shape (len(bert_weights), len(videos))
+    """
+    bert = np.asarray(bert_harmful, dtype=np.float64)[None, :]
+    visual = np.asarray(visual_harmful, dtype=np.float64)[None, :]
+    bert_weight = np.asarray(bert_weights, dtype=np.float64)[:, None]
+    visual_weight = 1 - bert_weight
+    if mode == "nudity":
+        # Same overrides as weighted_fusion: confident nudity shifts the weights and boosts the score
+        confident = visual > 0.7
+        bert_weight = np.where(confident, 0.2, bert_weight)
+        visual_weight = np.where(confident, 0.8, visual_weight)
+    combined = bert * bert_weight + visual * visual_weight
+    if mode == "nudity":
+        combined = np.where(visual > 0.85, np.minimum(np.maximum(combined, visual * 1.1), 1.0), combined)
+    return combined
+
+
+def fusion_sweep(bert_harmful, visual_harmful, labels, mode="violence", bert_weights=DEFAULT_BERT_WEIGHTS,
+                 thresholds=DEFAULT_THRESHOLDS):
+    """threshold_sweep of the fused scores for every BERT weight; arrays of shape (weights, thresholds)."""
+    combined = fused_scores(bert_harmful, visual_harmful, bert_weights, mode)
+    rows = [threshold_sweep(row, labels, thresholds) for row in combined]
+    sweep = {key: np.stack([row[key] for row in rows]) for key in rows[0]}
+    sweep["bert_weight"] = np.broadcast_to(np.asarray(bert_weights, dtype=np.float64)[:, None],
+                                           sweep["threshold"].shape)
+    return sweep
+
+
+def _point(sweep, index):
+    return {key: values[index].item() for key, values in sweep.items()}
+
+
+def operating_points(sweep, target_recall=0.9, current=None):
+    """
+    Notable points of a sweep.
+
+    Args:
+        sweep: Result of threshold_sweep or fusion_sweep
+        target_recall: Recall the 'target_recall' point must reach (with the best precision)
+        current: Dict of the current settings (e.g. {'threshold': 0.5}), reported as 'current'
+    """
+    points = {"best_f1": _point(sweep, np.unravel_index(np.argmax(sweep["f1"]), sweep["f1"].shape))}
+    reaching = sweep["recall"] >= target_recall
+    if reaching.any():
+        precision = np.where(reaching, sweep["precision"], -1.0)
+        points["target_recall"] = _point(sweep, np.unravel_index(np.argmax(precision), precision.shape))
+    if current:
+        distance = sum(np.abs(sweep[key] - value) for key, value in current.items())
+        points["current"] = _point(sweep, np.unravel_index(np.argmin(distance), distance.shape))
+    return points
+
+
+def load_batch_scores(results_path, harmful_dirs):
+    """
+    Per-video (bert harmful, visual harmful, label) arrays and the mode of a src.batch JSONL file.
+
+    Only successful records are used; all of them must come from the same mode.
+    """
+    harmful_dirs = {name.lower() for name in harmful_dirs}
+    bert, visual, labels, modes = [], [], [], set()
+    with open(results_path, "r") as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("status") != "ok":
+                continue
+            results = record["results"]
+            bert.append(results["bert_scores"]["harmful"])
+            visual.append(results["harmful_score_visual"])
+            parents = os.path.normpath(os.path.dirname(record["video_path"])).lower().split(os.sep)
+            labels.append(any(part in harmful_dirs for part in parents))
+            modes.add("nudity" if results["mode"].lower().startswith("nudity") else "violence")
+    if len(modes) > 1:
+        raise ValueError(f"{results_path} mixes violence and nudity results")
+    return np.array(bert), np.array(visual), np.array(labels, dtype=bool), modes.pop() if modes else "violence"
+
+
+def format_points(points):
+    lines = []
+    for name, point in points.items():
+        setting = f"bert_weight {point['bert_weight']:.2f}  " if "bert_weight" in point else ""
+        lines.append(f"{name:14s} {setting}threshold {point['threshold']:.2f}  precision {point['precision']:.3f}  "
+                     f"recall {point['recall']:.3f}  f1 {point['f1']:.3f}  fpr {point['fpr']:.3f}")
+    return "\n".join(lines)
+
+
+def _as_json(sweep):
+    return {key: np.asarray(values).tolist() for key, values in sweep.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune detection thresholds and fusion weights on cached outputs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    frames = subparsers.add_parser("frames", help="Sweep the threshold on cached test set logits")
+    frames.add_argument("logits", help=".npz written by test_model(..., logits_path=...)")
+    frames.add_argument("--positive-class", help="Harmful class name (default: the first class not named 'safe')")
+    frames.add_argument("--argmax", action="store_true",
+                        help="Only count samples where the harmful class also wins the argmax (nudity_label)")
+    fusion = subparsers.add_parser("fusion", help="Sweep weighted_fusion's BERT weight and threshold")
+    fusion.add_argument("results", help="JSONL written by python -m src.batch")
+    fusion.add_argument("--harmful-dir", action="append", required=True,
+                        help="Directory name marking harmful videos (repeatable)")
+    for subparser in (frames, fusion):
+        subparser.add_argument("--target-recall", type=float, default=0.9)
+        subparser.add_argument("-o", "--output", help="JSON file for the operating points and the full sweep")
+    args = parser.parse_args(argv)
+
+    if args.command == "frames":
+        cached = np.load(args.logits)
+        class_names = [str(name) for name in cached["class_names"]]
+        positive = args.positive_class or next(name for name in class_names if name.lower() != "safe")
+        positive_index = class_names.index(positive)
+        scores = positive_scores(cached["logits"], positive_index, argmax=args.argmax)
+        sweep = threshold_sweep(scores, cached["labels"] == positive_index)
+        default = CURRENT_DEFAULTS["nudity_threshold" if args.argmax else "violence_sequence_threshold"]
+        points = operating_points(sweep, args.target_recall, current={"threshold": default})
+        print(f"{len(scores)} samples, positive class '{positive}'")
+    else:
+        bert, visual, labels, mode = load_batch_scores(args.results, args.harmful_dir)
+        if not len(labels):
+            print(f"No successful results in {args.results}")
+            return 1
+        sweep = fusion_sweep(bert, visual, labels, mode)
+        points = operating_points(sweep, args.target_recall, current={
+            "bert_weight": CURRENT_DEFAULTS["fusion_bert_weight"], "threshold": CURRENT_DEFAULTS["fusion_threshold"],
+        })
+        print(f"{len(labels)} videos ({int(labels.sum())} harmful), {mode} mode")
+    print(format_points(points))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"operating_points": points, "sweep": _as_json(sweep)}, f, indent=2)
+        print(f"Sweep written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# END
+# ________________________________________________________________
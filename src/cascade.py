@@ -0,0 +1,147 @@
+# src/cascade.py
+"""Student/teacher cascade for the vision models.
+
+A small distilled student (see distill_student.py) classifies every model
+input (a frame for nudity, a window of frames for violence) first. Only the
+inputs whose harmful probability reaches BUDDYGUARD_CASCADE_THRESHOLD are
+run through the full model (the teacher), which replaces the student's
+output for them. Plainly safe frames cost one small forward pass instead of
+a ResNet-50 one.
+
+The cascade is off unless BUDDYGUARD_CASCADE_THRESHOLD is set to a value
+above 0 and the student model file exists (see src/models_load.py). It is
+an nn.Module with the interface of the wrapped model, so the extractors,
+segment workers, API batcher and profiler use it unchanged. Inputs answered
+by each model are counted in buddyguard_cascade_inputs_total.
+
+cascade_report() estimates the recall retained and the compute saved for a
+range of thresholds from cached test set logits of both models; use it to
+pick the threshold.
+"""
+
+
+# IMPORTS
+# ________________________________________________________________
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from src.calibration import softmax
+from src.metrics import CASCADE_INPUTS
+
+CASCADE_THRESHOLD = float(os.environ.get("BUDDYGUARD_CASCADE_THRESHOLD", "0"))
+REPORT_THRESHOLDS = (0.01, 0.02, 0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5)
+
+
+def harmful_class_index(class_names):
+    """Index of the harmful class: the first class not named 'safe'."""
+    return next(index for index, name in enumerate(class_names) if name.lower() != "safe")
+
+
+class CascadeModel(nn.Module):
+    """
+    Run `student` on every input and `teacher` only on the inputs it flags.
+
+    Args:
+        student: Small model with the same inputs and classes as the teacher
+        teacher: Full model
+        harmful_index: Index of the harmful class in the outputs
+        threshold: Student harmful probability from which an input is escalated
+        name: Model label of the metrics ('violence' or 'nudity')
+    """
+
+    def __init__(self, student, teacher, harmful_index, threshold, name="model"):
+        super().__init__()
+        self.student = student
+        self.teacher = teacher
+        self.harmful_index = harmful_index
+        self.threshold = threshold
+        self._answered = {route: CASCADE_INPUTS.labels(name, route) for route in ("student", "teacher")}
+
+    def forward(self, x):
+        logits = self.student(x)
+        escalate = torch.softmax(logits.float(), dim=1)[:, self.harmful_index] >= self.threshold
+        escalated = int(escalate.sum())
+        self._answered["student"].inc(len(x) - escalated)
+        self._answered["teacher"].inc(escalated)
+        if escalated == 0:
+            return logits
+        logits = logits.clone()
+        logits[escalate] = self.teacher(x[escalate]).to(logits.dtype)
+        return logits
+
+
+def forward_seconds(model, batch, repeats=5):
+    """Median time of one forward pass of `batch`, after a warm-up pass."""
+    times = []
+    with torch.no_grad():
+        for index in range(repeats + 1):
+            start = time.perf_counter()
+            model(batch)
+            if batch.is_cuda:
+                torch.cuda.synchronize()
+            if index:
+                times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def cascade_report(student_logits, teacher_logits, labels, harmful_index, thresholds=REPORT_THRESHOLDS,
+                   decision_threshold=0.5, cost_ratio=None):
+    """
+    Recall retained and compute saved by the cascade at each escalation threshold.
+
+    An input counts as harmful when the model that answers it (the teacher if
+    escalated, else the student) gives the harmful class a probability above
+    decision_threshold. All thresholds are evaluated at once.
+
+    Args:
+        student_logits, teacher_logits: (N, num_classes) outputs on the same test set
+        labels: (N,) ground truth class indices
+        harmful_index: Index of the harmful class
+        cost_ratio: Student forward cost divided by the teacher's; without it,
+            compute is reported as the share of inputs escalated only
+
+    Returns:
+        List of dicts, one per threshold, plus the teacher alone as threshold 0
+    """
+    student = softmax(student_logits)[:, harmful_index]
+    teacher = softmax(teacher_logits)[:, harmful_index]
+    harmful = np.asarray(labels) == harmful_index
+    thresholds = np.asarray((0.0,) + tuple(thresholds), dtype=np.float64)
+
+    escalated = student[None, :] >= thresholds[:, None]  # (thresholds, inputs)
+    flagged = np.where(escalated, teacher[None, :] > decision_threshold, student[None, :] > decision_threshold)
+    teacher_flagged = teacher > decision_threshold
+    escalation_rate = escalated.mean(axis=1)
+    compute = escalation_rate + (cost_ratio or 0.0)
+    compute[0] = 1.0  # The teacher alone runs no student
+
+    rows = []
+    for index, threshold in enumerate(thresholds):
+        true_positives = int((flagged[index] & harmful).sum())
+        rows.append({
+            "threshold": float(threshold),
+            "escalation_rate": float(escalation_rate[index]),
+            "recall": true_positives / max(int(harmful.sum()), 1),
+            "precision": true_positives / max(int(flagged[index].sum()), 1),
+            # Share of the teacher's own detections the cascade still makes
+            "recall_retained": int((flagged[index] & teacher_flagged).sum()) / max(int(teacher_flagged.sum()), 1),
+            "compute": float(compute[index]),
+            "compute_saved": float(1.0 - compute[index]),
+        })
+    return rows
+
+
+def format_cascade_report(rows):
+    lines = ["threshold  escalated  recall  retained  precision  compute  saved"]
+    for row in rows:
+        name = "teacher" if row["threshold"] == 0 else f"{row['threshold']:.2f}"
+        lines.append(f"{name:>9s}  {row['escalation_rate']:8.1%}  {row['recall']:6.3f}  {row['recall_retained']:8.3f}  "
+                     f"{row['precision']:9.3f}  {row['compute']:7.2f}  {row['compute_saved']:5.1%}")
+    return "\n".join(lines)
+
+# END
+# ________________________________________________________________
@@ -0,0 +1,180 @@
+# src/clip_writer.py
+
+
+# IMPORTS
+# ________________________________________________________________
+import logging
+import os
+import queue
+import threading
+
+import cv2
+import imageio
+import numpy as np
+from PIL import Image
+
+from src.instrumentation import StageTimings
+
+CLIP_EXTENSIONS = (".gif", ".webp", ".mp4")
+CLIP_FORMAT = os.environ.get("BUDDYGUARD_CLIP_FORMAT", "gif")  # gif, webp or mp4
+CLIP_FRAME_DURATION_MS = 200
+CLIP_MAX_SIDE = 480
+
+
+def clip_size(width, height, max_side=CLIP_MAX_SIDE):
+    """Target (width, height) of a clip: 480 px tall for portrait, 480x270 for landscape."""
+    if height > width:
+        return max(2, int(max_side * width / height)) // 2 * 2, max_side
+    return max_side, max_side * 9 // 16
+
+
+def clip_frame(frame):
+    """Copy of a BGR frame downscaled to its clip size."""
+    height, width = frame.shape[:2]
+    return cv2.resize(frame, clip_size(width, height), interpolation=cv2.INTER_AREA)
+
+
+def _shared_palette(images, samples=4):
+    """One adaptive 256-colour palette built from a few frames spread over the clip."""
+    picks = images[::max(1, len(images) // samples)][:samples]
+    width, height = picks[0].size
+    mosaic = Image.new("RGB", (width * len(picks), height))
+    for index, image in enumerate(picks):
+        mosaic.paste(image, (index * width, 0))
+    return mosaic.quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+
+
+def encode_clip(path, images, clip_format, duration_ms):
+    """Write RGB PIL images as an animated GIF/WebP or an H.264 MP4."""
+    if clip_format == "gif":
+        palette = _shared_palette(images)
+        frames = [image.quantize(palette=palette, dither=Image.Dither.NONE) for image in images]
+        frames[0].save(path, format="GIF", save_all=True, append_images=frames[1:],
+                       duration=duration_ms, loop=0, optimize=False)
+    elif clip_format == "webp":
+        images[0].save(path, format="WEBP", save_all=True, append_images=images[1:],
+                       duration=duration_ms, loop=0, quality=70, method=4)
+    elif clip_format == "mp4":
+        with imageio.get_writer(path, format="FFMPEG", fps=1000 / duration_ms, codec="libx264",
+                                pixelformat="yuv420p", macro_block_size=2, ffmpeg_log_level="error") as writer:
+            for image in images:
+                writer.append_data(np.asarray(image))
+    else:
+        raise ValueError(f"Unknown clip format: {clip_format}")
+
+
+class Clip:
+    """Handle of one clip being streamed to a ClipWriter; see ClipWriter.start."""
+
+    def __init__(self, writer, output_dir):
+        self._writer = writer
+        self.output_dir = output_dir
+        self.frames_seen = 0
+        self.frames_kept = 0
+
+    def add(self, frame, *annotation):
+        """
+        Stream one BGR frame into the clip.
+
+        Kept frames are downscaled to clip_size right here, so the caller may
+        draw on (or drop) its full-size frame as soon as this returns. Frames
+        dropped by the frame step or the length cap cost nothing.
+        """
+        keep = self.frames_seen % self._writer.frame_step == 0 and self.frames_kept < self._writer.max_frames
+        self.frames_seen += 1
+        if keep:
+            self.frames_kept += 1
+            self._writer._queue.put(("frame", self, (clip_frame(frame), annotation)))
+
+    def finish(self, name):
+        """Write the clip as `name` (without extension) and return its path."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{name}.{self._writer.clip_format}")
+        self._writer._queue.put(("finish", self, path))
+        return path
+
+    def discard(self):
+        """Drop the frames streamed so far without writing anything."""
+        self._writer._queue.put(("discard", self, None))
+
+
+class ClipWriter:
+    """
+    Background thread that turns detected sequences into small clips.
+
+    Frames are streamed into a Clip as they are decoded: every
+    `frame_step`-th frame is kept (each shown `frame_step` times longer, so
+    playback length is unchanged) as a copy resized to clip_size, then
+    annotated and converted off the frame loop; only the small frames of
+    the clips still open are held. At most `max_frames` frames are kept per clip so
+    a long run does not grow memory. GIFs are quantized once against a
+    palette shared by the whole clip.
+
+    Args:
+        clip_format: 'gif', 'webp' or 'mp4'
+        frame_step: Keep one frame out of this many
+        max_frames: Maximum number of frames kept in one clip
+        queue_size: Frames waiting to be processed before Clip.add blocks
+        timings: Optional StageTimings receiving a "gif" span per clip frame and per encoded clip
+    """
+
+    def __init__(self, clip_format=None, frame_step=2, max_frames=64, queue_size=32, timings=None):
+        self.clip_format = clip_format or CLIP_FORMAT
+        if self.clip_format not in ("gif", "webp", "mp4"):
+            raise ValueError(f"Unknown clip format: {self.clip_format}")
+        self.frame_step = max(1, frame_step)
+        self.max_frames = max_frames
+        self.timings = timings or StageTimings()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="clip-writer", daemon=True)
+        self._thread.start()
+
+    def start(self, output_dir, annotate=None):
+        """
+        Open a clip that frames can be streamed into.
+
+        Args:
+            output_dir: Directory of the clip (created when it is finished)
+            annotate: Optional callable(small BGR frame, *annotation) -> BGR frame, run in
+                the writer thread with the extra arguments given to Clip.add; it may
+                draw in place
+        """
+        clip = Clip(self, output_dir)
+        self._queue.put(("start", clip, annotate))
+        return clip
+
+    def close(self):
+        """Wait until every finished clip has been written."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        open_clips = {}  # Clip -> (annotate, resized RGB images)
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            action, clip, payload = item
+            try:
+                if action == "start":
+                    open_clips[clip] = (payload, [])
+                elif action == "frame" and clip in open_clips:
+                    annotate, images = open_clips[clip]
+                    frame, annotation = payload
+                    with self.timings.span("gif", items=0):
+                        if annotate:
+                            frame = annotate(frame, *annotation)
+                        images.append(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+                elif action == "discard":
+                    open_clips.pop(clip, None)
+                elif action == "finish":
+                    _, images = open_clips.pop(clip, (None, []))
+                    if images:
+                        with self.timings.span("gif"):
+                            encode_clip(payload, images, self.clip_format, CLIP_FRAME_DURATION_MS * self.frame_step)
+            except Exception as e:
+                open_clips.pop(clip, None)
+                logging.warning(f"Couldn't write clip: {str(e)}")
+
+# END
+# ________________________________________________________________
@@ -0,0 +1,235 @@
+# src/frame_pipeline.py
+"""Threaded decode / preprocess / inference stages for the frame extractors.
+
+    decoder thread -> preprocess pool -> inference thread -> caller (annotation) -> writer thread
+
+Stages are joined by bounded queues, so a slow stage holds back the ones
+before it instead of letting frames pile up in memory. Frames come out of
+the pipeline in decode order; the caller keeps doing the per-frame
+bookkeeping (sequences, progress callbacks) in its own thread, which keeps
+the results and callbacks identical to a plain loop.
+"""
+
+
+# IMPORTS
+# ________________________________________________________________
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import torch
+
+from src.instrumentation import StageTimings
+from src.metrics import INFERENCE_SECONDS
+
+QUEUE_SIZE = 32  # Frames buffered between two stages
+PREPROCESS_WORKERS = 2
+
+_DONE = object()
+
+
+class _Failure:
+    """Carries an exception from a stage thread to the consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(q, item, stop):
+    """Put with backpressure; gives up when the pipeline is being stopped."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+class FramePipeline:
+    """
+    Decode, preprocess and classify the frames of an opened cv2.VideoCapture.
+
+    Use as a context manager and iterate over it to get, in frame order,
+    (frame number, BGR frame, probabilities) tuples. probabilities is the
+    softmax row of the model output, or None while the window is not full.
+
+    Args:
+        cap: Opened cv2.VideoCapture, already positioned on `first_frame`
+        preprocess_fn: Callable(BGR frame) -> CHW tensor, run in the preprocess pool
+        model_fn: Callable(batch tensor) -> logits; the model or an infer_fn
+        device: Device the batches are moved to
+        window: Number of consecutive frames in one model input (1 for per-frame models)
+        first_frame: Number of the frame `cap` reads first
+        start_frame: First frame that is returned; earlier frames only fill the window
+        end_frame: Last frame to decode, or None for the whole video
+        batch_size: Maximum number of model inputs per forward pass
+        timings: Optional StageTimings receiving the decode, preprocess and inference spans
+        model_name: Label of the forward pass latency metric (src/metrics.py)
+    """
+
+    def __init__(self, cap, preprocess_fn, model_fn, device, window=1, first_frame=1, start_frame=None,
+                 end_frame=None, batch_size=1, preprocess_workers=PREPROCESS_WORKERS, queue_size=QUEUE_SIZE,
+                 timings=None, model_name="model"):
+        self.cap = cap
+        self.preprocess_fn = preprocess_fn
+        self.model_fn = model_fn
+        self.device = device
+        self.window = window
+        self.first_frame = first_frame
+        self.start_frame = start_frame or first_frame
+        self.end_frame = end_frame
+        self.batch_size = max(1, batch_size)
+        self.timings = timings or StageTimings()
+        self._latency = INFERENCE_SECONDS.labels(model_name)
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=preprocess_workers, thread_name_prefix="frame-preprocess")
+        self._decoded = queue.Queue(maxsize=queue_size)
+        self._results = queue.Queue(maxsize=queue_size)
+        self._threads = [
+            threading.Thread(target=self._decode, name="frame-decoder", daemon=True),
+            threading.Thread(target=self._infer, name="frame-inference", daemon=True),
+        ]
+
+    def __enter__(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def __iter__(self):
+        while True:
+            item = self._results.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+
+    def close(self):
+        """Stop all stages; safe to call while frames are still in flight."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def _decode(self):
+        frame_count = self.first_frame - 1
+        try:
+            while self.end_frame is None or frame_count < self.end_frame:
+                with self.timings.span("decode"):
+                    ret, frame = self.cap.read()
+                if not ret:
+                    break
+                frame_count += 1
+                future = self._pool.submit(self._preprocess, frame)
+                if not _put(self._decoded, (frame_count, frame, future), self._stop):
+                    return
+            _put(self._decoded, _DONE, self._stop)
+        except Exception as e:
+            _put(self._decoded, _Failure(e), self._stop)
+
+    def _preprocess(self, frame):
+        with self.timings.span("preprocess"):
+            return self.preprocess_fn(frame)
+
+    def _next_decoded(self, block):
+        while not self._stop.is_set():
+            try:
+                return self._decoded.get(timeout=0.1) if block else self._decoded.get_nowait()
+            except queue.Empty:
+                if not block:
+                    return None
+        return _DONE
+
+    def _infer(self):
+        recent = deque(maxlen=self.window)
+        finished = False
+        try:
+            while not finished:
+                # Take what is ready, up to batch_size model inputs, without waiting for more
+                items, inputs = [], []
+                item = self._next_decoded(block=True)
+                while True:
+                    if item is _DONE or isinstance(item, _Failure):
+                        finished = True
+                        break
+                    frame_count, frame, future = item
+                    recent.append(future.result())
+                    if frame_count >= self.start_frame:
+                        if self.window == 1:
+                            model_input = recent[-1]
+                        elif len(recent) == self.window:
+                            model_input = torch.stack(list(recent))
+                        else:
+                            model_input = None
+                        items.append((frame_count, frame, model_input is not None))
+                        if model_input is not None:
+                            inputs.append(model_input)
+                    if len(inputs) >= self.batch_size:
+                        break
+                    item = self._next_decoded(block=False)
+                    if item is None:
+                        break
+
+                probs = iter(())
+                if inputs:
+                    with self.timings.span("inference", items=len(inputs)) as measured:
+                        batch = torch.stack(inputs).to(self.device)
+                        with torch.no_grad():
+                            outputs = self.model_fn(batch)
+                        probs = iter(torch.nn.functional.softmax(outputs, dim=1).cpu().numpy())
+                    self._latency.observe(measured["wall_seconds"])
+                for frame_count, frame, predicted in items:
+                    if not _put(self._results, (frame_count, frame, next(probs) if predicted else None), self._stop):
+                        return
+                if isinstance(item, _Failure):
+                    _put(self._results, item, self._stop)
+                    return
+            _put(self._results, _DONE, self._stop)
+        except Exception as e:
+            _put(self._results, _Failure(e), self._stop)
+
+
+class FrameWriter:
+    """Background thread writing images with cv2.imwrite, in submission order (the "encode" stage)."""
+
+    def __init__(self, queue_size=QUEUE_SIZE, timings=None):
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.timings = timings or StageTimings()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="frame-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, path, image):
+        """Queue an image; it must not be modified afterwards."""
+        if self._error is not None:
+            raise self._error
+        self._queue.put((path, image))
+
+    def close(self):
+        """Wait until every queued image is on disk."""
+        self._queue.put(_DONE)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if self._error is None:
+                try:
+                    with self.timings.span("encode"):
+                        cv2.imwrite(*item)
+                except Exception as e:
+                    self._error = e
+
+# END
+# ________________________________________________________________
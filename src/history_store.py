@@ -0,0 +1,289 @@
+# src/history_store.py
+
+
+# IMPORTS
+# ________________________________________________________________
+import json
+import os
+import sqlite3
+import time
+
+from src.predictions import FramePredictions
+
+# Keys kept out of the summary row because they are large; they live in
+# the transcripts table and are only loaded for a single video.
+TRANSCRIPT_KEYS = ("transcription", "highlighted_text")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    mode TEXT,
+    final_prediction TEXT,
+    final_confidence REAL,
+    processing_time REAL,
+    created_at REAL NOT NULL,
+    summary TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_videos_created_at ON videos (created_at);
+CREATE INDEX IF NOT EXISTS idx_videos_verdict ON videos (final_prediction, created_at);
+
+CREATE TABLE IF NOT EXISTS transcripts (
+    video_id INTEGER PRIMARY KEY REFERENCES videos (id) ON DELETE CASCADE,
+    transcription TEXT NOT NULL,
+    highlighted_text TEXT
+);
+
+CREATE TABLE IF NOT EXISTS frame_predictions (
+    video_id INTEGER NOT NULL REFERENCES videos (id) ON DELETE CASCADE,
+    frame INTEGER NOT NULL,
+    class_name TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    PRIMARY KEY (video_id, frame)
+) WITHOUT ROWID;
+"""
+
+
+class HistoryStore:
+    """SQLite-backed store for processed video results.
+
+    Each call opens its own short-lived connection so the store can be shared
+    between Streamlit script threads and worker processes. WAL mode lets
+    readers keep going while a job is writing its results.
+    """
+
+    def __init__(self, db_path, json_cls=json.JSONEncoder):
+        self.db_path = db_path
+        self.json_cls = json_cls
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return connect_db(self.db_path)
+
+    def _dumps(self, value):
+        return json.dumps(value, cls=self.json_cls)
+
+    def insert_result(self, video_name, results, predictions_per_frame=None, created_at=None):
+        """Atomically insert (or replace) the results for a video.
+
+        Args:
+            video_name: Unique name of the processed video
+            results: Serializable results dictionary produced by the pipeline
+            predictions_per_frame: Optional iterable of (frame, class_name, confidence)
+            created_at: Optional epoch timestamp; defaults to now
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                video_id = self._insert(conn, video_name, results, predictions_per_frame, created_at)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return video_id
+
+    def _insert(self, conn, video_name, results, predictions_per_frame=None, created_at=None):
+        """Insert (or replace) one video inside the caller's transaction and return its id."""
+        summary = {k: v for k, v in results.items() if k not in TRANSCRIPT_KEYS}
+        created_at = time.time() if created_at is None else created_at
+
+        conn.execute("DELETE FROM videos WHERE name = ?", (video_name,))
+        cursor = conn.execute(
+            "INSERT INTO videos (name, mode, final_prediction, final_confidence, "
+            "processing_time, created_at, summary) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                video_name,
+                results.get("mode"),
+                results.get("final_prediction"),
+                _to_float(results.get("final_confidence")),
+                _to_float(results.get("processing_time")),
+                created_at,
+                self._dumps(summary),
+            ),
+        )
+        video_id = cursor.lastrowid
+        conn.execute(
+            "INSERT INTO transcripts (video_id, transcription, highlighted_text) VALUES (?, ?, ?)",
+            (video_id, self._dumps(results.get("transcription", [])), results.get("highlighted_text", "")),
+        )
+        if predictions_per_frame is not None:
+            conn.executemany(
+                "INSERT OR REPLACE INTO frame_predictions (video_id, frame, class_name, confidence) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    (video_id, int(frame), str(class_name), float(confidence))
+                    for frame, class_name, confidence in predictions_per_frame
+                ),
+            )
+        return video_id
+
+    def get_result(self, video_name):
+        """Return the full results dictionary for a video, or None if unknown."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT v.summary, t.transcription, t.highlighted_text FROM videos v "
+                "LEFT JOIN transcripts t ON t.video_id = v.id WHERE v.name = ?",
+                (video_name,),
+            ).fetchone()
+        if row is None:
+            return None
+        results = json.loads(row["summary"])
+        results["transcription"] = json.loads(row["transcription"]) if row["transcription"] else []
+        results["highlighted_text"] = row["highlighted_text"] or ""
+        return results
+
+    def get_frame_predictions(self, video_name):
+        """Return the per-frame predictions of a video in frame order.
+
+        Results saved with a columnar predictions file return a
+        FramePredictions; older entries return (frame, class_name, confidence)
+        tuples from the frame_predictions table. Both iterate the same way.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT summary FROM videos WHERE name = ?", (video_name,)).fetchone()
+        summary = json.loads(row["summary"]) if row is not None else {}
+        path = summary.get("predictions_path")
+        if path and os.path.exists(path):
+            return FramePredictions.load(path, summary["prediction_classes"])
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT p.frame, p.class_name, p.confidence FROM frame_predictions p "
+                "JOIN videos v ON v.id = p.video_id WHERE v.name = ? ORDER BY p.frame",
+                (video_name,),
+            ).fetchall()
+        return [(row["frame"], row["class_name"], row["confidence"]) for row in rows]
+
+    def list_summaries(self, verdict=None, since=None, until=None, search=None, limit=None, offset=0):
+        """List lightweight summary rows, newest first.
+
+        Args:
+            verdict: Optional final prediction to filter on ("Harmful" / "Safe")
+            since: Optional epoch timestamp lower bound (inclusive)
+            until: Optional epoch timestamp upper bound (exclusive)
+            search: Optional case-insensitive substring of the video name
+            limit: Maximum number of rows to return
+            offset: Number of rows to skip (for pagination)
+        """
+        where, params = _summary_filters(verdict, since, until, search)
+        sql = (
+            "SELECT name, mode, final_prediction, final_confidence, processing_time, created_at "
+            f"FROM videos{where} ORDER BY created_at DESC"
+        )
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [int(limit), int(offset)]
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+    def count(self, verdict=None, since=None, until=None, search=None):
+        """Count videos matching the same filters as list_summaries."""
+        where, params = _summary_filters(verdict, since, until, search)
+        with self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM videos{where}", params).fetchone()[0]
+
+    def has_video(self, video_name):
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM videos WHERE name = ?", (video_name,)).fetchone() is not None
+
+    def delete(self, video_name):
+        """Delete a video and its transcript and frame predictions."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM videos WHERE name = ?", (video_name,))
+
+    def import_legacy_json(self, history_file):
+        """Import entries from the old processed_videos.json history file.
+
+        The file is imported and renamed to <file>.migrated in one write
+        transaction, so processes starting together import it once: the others
+        wait for the lock and then find the file gone. Entries already present
+        in the store are left untouched.
+
+        Returns the number of imported entries.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            renamed = False
+            try:
+                if not os.path.exists(history_file):
+                    conn.execute("ROLLBACK")
+                    return 0
+                with open(history_file, "r") as f:
+                    history = json.load(f)
+
+                imported = 0
+                base_time = os.path.getmtime(history_file)
+                # The old file kept the newest entries last; keep that ordering.
+                for index, (video_name, results) in enumerate(history.items()):
+                    if conn.execute("SELECT 1 FROM videos WHERE name = ?", (video_name,)).fetchone():
+                        continue
+                    self._insert(conn, video_name, results, created_at=base_time - len(history) + index)
+                    imported += 1
+                os.replace(history_file, history_file + ".migrated")
+                renamed = True
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                if renamed:
+                    os.replace(history_file + ".migrated", history_file)
+                raise
+        return imported
+
+
+def connect_db(db_path):
+    """Open an autocommit connection to a BuddyGuard SQLite database.
+
+    Use as a context manager; the connection is closed on exit. Transactions
+    are started explicitly with BEGIN IMMEDIATE where atomicity matters.
+    """
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return _ClosingConnection(conn)
+
+
+class _ClosingConnection:
+    """Context manager that closes the wrapped sqlite3 connection on exit."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.close()
+        return False
+
+
+def _summary_filters(verdict, since, until, search):
+    clauses = []
+    params = []
+    if verdict:
+        clauses.append("final_prediction = ?")
+        params.append(verdict)
+    if since is not None:
+        clauses.append("created_at >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("created_at < ?")
+        params.append(until)
+    if search:
+        clauses.append("name LIKE ? ESCAPE '\\'")
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.append(f"%{escaped}%")
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+
+def _to_float(value):
+    return None if value is None else float(value)
+
+# END
+# ________________________________________________________________
@@ -0,0 +1,137 @@
+# src/instrumentation.py
+"""Per-stage timing and resource spans for one analysed video.
+
+A StageTimings object is passed down the pipeline (run_analysis, the frame
+extractors, FramePipeline, FrameWriter and ClipWriter) and every stage adds
+its spans to it:
+
+    probe, audio, transcription, text       run_analysis, once per video
+    decode, preprocess, inference           FramePipeline threads, per frame / batch
+    annotate, encode                        extractor loop and FrameWriter, per frame
+    gif                                     ClipWriter, per clip
+    render, persist                         annotated video and history store
+
+For each stage the wall time, the CPU time of the threads that ran it (plus
+ffmpeg child processes for audio and render), the number of calls and items
+and the process's peak RSS when it last ran are recorded. The peak RSS is the
+process-wide high-water mark so far, not the memory used by that stage. Frame stages run
+concurrently, so their wall times add up to more than the elapsed time.
+"""
+
+
+# IMPORTS
+# ________________________________________________________________
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource  # POSIX only
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+STAGES = (
+    "probe", "audio", "transcription", "text", "decode", "preprocess", "inference",
+    "annotate", "encode", "gif", "render", "persist",
+)
+
+
+def peak_rss_mb(children=False):
+    """
+    Process-wide high-water mark of the resident set size in MB, or None where unknown.
+
+    Args:
+        children: Peak of the waited-for child processes instead (POSIX only)
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB elsewhere
+    if psutil is not None and not children:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, "peak_wset", memory.rss) / (1024 * 1024)  # Peak working set on Windows
+    return None
+
+
+def _cpu_time(children=False):
+    if not children:
+        return time.thread_time()
+    times = os.times()
+    return time.thread_time() + times.children_user + times.children_system
+
+
+class StageTimings:
+    """Thread-safe accumulator of spans per stage; see the module docstring."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    @contextmanager
+    def span(self, stage, items=1, children=False):
+        """
+        Time the body as one call of `stage`.
+
+        Yields a dict that holds the span's wall_seconds and cpu_seconds once
+        the body has run.
+
+        Args:
+            stage: Stage name (see STAGES)
+            items: Number of items (frames, clips, ...) the call handled
+            children: Also count the CPU time of child processes waited for (ffmpeg)
+        """
+        measured = {}
+        wall, cpu = time.perf_counter(), _cpu_time(children)
+        try:
+            yield measured
+        finally:
+            measured.update(wall_seconds=time.perf_counter() - wall, cpu_seconds=_cpu_time(children) - cpu)
+            self.add(stage, measured["wall_seconds"], measured["cpu_seconds"], items)
+
+    def add(self, stage, wall_seconds, cpu_seconds=0.0, items=1, calls=1):
+        with self._lock:
+            entry = self._stages.setdefault(
+                stage, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "calls": 0, "items": 0, "peak_rss_mb": 0.0}
+            )
+            entry["wall_seconds"] += wall_seconds
+            entry["cpu_seconds"] += cpu_seconds
+            entry["calls"] += calls
+            entry["items"] += items
+            entry["peak_rss_mb"] = max(entry["peak_rss_mb"], peak_rss_mb() or 0.0)
+
+    def merge(self, stages):
+        """Add the stages of another StageTimings.as_dict(), e.g. from a worker process."""
+        for stage, entry in stages.items():
+            self.add(stage, entry["wall_seconds"], entry["cpu_seconds"], entry["items"], entry["calls"])
+            with self._lock:
+                self._stages[stage]["peak_rss_mb"] = max(self._stages[stage]["peak_rss_mb"], entry["peak_rss_mb"])
+
+    def as_dict(self):
+        """Copy of the stages, in pipeline order."""
+        with self._lock:
+            order = {stage: index for index, stage in enumerate(STAGES)}
+            return {
+                stage: dict(entry)
+                for stage, entry in sorted(self._stages.items(), key=lambda item: order.get(item[0], len(order)))
+            }
+
+
+def format_timings(stages):
+    """One-line summary of StageTimings.as_dict(), e.g. for the logs."""
+    return ", ".join(
+        f"{stage} {entry['wall_seconds']:.2f}s/{entry['items']}" for stage, entry in stages.items()
+    )
+
+
+def log_timings(video_name, mode, stages):
+    logging.info(f"Stage timings for {video_name} ({mode}): {format_timings(stages)}; "
+                 f"peak RSS {max((entry['peak_rss_mb'] for entry in stages.values()), default=0.0):.0f} MB")
+
+# END
+# ________________________________________________________________
@@ -0,0 +1,324 @@
+# src/jobs.py
+
+
+# IMPORTS
+# ________________________________________________________________
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+import uuid
+
+from src.history_store import connect_db
+from src.metrics import METRICS_PORT, QUEUED_JOBS, start_metrics_server, worker_metrics_port
+from src.processes import spawn_context
+
+JOBS_DB = os.path.join("saves", "jobs.db")
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+# A job whose worker died this many times (e.g. OOM, a decoder crash) is failed instead of requeued
+MAX_ORPHANINGS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    video_path TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    video_name TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    orphaned_count INTEGER NOT NULL DEFAULT 0,
+    processed_video_path TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when the user cancelled the running job."""
+
+
+class JobQueue:
+    """Persistent analysis job queue stored in SQLite.
+
+    The Upload page enqueues jobs and polls them; worker processes claim them
+    one at a time. State survives page reloads and server restarts.
+    """
+
+    def __init__(self, db_path=JOBS_DB):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with connect_db(db_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "orphaned_count" not in columns:  # Databases created before the column existed
+                conn.execute("ALTER TABLE jobs ADD COLUMN orphaned_count INTEGER NOT NULL DEFAULT 0")
+
+    def enqueue(self, video_path, output_dir, mode, options=None):
+        """Add a job and return its id."""
+        job_id = uuid.uuid4().hex
+        with connect_db(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, video_path, output_dir, video_name, mode, options, status, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, video_path, output_dir, os.path.basename(output_dir), mode,
+                 json.dumps(options or {}), QUEUED, time.time()),
+            )
+        return job_id
+
+    def claim(self, worker_id):
+        """Atomically take the oldest queued job, or return None if the queue is empty."""
+        with connect_db(self.db_path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, started_at = ?, message = ? WHERE id = ?",
+                    (RUNNING, worker_id, time.time(), "Starting...", row["id"]),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return _job_dict(row, status=RUNNING)
+
+    def get(self, job_id):
+        with connect_db(self.db_path) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_dict(row) if row is not None else None
+
+    def update_progress(self, job_id, progress=None, message=None):
+        with connect_db(self.db_path) as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = COALESCE(?, progress), message = COALESCE(?, message) WHERE id = ?",
+                (progress, message, job_id),
+            )
+
+    def request_cancel(self, job_id):
+        """Ask for a job to stop; queued jobs are cancelled immediately."""
+        with connect_db(self.db_path) as conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            )
+
+    def is_cancel_requested(self, job_id):
+        with connect_db(self.db_path) as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def finish(self, job_id, status, error=None, processed_video_path=None):
+        with connect_db(self.db_path) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, processed_video_path = ?, finished_at = ?, "
+                "progress = CASE WHEN ? = 'done' THEN 1.0 ELSE progress END WHERE id = ?",
+                (status, error, processed_video_path, time.time(), status, job_id),
+            )
+
+    def requeue_orphaned(self, live_workers, max_orphanings=MAX_ORPHANINGS):
+        """
+        Put running jobs whose worker is no longer alive back in the queue.
+
+        A job that has lost its worker max_orphanings times is marked failed instead, so
+        a video that crashes its worker is not retried (and the worker respawned) forever.
+
+        Returns:
+            Ids of the requeued jobs
+        """
+        requeued = []
+        with connect_db(self.db_path) as conn:
+            rows = conn.execute("SELECT id, worker, orphaned_count FROM jobs WHERE status = ?",
+                                (RUNNING,)).fetchall()
+            for row in rows:
+                if row["worker"] in live_workers:
+                    continue
+                if row["orphaned_count"] + 1 >= max_orphanings:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, worker = NULL, orphaned_count = orphaned_count + 1, "
+                        "error = ?, finished_at = ? WHERE id = ?",
+                        (FAILED, f"The worker stopped unexpectedly {max_orphanings} times while running this job",
+                         time.time(), row["id"]),
+                    )
+                    logging.warning(f"Job {row['id']} failed after crashing its worker {max_orphanings} times")
+                else:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, worker = NULL, progress = 0, message = ?, "
+                        "orphaned_count = orphaned_count + 1 WHERE id = ?",
+                        (QUEUED, "Requeued after worker restart", row["id"]),
+                    )
+                    requeued.append(row["id"])
+        return requeued
+
+    def counts(self):
+        """Number of jobs per status."""
+        with connect_db(self.db_path) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+def run_job(queue, job, models):
+    """Run one claimed job through the analysis pipeline and record the outcome."""
+    from src.pipeline import run_analysis
+
+    job_id = job["id"]
+    last_update = [0.0]
+
+    def on_progress(done, total):
+        # Throttle database writes; the cancellation flag is checked at the same rate
+        now = time.monotonic()
+        if now - last_update[0] < 0.5 and done < total:
+            return
+        last_update[0] = now
+        queue.update_progress(job_id, progress=done / total if total else 0.0)
+        if queue.is_cancel_requested(job_id):
+            raise JobCancelled(job_id)
+
+    def on_status(message):
+        queue.update_progress(job_id, message=message)
+        if queue.is_cancel_requested(job_id):
+            raise JobCancelled(job_id)
+
+    try:
+        results, processed_video_path = run_analysis(
+            job["video_path"], job["output_dir"], models, job["mode"],
+            progress_callback=on_progress, status_callback=on_status,
+            profile=job["options"].get("profile", False),
+        )
+        queue.finish(job_id, DONE, processed_video_path=processed_video_path)
+        return results
+    except JobCancelled:
+        queue.finish(job_id, CANCELLED)
+    except Exception as e:
+        logging.error(f"Job {job_id} failed:\n{traceback.format_exc()}")
+        queue.finish(job_id, FAILED, error=str(e))
+    return None
+
+
+def worker_main(worker_id, db_path=JOBS_DB, poll_interval=1.0, metrics_port=0):
+    """Entry point of a worker process: load the models once, then process jobs forever."""
+    from src.models_load import load_models
+
+    start_metrics_server(metrics_port)
+    queue = JobQueue(db_path)
+    models = load_models()
+    logging.info(f"Worker {worker_id} ready")
+    while True:
+        job = queue.claim(worker_id)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        run_job(queue, job, models)
+
+
+class WorkerPool:
+    """A set of worker processes that each hold their own copy of the models."""
+
+    def __init__(self, num_workers=1, db_path=JOBS_DB):
+        self.num_workers = num_workers
+        self.db_path = db_path
+        self.queue = JobQueue(db_path)
+        self._context = spawn_context()
+        self._processes = {}
+        self._metrics_ports = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            for index in range(self.num_workers):
+                worker_id = f"worker-{os.getpid()}-{index}"
+                self._metrics_ports[worker_id] = worker_metrics_port(index)
+                self._start_worker(worker_id)
+            self.queue.requeue_orphaned(self.alive_workers())
+        return self
+
+    def _start_worker(self, worker_id):
+        # Not daemonic so a worker can start segment decoding processes (src/parallel_video.py);
+        # get_worker_pool stops the workers at exit instead
+        process = self._context.Process(
+            target=worker_main, args=(worker_id, self.db_path),
+            kwargs={"metrics_port": self._metrics_ports.get(worker_id, 0)}, name=worker_id, daemon=False
+        )
+        process.start()
+        self._processes[worker_id] = process
+
+    def alive_workers(self):
+        return {worker_id for worker_id, process in self._processes.items() if process.is_alive()}
+
+    def ensure_alive(self):
+        """Restart dead workers and requeue the jobs they were running."""
+        with self._lock:
+            dead = [worker_id for worker_id, process in self._processes.items() if not process.is_alive()]
+            for worker_id in dead:
+                del self._processes[worker_id]
+            self.queue.requeue_orphaned(self.alive_workers())
+            for worker_id in dead:
+                self._start_worker(worker_id)
+
+    def stop(self):
+        with self._lock:
+            for process in self._processes.values():
+                process.terminate()
+            for process in self._processes.values():
+                process.join(timeout=5)
+            self._processes.clear()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """Return the process-wide worker pool, starting BUDDYGUARD_WORKERS workers on first use.
+
+    With BUDDYGUARD_METRICS_PORT set, this process also serves the queue depth metrics.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(num_workers=int(os.environ.get("BUDDYGUARD_WORKERS", "1"))).start()
+            atexit.register(_pool.stop)
+            queue = _pool.queue
+            def job_counts():
+                counts = queue.counts()
+                return {(status,): counts.get(status, 0) for status in (QUEUED, RUNNING)}
+
+            QUEUED_JOBS.callback = job_counts
+            start_metrics_server(METRICS_PORT)
+        return _pool
+
+
+def _job_dict(row, **overrides):
+    job = dict(row)
+    job["options"] = json.loads(job.get("options") or "{}")
+    job.update(overrides)
+    return job
+
+# END
+# ________________________________________________________________
@@ -0,0 +1,275 @@
+# src/metrics.py
+"""In-process metrics registry with a Prometheus text exposition endpoint.
+
+Counters, gauges and histograms are updated from the pipeline functions and
+served as text (format 0.0.4) on GET /metrics. Every process has its own
+registry: the Streamlit process serves on BUDDYGUARD_METRICS_PORT (job queue
+depth and running jobs), job worker i on BUDDYGUARD_METRICS_PORT + 1 + i
+(videos, frames, latencies), and the HTTP API adds /metrics to its own port.
+The exporter is off when BUDDYGUARD_METRICS_PORT is unset or 0.
+
+Segment worker processes (src/parallel_video.py) are not served: their
+frames are counted when the merged result comes back, but their forward
+pass latencies are not exported.
+"""
+
+
+# IMPORTS
+# ________________________________________________________________
+import logging
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.environ.get("BUDDYGUARD_METRICS_PORT", "0"))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values, **labels):
+        """The child metric for one combination of label values."""
+        if labels:
+            values = tuple(labels[name] for name in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        return _Child(self, tuple(str(value) for value in values))
+
+    def collect(self):
+        """Exposition lines of this metric."""
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class _Child:
+    """A metric bound to label values; forwards to the parent's methods."""
+
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def __getattr__(self, name):
+        method = getattr(self._metric, f"_{name}")
+        return lambda *args: method(self._key, *args)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1):
+        self._inc((), amount)
+
+    def _inc(self, key, amount=1):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """
+    Gauge set directly, or computed at scrape time by `callback`.
+
+    Args:
+        callback: Optional callable returning the value, or a dict of
+            label value tuples to values
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, callback=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.callback = callback
+
+    def set(self, value):
+        self._set((), value)
+
+    def inc(self, amount=1):
+        self._inc((), amount)
+
+    def dec(self, amount=1):
+        self._inc((), -amount)
+
+    def _set(self, key, value):
+        with self._lock:
+            self._values[key] = float(value)
+
+    def _inc(self, key, amount=1):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _dec(self, key, amount=1):
+        self._inc(key, -amount)
+
+    def collect(self):
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception as e:
+                logging.warning(f"Couldn't collect {self.name}: {str(e)}")
+                return []
+            with self._lock:
+                self._values = value if isinstance(value, dict) else {(): value}
+        return super().collect()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value):
+        self._observe((), value)
+
+    def _observe(self, key, value):
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def collect(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def expose(self):
+        """All metrics in the Prometheus text format."""
+        with self._lock:
+            metrics = list(self._metrics)
+        return "\n".join(line for metric in metrics for line in metric.collect()) + "\n"
+
+
+REGISTRY = Registry()
+
+# Pipeline metrics
+VIDEOS_PROCESSED = Counter("buddyguard_videos_processed_total", "Videos analysed, by mode and outcome",
+                           ["mode", "status"])
+VIDEO_SECONDS = Histogram("buddyguard_video_processing_seconds", "Wall time of one video analysis", ["mode"],
+                          buckets=(5, 10, 20, 30, 60, 120, 300, 600, 1200))
+FRAMES_CLASSIFIED = Counter("buddyguard_frames_classified_total", "Frames classified, by vision model",
+                            ["model"])
+INFERENCE_SECONDS = Histogram("buddyguard_inference_seconds", "Latency of one model forward pass (batch)",
+                              ["model"])
+WHISPER_RTF = Histogram("buddyguard_whisper_realtime_factor", "Transcription time divided by audio duration",
+                        buckets=(0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0))
+CACHE_REQUESTS = Counter("buddyguard_cache_requests_total", "Cache lookups, by cache and result",
+                         ["cache", "result"])
+CASCADE_INPUTS = Counter("buddyguard_cascade_inputs_total",
+                         "Model inputs of a student/teacher cascade, by model and the model that answered",
+                         ["model", "route"])
+ACTIVE_JOBS = Gauge("buddyguard_active_jobs", "Videos being analysed in this process")
+# Set up by get_worker_pool in the process that owns the job queue
+QUEUED_JOBS = Gauge("buddyguard_jobs", "Jobs in the job queue, by status", ["status"])
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.expose().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes are not worth a log line each
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve /metrics on a daemon thread once per process; returns the server or None."""
+    global _server
+    with _server_lock:
+        if _server is None and port:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                logging.warning(f"Couldn't start the metrics server on port {port}: {str(e)}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+            logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return _server
+
+
+def timed(fn, model):
+    """Wrap a model call so that the latency of every call is observed in INFERENCE_SECONDS."""
+    latency = INFERENCE_SECONDS.labels(model)
+
+    def call(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            latency.observe(time.perf_counter() - start)
+    return call
+
+
+def worker_metrics_port(index):
+    """Metrics port of job worker `index`, or 0 when the exporter is off."""
+    return METRICS_PORT + 1 + index if METRICS_PORT else 0
+
+# END
+# ________________________________________________________________
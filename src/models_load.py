@@ -3,20 +3,52 @@
 
 # IMPORTS
 # __________________________________________________________________
+import os
+
 import torch
 
 from transformers import BertTokenizer, pipeline
+from src.cascade import CASCADE_THRESHOLD, CascadeModel, harmful_class_index
 from src.models_def import BertClassifier
 
+# Vision models by kind: (model path, class names)
+VISUAL_MODELS = {
+    'violence': ("./models/resnet50-lstm_10epoch(2).pt", ['Safe', 'Violence']),  # Your ResNet-LSTM model
+    'nudity': ("./models/resnet50_5epoch_0001lr_weight_decay_(final)(2).pt", ['nude', 'safe']),
+}
+
+# Distilled students screening the inputs of the vision models (see src/cascade.py, distill_student.py)
+STUDENT_MODELS = {
+    'violence': "./models/student_violence.pt",
+    'nudity': "./models/student_nudity.pt",
+}
+
+
+def load_visual_model(kind, device=None):
+    """Load only one vision model ('violence' or 'nudity'), e.g. for frame worker processes.
+
+    With BUDDYGUARD_CASCADE_THRESHOLD above 0 and a student model in STUDENT_MODELS,
+    the model is a CascadeModel that only runs the full model on inputs the student flags.
+
+    Returns:
+        Tuple of (model in eval mode, class names)
+    """
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    model_path, class_names = VISUAL_MODELS[kind]
+    model = torch.load(model_path, map_location=device, weights_only=False)
+    model.eval()
+    student_path = STUDENT_MODELS[kind]
+    if CASCADE_THRESHOLD > 0 and os.path.exists(student_path):
+        student = torch.load(student_path, map_location=device, weights_only=False)
+        model = CascadeModel(student, model, harmful_class_index(class_names), CASCADE_THRESHOLD, name=kind)
+        model.eval()
+    return model, class_names
+
+
 # @st.cache_resource
 def load_models():
     device = "cuda" if torch.cuda.is_available() else "cpu"
     bert_model_path = "./models/bert.pth"
-    resnet_lstm_model_path = "./models/resnet50-lstm_10epoch(2).pt"  # Your ResNet-LSTM model
-    violence_class_names = ['Safe', 'Violence']
-    # New nudity model
-    nudity_model_path = "./models/resnet50_5epoch_0001lr_weight_decay_(final)(2).pt"  # Update with your actual path
-    nudity_class_names = ['nude', 'safe']
 
     # Load BERT model (unchanged)
     tokenizer = BertTokenizer.from_pretrained("bert-base-uncased")
@@ -28,12 +60,10 @@ def load_models():
     whisper_model = pipeline("automatic-speech-recognition", "openai/whisper-tiny.en", torch_dtype=torch.float16, device=device)
 
     # Load Violence detection model
-    violence_model = torch.load(resnet_lstm_model_path, map_location=device, weights_only=False)
-    violence_model.eval()
+    violence_model, violence_class_names = load_visual_model('violence', device)
 
     # Load Nudity detection model
-    nudity_model = torch.load(nudity_model_path, map_location=device, weights_only=False)
-    nudity_model.eval()
+    nudity_model, nudity_class_names = load_visual_model('nudity', device)
 
     return {
         'tokenizer': tokenizer,
@@ -0,0 +1,310 @@
+# src/parallel_video.py
+"""Decode and classify long videos in parallel time segments.
+
+The frame range is split into contiguous segments which are decoded and
+classified by a pool of worker processes, each holding its own copy of the
+vision model. Violence segments start decoding sequence_length - 1 frames
+early so every predicted frame sees the same window as in a serial run.
+Per-frame predictions are merged in frame order, and detected sequences and
+their clips are rebuilt from the merged predictions, so runs crossing a
+segment boundary are found as well. The workers save an unlabelled
+clip-sized copy of every harmful frame for this, which is annotated with the
+same callable as the serial clips.
+
+Seeking uses cv2.CAP_PROP_POS_FRAMES, which is frame accurate for constant
+frame rate files; variable frame rate videos may shift by a few frames at
+segment boundaries.
+"""
+
+
+# IMPORTS
+# ________________________________________________________________
+import multiprocessing
+import os
+import shutil
+import threading
+
+import cv2
+
+from src.clip_writer import ClipWriter
+from src.instrumentation import StageTimings
+from src.predictions import FramePredictions
+from src.proc_nudity import extract_nudity_sequences, nudity_clip_annotator, summarize_nudity_predictions
+from src.proc_video_sequence import extract_frame_sequences, summarize_violence_predictions
+from src.processes import spawn_context
+from src.utils import sequence_clip_annotator
+from src.video_probe import probe_video
+
+SEGMENT_WORKERS = int(os.environ.get("BUDDYGUARD_SEGMENT_WORKERS", "1"))
+MIN_SEGMENT_FRAMES = 300  # Shorter segments cost more in start-up and seeking than they save
+CLIP_FRAMES_DIR = "clip_frames"  # Under the output dir; removed once the clips are rebuilt
+
+# Per-process state for the segment workers
+_worker_model = None
+_worker_class_names = None
+_worker_kind = None
+_worker_counter = None
+
+
+def plan_segments(frame_count, num_segments, min_segment_frames=MIN_SEGMENT_FRAMES):
+    """
+    Split frames 1..frame_count into at most num_segments contiguous ranges.
+
+    Returns:
+        List of inclusive (start, end) pairs; the last end is None so frames
+        beyond an under-estimated frame count are still read
+    """
+    num_segments = max(1, min(num_segments, frame_count // max(min_segment_frames, 1)))
+    bounds = [1 + frame_count * index // num_segments for index in range(num_segments + 1)]
+    segments = [(bounds[index], bounds[index + 1] - 1) for index in range(num_segments)]
+    segments[-1] = (segments[-1][0], None)
+    return segments
+
+
+def _init_segment_worker(kind, counter, num_threads):
+    global _worker_model, _worker_class_names, _worker_kind, _worker_counter
+    import torch
+    from src.models_load import load_visual_model
+
+    torch.set_num_threads(num_threads)  # Do not oversubscribe the CPU across workers
+    _worker_model, _worker_class_names = load_visual_model(kind)
+    _worker_kind = kind
+    _worker_counter = counter
+
+
+def _count_frame():
+    with _worker_counter.get_lock():
+        _worker_counter.value += 1
+
+
+def _run_segment(task):
+    video_path, output_dir, frame_range, save_frames, clip_frames_dir, sequence_length = task
+    extract = extract_frame_sequences if _worker_kind == 'violence' else extract_nudity_sequences
+    timings = StageTimings()
+    frame_count, predictions_per_frame, _, _ = extract(
+        video_path, output_dir, _worker_model, _worker_class_names,
+        sequence_length=sequence_length, progress_callback=_count_frame,
+        save_frames=save_frames, save_gifs=False, frame_range=frame_range, timings=timings,
+        clip_frames_dir=clip_frames_dir,
+    )
+    return frame_count, predictions_per_frame, timings.as_dict()
+
+
+class SegmentPool:
+    """Worker processes holding one vision model, reused across videos."""
+
+    def __init__(self, kind, num_workers):
+        self.kind = kind
+        self.num_workers = num_workers
+        context = spawn_context()
+        self._counter = context.Value('q', 0)
+        self._lock = threading.Lock()
+        num_threads = max(1, (os.cpu_count() or 1) // num_workers)
+        self._pool = context.Pool(
+            processes=num_workers, initializer=_init_segment_worker,
+            initargs=(kind, self._counter, num_threads),
+        )
+        self.closed = False
+
+    def run(self, tasks, progress_callback=None, poll_interval=0.25):
+        """Run segment tasks, reporting decoded frames as they happen; one video at a time."""
+        with self._lock:
+            with self._counter.get_lock():
+                self._counter.value = 0
+            async_result = self._pool.map_async(_run_segment, tasks)
+            reported = 0
+            try:
+                while True:
+                    async_result.wait(poll_interval)
+                    done = self._counter.value
+                    if progress_callback and done > reported:
+                        progress_callback(done - reported)
+                        reported = done
+                    if async_result.ready():
+                        return async_result.get()
+            except BaseException:
+                # Cancelled or failed: do not leave workers busy on this video
+                self.close()
+                raise
+
+    def close(self):
+        self.closed = True
+        self._pool.terminate()
+        self._pool.join()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_segment_pool(kind, num_workers):
+    """Return a live SegmentPool for a model kind, starting it on first use."""
+    with _pools_lock:
+        pool = _pools.get((kind, num_workers))
+        if pool is None or pool.closed:
+            pool = _pools[(kind, num_workers)] = SegmentPool(kind, num_workers)
+        return pool
+
+
+def can_run_in_parallel(video_path, num_workers):
+    """Whether a video is long enough to split and this process may start workers."""
+    if num_workers < 2 or multiprocessing.current_process().daemon:
+        return False  # Daemonic processes (e.g. batch pool workers) cannot have children
+    return len(plan_segments(probe_video(video_path)['frame_count'], num_workers)) > 1
+
+
+def _stream_saved_frames(clip, clip_frames_dir, frames):
+    """Feed the saved clip frames into a clip one at a time; frames are (frame number, *annotation)."""
+    for frame_number, *annotation in frames:
+        frame = cv2.imread(os.path.join(clip_frames_dir, f"frame_{frame_number:04d}.jpg"))
+        if frame is None:
+            clip.discard()
+            return False
+        clip.add(frame, *annotation)
+    return True
+
+
+def rebuild_violence_sequences(predictions_per_frame, output_dir, sequence_length, video_name,
+                               class_names, clip_writer=None, fps=0):
+    """
+    Replay the serial violence sequence logic over merged predictions.
+
+    Consecutive violent frames are grouped the same way extract_frame_sequences
+    groups them, and each group of at least sequence_length frames is streamed
+    to clip_writer (if given) from the clip frames the workers saved under
+    output_dir, with the overlay of sequence_clip_annotator.
+
+    Returns:
+        List of dicts with start_frame, end_frame, confidence, type and clip_path
+    """
+    gif_output_dir = os.path.join(output_dir, "detected_sequences")
+    clip_frames_dir = os.path.join(output_dir, CLIP_FRAMES_DIR)
+    annotate = sequence_clip_annotator(fps, class_names)
+    violence_index = class_names.index('Violence')
+    sequences = []
+    current = []  # (frame, confidence) of the current run; pixels stay on disk
+
+    def flush(sequence_id):
+        clip_path = None
+        if clip_writer:
+            clip = clip_writer.start(gif_output_dir, annotate)
+            frames = [(frame, violence_index, conf, frame) for frame, conf in current]
+            if _stream_saved_frames(clip, clip_frames_dir, frames):
+                clip_path = clip.finish(f"{video_name}_seq_{sequence_id}_{class_names[violence_index]}")
+        sequences.append({
+            "start_frame": current[0][0],
+            "end_frame": current[-1][0],
+            "confidence": max(conf for _, conf in current),
+            "type": "violence",
+            "clip_path": clip_path,
+        })
+
+    for frame, label, confidence in predictions_per_frame:
+        if label == 'Violence':
+            current.append((frame, confidence))
+        elif len(current) >= sequence_length:
+            flush(len(sequences))
+            current = []
+    if len(current) >= sequence_length:
+        flush(len(sequences))
+    return sequences
+
+
+def rebuild_nudity_sequences(predictions_per_frame, output_dir, sequence_length, clip_writer=None, fps=0):
+    """
+    Replay the serial nudity sequence logic over merged predictions.
+
+    Every run of sequence_length consecutive nude frames becomes one sequence,
+    streamed to clip_writer (if given) from the clip frames the workers saved
+    under output_dir, with the overlay of nudity_clip_annotator.
+
+    Returns:
+        List of dicts with start_frame, end_frame, confidence, type and clip_path
+    """
+    clip_frames_dir = os.path.join(output_dir, CLIP_FRAMES_DIR)
+    annotate = nudity_clip_annotator(fps)
+    sequences = []
+    run = []
+    for frame, label, confidence in predictions_per_frame:
+        if label != 'nude':
+            run = []
+            continue
+        run.append((frame, confidence, frame))
+        if len(run) < sequence_length:
+            continue
+        clip_path = None
+        if clip_writer:
+            clip = clip_writer.start(output_dir, annotate)
+            if _stream_saved_frames(clip, clip_frames_dir, run):
+                clip_path = clip.finish(f"nudity_sequence_{frame}")
+        sequences.append({
+            'start_frame': frame - sequence_length + 1,
+            'end_frame': frame,
+            'confidence': confidence,
+            'type': 'nudity',
+            'clip_path': clip_path
+        })
+        run = []
+    return sequences
+
+
+def analyze_in_segments(video_path, output_dir, kind, class_names, num_workers, sequence_length=16,
+                        progress_callback=None, save_frames=True, save_gifs=True, clip_format=None,
+                        timings=None):
+    """
+    Parallel counterpart of extract_frame_sequences / extract_nudity_sequences.
+
+    Args:
+        video_path: Path to the video file
+        output_dir: Directory for the annotated frames (and sequence clips)
+        kind: 'violence' or 'nudity'
+        class_names: Class names of the model
+        num_workers: Number of worker processes (and at most this many segments)
+        sequence_length: Window length for violence, run length for nudity sequences
+        progress_callback: Optional callable(increment) called as frames are decoded
+        save_frames: Keep the annotated frames in output_dir
+        save_gifs: Save clips of detected sequences
+        clip_format: 'gif', 'webp' or 'mp4' (BUDDYGUARD_CLIP_FORMAT by default)
+        timings: Optional StageTimings; the spans of all segments are added to it
+
+    Returns:
+        Same tuple as the serial extractors: (frame count, predictions per frame,
+        confidence scores by class, detected sequences)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    metadata = probe_video(video_path)
+    segments = plan_segments(metadata['frame_count'], num_workers)
+    clip_frames_dir = os.path.join(output_dir, CLIP_FRAMES_DIR) if save_gifs else None
+    tasks = [(video_path, output_dir, segment, save_frames, clip_frames_dir, sequence_length) for segment in segments]
+    segment_results = get_segment_pool(kind, num_workers).run(tasks, progress_callback)
+
+    frame_count = max(count for count, _, _ in segment_results)
+    predictions_per_frame = FramePredictions.concatenate(
+        [predictions for _, predictions, _ in segment_results], class_names
+    )
+    timings = timings or StageTimings()
+    for _, _, segment_timings in segment_results:
+        timings.merge(segment_timings)
+
+    clip_writer = ClipWriter(clip_format, timings=timings) if save_gifs else None
+    try:
+        if kind == 'violence':
+            video_name = os.path.splitext(os.path.basename(video_path))[0]
+            sequences = rebuild_violence_sequences(
+                predictions_per_frame, output_dir, sequence_length, video_name,
+                class_names, clip_writer, metadata['fps']
+            )
+            scores = summarize_violence_predictions(frame_count, predictions_per_frame, class_names)
+        else:
+            sequences = rebuild_nudity_sequences(predictions_per_frame, output_dir, sequence_length, clip_writer,
+                                                 metadata['fps'])
+            scores = summarize_nudity_predictions(predictions_per_frame)
+    finally:
+        if clip_writer:
+            clip_writer.close()
+        if clip_frames_dir:
+            shutil.rmtree(clip_frames_dir, ignore_errors=True)
+    return frame_count, predictions_per_frame, scores, sequences
+
+# END
+# ________________________________________________________________
@@ -0,0 +1,253 @@
+# src/pipeline.py
+
+
+# IMPORTS
+# ________________________________________________________________
+import os
+import time
+
+from src.instrumentation import StageTimings, log_timings
+from src.jobs import JobCancelled
+from src.metrics import (
+    ACTIVE_JOBS, FRAMES_CLASSIFIED, VIDEO_SECONDS, VIDEOS_PROCESSED, WHISPER_RTF, timed
+)
+from src.proc_audio import extract_audio, transcribe_audio
+from src.profiling import ModelProfiler
+from src.proc_nudity import extract_nudity_sequences
+from src.proc_text import classify_text
+from src.proc_video import combine_frames_to_video
+from src.parallel_video import SEGMENT_WORKERS, analyze_in_segments, can_run_in_parallel
+from src.proc_video_sequence import extract_frame_sequences
+from src.retention import remove_temp_files
+from src.utils import get_total_frames, get_video_duration, weighted_fusion, save_results
+
+VIOLENCE_MODE = "Violence + Audio Detection"
+NUDITY_MODE = "Nudity + Audio Detection"
+DETECTION_MODES = (VIOLENCE_MODE, NUDITY_MODE)
+
+
+def run_analysis(video_path, output_dir, models, mode=VIOLENCE_MODE, progress_callback=None,
+                 status_callback=None, cleanup=True, render_video=True, save_gifs=True, save_history=True,
+                 infer_fns=None, segment_workers=None, profile=False):
+    """Runs the full analysis pipeline (audio, text, visual, fusion) on one video.
+
+    This is the UI-independent core of the Upload page; it is used by the
+    background job workers.
+
+    Args:
+        video_path: Path to the video file
+        output_dir: Directory to store processed files
+        models: Dictionary of loaded models (see src.models_load.load_models)
+        mode: Detection mode (VIOLENCE_MODE or NUDITY_MODE)
+        progress_callback: Optional callable(done, total) called as work units complete
+        status_callback: Optional callable(message) called when a new stage starts
+        cleanup: Remove temporary audio and frame files once the results are saved
+        render_video: Write annotated frames and combine them into the processed video
+        save_gifs: Save GIFs of detected sequences
+        save_history: Store the results in the history database
+        infer_fns: Optional dict overriding model calls, with keys 'violence', 'nudity'
+            (infer_fn for the extractors) and 'bert' (forward_fn for classify_text)
+        segment_workers: Number of processes decoding and classifying frame segments in
+            parallel; defaults to BUDDYGUARD_SEGMENT_WORKERS. Short videos and modes
+            with an infer_fn override are always processed in this process.
+        profile: Record the model forward passes with the torch profiler and write a
+            Chrome trace and operator table to output_dir (see src/profiling.py); the
+            frames are then processed in this process
+
+    Returns:
+        Tuple of (results dictionary, processed video path or None when not rendered).
+        results['stage_timings'] holds the per-stage spans (see src/instrumentation.py);
+        the 'persist' span is only in the returned dict, as it is measured while saving.
+    """
+    start_time = time.time()
+    timings = StageTimings()
+    with timings.span("probe"):
+        total_work = get_total_frames(video_path) + 4  # Frames + audio, transcription, text and video stages
+    current_work = [0]
+
+    def update_progress(increment=1):
+        current_work[0] += increment
+        if progress_callback:
+            progress_callback(min(current_work[0], total_work), total_work)
+
+    def set_status(message):
+        if status_callback:
+            status_callback(message)
+
+    infer_fns = infer_fns or {}
+    profiler = None
+    if profile:
+        profiler = ModelProfiler(output_dir)
+        infer_fns = profiler.wrap_infer_fns(models, infer_fns)
+        profiler.start()
+    frames_path = os.path.join(output_dir, "processed_frames")
+    status = "failed"
+    ACTIVE_JOBS.inc()
+    try:
+        # Common processing steps for both modes
+        set_status("Extracting audio...")
+        audio_path = os.path.join(output_dir, "output_audio.wav")
+        with timings.span("audio", children=True):
+            extract_audio(video_path, audio_path)
+        update_progress()
+
+        set_status("Transcribing audio...")
+        with timings.span("transcription") as measured:
+            transcription = transcribe_audio(audio_path, models['whisper_model'])
+        audio_seconds = get_video_duration(video_path)
+        if audio_seconds > 0:
+            WHISPER_RTF.observe(measured["wall_seconds"] / audio_seconds)
+        update_progress()
+
+        set_status("Analyzing text content...")
+        with timings.span("text"):
+            text_label, harmful_conf_text, safe_conf_text, highlighted_text = classify_text(
+                transcription, models['bert_model'], models['tokenizer'], models['device'],
+                forward_fn=timed(infer_fns.get('bert') or models['bert_model'], "bert")
+            )
+        update_progress()
+
+        # Mode-specific video processing
+        set_status("Analyzing video frames...")
+        kind = 'violence' if mode == VIOLENCE_MODE else 'nudity'
+        segment_workers = segment_workers or SEGMENT_WORKERS
+        if kind not in infer_fns and can_run_in_parallel(video_path, segment_workers):
+            frame_count, predictions_per_frame, confidence_scores_by_class, harmful_sequences = analyze_in_segments(
+                video_path,
+                frames_path,
+                kind,
+                models[f'{kind}_class_names'],
+                segment_workers,
+                sequence_length=16,
+                progress_callback=update_progress,
+                save_frames=render_video,
+                save_gifs=save_gifs,
+                timings=timings,
+            )
+        elif mode == VIOLENCE_MODE:
+            frame_count, predictions_per_frame, confidence_scores_by_class, harmful_sequences = extract_frame_sequences(
+                video_path,
+                frames_path,
+                models['violence_model'],
+                models['violence_class_names'],
+                sequence_length=16,
+                progress_callback=update_progress,
+                save_frames=render_video,
+                save_gifs=save_gifs,
+                infer_fn=infer_fns.get('violence'),
+                timings=timings,
+            )
+        else:  # Nudity + Text mode
+            frame_count, predictions_per_frame, confidence_scores_by_class, harmful_sequences = extract_nudity_sequences(
+                video_path,
+                frames_path,
+                models['nudity_model'],
+                models['nudity_class_names'],
+                sequence_length=16,
+                progress_callback=update_progress,
+                save_frames=render_video,
+                save_gifs=save_gifs,
+                infer_fn=infer_fns.get('nudity'),
+                timings=timings,
+            )
+
+        if mode == VIOLENCE_MODE:
+            # Prepare scores for violence mode
+            harmful_score_visual = confidence_scores_by_class.get('Violence', 0.0)
+            safe_score_visual = confidence_scores_by_class.get('Safe', 0.0)
+        else:
+            # Prepare scores for nudity mode
+            harmful_score_visual = confidence_scores_by_class.get('nude', 0.0)
+            safe_score_visual = confidence_scores_by_class.get('safe', 0.0)
+
+        if profiler:
+            profiler.stop()  # No forward passes after this point
+        FRAMES_CLASSIFIED.labels(kind).inc(len(predictions_per_frame))
+
+        set_status("Calculating final results...")
+        bert_scores = {
+            'safe': safe_conf_text,
+            'harmful': harmful_conf_text
+        }
+
+        if mode == VIOLENCE_MODE:
+            visual_scores = {
+                'safe': safe_score_visual,
+                'harmful': harmful_score_visual
+            }
+        else:  # Nudity + Audio Detection mode
+            visual_scores = {
+                'safe': safe_score_visual,
+                'nude': harmful_score_visual  # Use 'nude' key for nudity mode
+            }
+
+        # Use mode-specific fusion
+        final_prediction, final_confidence = weighted_fusion(
+            bert_scores,
+            visual_scores,
+            mode="violence" if mode == VIOLENCE_MODE else "nudity"
+        )
+
+        processed_video_path = None
+        if render_video:
+            set_status("Generating processed video...")
+            processed_video_path = os.path.join(output_dir, f"processed_{os.path.basename(output_dir)}.mp4")
+            with timings.span("render", items=frame_count, children=True):
+                combine_frames_to_video(frames_path, processed_video_path, frame_count, audio_path)
+        update_progress()
+
+        # Prepare results dictionary
+        results = {
+            "mode": mode,
+            "harmful_score_visual": harmful_score_visual,
+            "safe_score_visual": safe_score_visual,
+            "visual_scores": visual_scores,
+            "harmful_conf_text": harmful_conf_text,
+            "safe_conf_text": safe_conf_text,
+            "bert_scores": bert_scores,
+            "final_prediction": final_prediction,
+            "final_confidence": final_confidence,
+            "transcription": transcription,
+            "highlighted_text": highlighted_text,
+            "processing_time": time.time() - start_time,
+            "frame_count": frame_count,
+        }
+        if profiler and os.path.exists(profiler.trace_path):
+            results["profile"] = {"trace": profiler.trace_path, "operators": profiler.table_path}
+
+        # Add mode-specific keys for backward compatibility
+        if mode == VIOLENCE_MODE:
+            results.update({
+                "harmful_score_resnet": harmful_score_visual,
+                "safe_score_resnet": safe_score_visual,
+                "resnet_scores": visual_scores
+            })
+        else:
+            results.update({
+                "nude_score": harmful_score_visual,
+                "safe_score_nudity": safe_score_visual
+            })
+
+        results["stage_timings"] = timings.as_dict()
+        if save_history:
+            with timings.span("persist"):
+                save_results(output_dir, os.path.basename(output_dir), results, predictions_per_frame)
+            results["stage_timings"] = timings.as_dict()
+        log_timings(os.path.basename(output_dir), mode, results["stage_timings"])
+        status = "ok"
+        return results, processed_video_path
+    except JobCancelled:
+        status = "cancelled"  # Counted apart so cancellations do not read as failures
+        raise
+    finally:
+        if profiler:
+            profiler.stop()
+        ACTIVE_JOBS.dec()
+        VIDEOS_PROCESSED.labels(mode, status).inc()
+        VIDEO_SECONDS.labels(mode).observe(time.time() - start_time)
+        # Temporary files are removed whether the job succeeded, failed or was cancelled
+        if cleanup:
+            remove_temp_files(output_dir)
+
+# END
+# ________________________________________________________________
@@ -0,0 +1,164 @@
+# src/predictions.py
+"""Columnar per-frame predictions.
+
+Each classified frame adds one entry to four NumPy columns: frame number
+(int32), class id (uint8), float32 confidence of the predicted class and
+float32 probability of the harmful class, 13 bytes against well over 100
+for a Python tuple with a class name string. The columns are saved as one
+uncompressed .npz next to the video's other outputs; the History timeline
+plots the stored harmful probability rather than deriving it from the label.
+"""
+
+
+# IMPORTS
+# ________________________________________________________________
+import os
+
+import numpy as np
+
+COLUMN_DTYPES = {
+    "frame": np.int32,
+    "class_id": np.uint8,
+    "confidence": np.float32,
+    "harmful_score": np.float32,  # NaN when unknown (predictions rebuilt from tuples)
+}
+PREDICTIONS_FILE = "predictions.npz"
+
+
+def _empty_columns(capacity=0):
+    return {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+
+
+class FramePredictions:
+    """
+    Per-frame predictions stored as one array per column.
+
+    Iterating yields (frame, class_name, confidence) tuples, so code written
+    for the old list of tuples keeps working; vectorized code uses the
+    frames / class_ids / confidences / harmful_scores columns instead.
+
+    Args:
+        class_names: Class names indexed by class id
+        columns: Optional dict of equally long arrays, one per COLUMN_DTYPES key
+        capacity: Initial capacity when columns is not given
+    """
+
+    def __init__(self, class_names, columns=None, capacity=1024):
+        self.class_names = list(class_names)
+        if columns is None:
+            self._columns = _empty_columns(capacity)
+            self._size = 0
+        else:
+            self._columns = {name: np.asarray(columns[name], dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+            self._size = len(self._columns["frame"])
+
+    @classmethod
+    def from_tuples(cls, predictions, class_names):
+        """Build from an iterable of (frame, class_name, confidence) tuples; harmful scores are unknown."""
+        if isinstance(predictions, cls):
+            return predictions
+        class_ids = {name: index for index, name in enumerate(class_names)}
+        rows = [(frame, class_ids[name], confidence) for frame, name, confidence in predictions]
+        frames, ids, confidences = zip(*rows) if rows else ((), (), ())
+        return cls(class_names, {"frame": frames, "class_id": ids, "confidence": confidences,
+                                 "harmful_score": np.full(len(rows), np.nan)})
+
+    @classmethod
+    def concatenate(cls, parts, class_names):
+        """Merge several FramePredictions into one, in frame order."""
+        if not parts:
+            return cls(class_names, _empty_columns())
+        columns = {name: np.concatenate([part.columns[name] for part in parts]) for name in COLUMN_DTYPES}
+        order = np.argsort(columns["frame"], kind="stable")
+        return cls(class_names, {name: values[order] for name, values in columns.items()})
+
+    @classmethod
+    def load(cls, path, class_names):
+        """Load a file written by save()."""
+        with np.load(path) as data:
+            return cls(class_names, {name: data[name] for name in COLUMN_DTYPES})
+
+    def append(self, frame, class_id, confidence, harmful_score=np.nan):
+        if self._size == len(self._columns["frame"]):
+            grown = _empty_columns(max(2 * self._size, 1024))
+            for name, values in self._columns.items():
+                grown[name][:self._size] = values[:self._size]
+            self._columns = grown
+        index = self._size
+        self._columns["frame"][index] = frame
+        self._columns["class_id"][index] = class_id
+        self._columns["confidence"][index] = confidence
+        self._columns["harmful_score"][index] = harmful_score
+        self._size += 1
+
+    def save(self, path):
+        """Write the predictions to `path` (.npz) atomically and return the path."""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:  # A file object keeps np.savez from appending .npz
+            np.savez(f, **self.columns)
+        os.replace(temp_path, path)
+        return path
+
+    @property
+    def columns(self):
+        """Dict of the filled part of every column."""
+        return {name: values[:self._size] for name, values in self._columns.items()}
+
+    @property
+    def frames(self):
+        return self._columns["frame"][:self._size]
+
+    @property
+    def class_ids(self):
+        return self._columns["class_id"][:self._size]
+
+    @property
+    def confidences(self):
+        return self._columns["confidence"][:self._size]
+
+    @property
+    def harmful_scores(self):
+        return self._columns["harmful_score"][:self._size]
+
+    def confidences_of(self, class_name):
+        """Confidences of the frames predicted as `class_name`."""
+        return self.confidences[self.class_ids == self.class_names.index(class_name)]
+
+    def __getstate__(self):
+        # Only the filled part is pickled (e.g. when returned from a worker process)
+        columns = {name: np.array(values) for name, values in self.columns.items()}
+        return {"class_names": self.class_names, "_columns": columns, "_size": self._size}
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        names = self.class_names
+        for frame, class_id, confidence in zip(self.frames.tolist(), self.class_ids.tolist(),
+                                               self.confidences.tolist()):
+            yield frame, names[class_id], confidence
+
+    def timeline(self, harmful_class, max_points=2000):
+        """
+        Probability of `harmful_class` per frame, max-pooled down to at most max_points.
+
+        The stored harmful probability is plotted as is. Only frames without
+        one (predictions rebuilt from tuples) fall back to the label: the
+        confidence for harmful frames, 1 - confidence for the others.
+
+        Returns:
+            Tuple of (frame numbers, harmful probabilities) arrays
+        """
+        confidences = self.confidences
+        harmful = self.class_ids == self.class_names.index(harmful_class)
+        from_label = np.where(harmful, confidences, 1.0 - confidences)
+        scores = np.where(np.isnan(self.harmful_scores), from_label, self.harmful_scores).astype(np.float32)
+        frames = self.frames
+        if len(scores) <= max_points:
+            return np.array(frames), scores
+        bin_size = -(-len(scores) // max_points)  # Ceiling division
+        padded = np.pad(scores, (0, -len(scores) % bin_size), constant_values=0.0)
+        return np.array(frames[::bin_size]), padded.reshape(-1, bin_size).max(axis=1)
+
+# END
+# ________________________________________________________________
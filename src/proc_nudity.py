@@ -2,13 +2,20 @@
 import datetime
 import os
 
-import imageio
 import torch
 import torchvision.transforms as transforms
 from PIL import Image
 import cv2
 import numpy as np
 
+from src.annotation import annotate_clip_frame, draw_label
+from src.clip_writer import ClipWriter, clip_frame
+from src.frame_pipeline import FramePipeline, FrameWriter
+from src.instrumentation import StageTimings
+from src.predictions import FramePredictions
+
+NUDITY_CLASSES = ('nude', 'safe')  # Class order of the nudity model
+
 
 def preprocess_frame_for_nudity(frame, transform):
     """Convert frame to tensor for nudity detection"""
@@ -16,27 +23,37 @@ def preprocess_frame_for_nudity(frame, transform):
     return transform(image).unsqueeze(0)
 
 
-def detect_nudity_in_frame(frame, model, transform, device, threshold=0.85):
-    """Detect nudity in a single frame with confidence threshold"""
+def nudity_label(probabilities, threshold=0.85):
+    """Turn one row of softmax probabilities into a (class, confidence) prediction"""
+    pred_idx = int(np.argmax(probabilities))
+    conf = float(probabilities[pred_idx])
+
+    # Only classify as nude if confidence exceeds threshold
+    if pred_idx == 0 and conf < threshold:  # 0 is 'nude' class
+        return 'safe', conf
+    return NUDITY_CLASSES[pred_idx], conf
+
+
+def detect_nudity_in_frame(frame, model, transform, device, threshold=0.85, infer_fn=None):
+    """Detect nudity in a single frame with confidence threshold
+
+    infer_fn, if given, replaces the direct model call (e.g. with a shared batcher).
+    """
     input_tensor = preprocess_frame_for_nudity(frame, transform).to(device)
 
     with torch.no_grad():
-        outputs = model(input_tensor)
-        probabilities = torch.nn.functional.softmax(outputs, dim=1)
-        confidence, preds = torch.max(probabilities, 1)
+        outputs = infer_fn(input_tensor) if infer_fn else model(input_tensor)
+        probabilities = torch.nn.functional.softmax(outputs, dim=1).cpu().numpy()
 
-    pred_idx = preds.item()
-    conf = confidence.item()
+    return nudity_label(probabilities[0], threshold)
 
-    # Only classify as nude if confidence exceeds threshold
-    if pred_idx == 0 and conf < threshold:  # 0 is 'nude' class
-        return 'safe', conf
-    return ['nude', 'safe'][pred_idx], conf
 
+def annotate_frame(frame, pred_class, confidence, frame_count, fps, in_place=False):
+    """Add annotation to frame showing detection results
 
-def annotate_frame(frame, pred_class, confidence, frame_count, fps):
-    """Add annotation to frame showing detection results"""
-    annotated_frame = frame.copy()
+    With in_place=True the annotation is drawn into `frame` itself instead of a copy.
+    """
+    annotated_frame = frame if in_place else frame.copy()
 
     # Set text color based on prediction
     if pred_class == 'nude':
@@ -50,8 +67,7 @@ def annotate_frame(frame, pred_class, confidence, frame_count, fps):
     timestamp = str(datetime.timedelta(seconds=frame_count / fps)).split('.')[0]
 
     # Add prediction label
-    cv2.putText(annotated_frame, label, (20, 40),
-                cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2)
+    draw_label(annotated_frame, label, (20, 40), 1, color, 2, cv2.LINE_8)
 
     # Add frame counter
     cv2.putText(annotated_frame, f"Frame: {frame_count}", (20, 80),
@@ -64,10 +80,43 @@ def annotate_frame(frame, pred_class, confidence, frame_count, fps):
     return annotated_frame
 
 
+def nudity_clip_annotator(fps):
+    """Annotation callable for ClipWriter.start; Clip.add then takes (frame, confidence, frame_number)"""
+    def annotate(frame, confidence, frame_number):
+        return annotate_clip_frame(frame, f"Nudity ({confidence:.2f})", (0, 0, 255), frame_number, fps)
+    return annotate
+
+
+def summarize_nudity_predictions(predictions_per_frame):
+    """Average confidence per class over FramePredictions (or (frame, class, confidence) tuples)"""
+    predictions = FramePredictions.from_tuples(predictions_per_frame, NUDITY_CLASSES)
+    nude = predictions.confidences_of('nude').astype(np.float64)
+    safe = predictions.confidences_of('safe').astype(np.float64)
+    return {
+        'nude': float(nude.mean()) if len(nude) else 0.0,
+        'safe': float(safe.mean()) if len(safe) else 1.0
+    }
+
+
 def extract_nudity_sequences(video_path, output_dir, model, class_names,
-                             sequence_length=16, threshold=0.85, progress_callback=None):
-    """Extract sequences with potential nudity"""
+                             sequence_length=16, threshold=0.85, progress_callback=None,
+                             save_frames=True, save_gifs=True, infer_fn=None, frame_range=None,
+                             batch_size=1, clip_format=None, timings=None, clip_frames_dir=None):
+    """Extract sequences with potential nudity
+
+    save_frames and save_gifs can be turned off for headless runs that only
+    need the predictions. frame_range, if given, is an inclusive (start, end)
+    pair of 1-based frame numbers (end may be None) limiting the frames read.
+    batch_size frames are classified per forward pass when they are ready.
+    Sequence clips are encoded in the background as clip_format ('gif',
+    'webp' or 'mp4'; BUDDYGUARD_CLIP_FORMAT by default). Stage spans are
+    added to `timings`, a StageTimings, when given. clip_frames_dir, if
+    given, receives an unlabelled clip-sized copy of every nude frame, from
+    which src/parallel_video.py rebuilds the clips.
+    """
     os.makedirs(output_dir, exist_ok=True)
+    if clip_frames_dir:
+        os.makedirs(clip_frames_dir, exist_ok=True)
     cap = cv2.VideoCapture(video_path)
     fps = cap.get(cv2.CAP_PROP_FPS)
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -80,66 +129,89 @@ def extract_nudity_sequences(video_path, output_dir, model, class_names,
         transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
     ])
 
-    frame_count = 0
-    sequence_buffer = []
+    start_frame, end_frame = frame_range or (1, None)
+    if start_frame > 1:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame - 1)
+
+    frame_count = start_frame - 1
+    current_clip = None  # Clip the current run of nude frames is streamed into
+    run_length = 0
     nudity_sequences = []
-    predictions_per_frame = []
-    confidence_scores = {'nude': [], 'safe': []}
+    predictions_per_frame = FramePredictions(NUDITY_CLASSES)  # Columnar, see src/predictions.py
     device = next(model.parameters()).device
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        frame_count += 1
-
-        # Classify frame
-        pred_class, confidence = detect_nudity_in_frame(
-            frame, model, transform, device, threshold
-        )
-
-        # Annotate frame with detection results
-        annotated_frame = annotate_frame(frame, pred_class, confidence, frame_count, fps)
-
-        # Save annotated frame
-        output_path = os.path.join(output_dir, f"frame_{frame_count:04d}.jpg")
-        cv2.imwrite(output_path, annotated_frame)
-
-        if progress_callback:
-            progress_callback()
-
-        predictions_per_frame.append((frame_count, pred_class, confidence))
-        confidence_scores[pred_class].append(confidence)
-
-        # Store frame if nudity detected
-        if pred_class == 'nude':
-            sequence_buffer.append(annotated_frame.copy())
-
-            # When we have a full sequence
-            if len(sequence_buffer) >= sequence_length:
-                # Create GIF for the detected sequence
-                gif_path = os.path.join(output_dir, f"nudity_sequence_{frame_count}.gif")
-                imageio.mimsave(gif_path, sequence_buffer, duration=200, loop=0)
-
-                nudity_sequences.append({
-                    'start_frame': frame_count - sequence_length + 1,
-                    'end_frame': frame_count,
-                    'confidence': confidence,
-                    'frames': sequence_buffer.copy(),
-                    'type': 'nudity',
-                    'gif_path': gif_path
-                })
-                sequence_buffer = []
-        else:
-            sequence_buffer = []
-
-    cap.release()
+    timings = timings or StageTimings()
+
+    def preprocess(frame):
+        return transform(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+
+    annotate_clip = nudity_clip_annotator(fps)
+
+    # Decoding, preprocessing and inference run in background threads (src/frame_pipeline.py)
+    writer = FrameWriter(timings=timings) if save_frames or clip_frames_dir else None
+    clip_writer = ClipWriter(clip_format, timings=timings) if save_gifs else None
+    pipeline = FramePipeline(
+        cap, preprocess, infer_fn or model, device,
+        first_frame=start_frame, end_frame=end_frame, batch_size=batch_size, timings=timings,
+        model_name="nudity",
+    )
+    try:
+        with pipeline:
+            for frame_count, frame, probabilities in pipeline:
+                # Classify frame
+                pred_class, confidence = nudity_label(probabilities, threshold)
+
+                # Stream a small copy into the clip if nudity detected; only the run length is kept here
+                if pred_class == 'nude':
+                    if run_length == 0 and save_gifs:
+                        current_clip = clip_writer.start(output_dir, annotate_clip)
+                    if current_clip:
+                        current_clip.add(frame, confidence, frame_count)
+                    if clip_frames_dir:
+                        writer.write(os.path.join(clip_frames_dir, f"frame_{frame_count:04d}.jpg"), clip_frame(frame))
+                    run_length += 1
+
+                    # When we have a full sequence
+                    if run_length >= sequence_length:
+                        # Create a clip for the detected sequence
+                        clip_path = current_clip.finish(f"nudity_sequence_{frame_count}") if current_clip else None
+
+                        nudity_sequences.append({
+                            'start_frame': frame_count - sequence_length + 1,
+                            'end_frame': frame_count,
+                            'confidence': confidence,
+                            'type': 'nudity',
+                            'clip_path': clip_path
+                        })
+                        current_clip = None
+                        run_length = 0
+                else:
+                    if current_clip:
+                        current_clip.discard()
+                    current_clip = None
+                    run_length = 0
+
+                # Annotate the decoded frame in place and save it; the clip already took its own copy
+                if save_frames:
+                    with timings.span("annotate"):
+                        annotate_frame(frame, pred_class, confidence, frame_count, fps, in_place=True)
+                    output_path = os.path.join(output_dir, f"frame_{frame_count:04d}.jpg")
+                    writer.write(output_path, frame)
+
+                if progress_callback:
+                    progress_callback()
+
+                predictions_per_frame.append(frame_count, NUDITY_CLASSES.index(pred_class), confidence,
+                                             float(probabilities[NUDITY_CLASSES.index('nude')]))
+    finally:
+        cap.release()
+        if writer:
+            writer.close()  # All frames are on disk before they are combined
+        if clip_writer:
+            if current_clip:
+                current_clip.discard()  # Run too short to be a sequence
+            clip_writer.close()
 
     # Calculate average confidence
-    avg_confidence = {
-        'nude': np.mean(confidence_scores['nude']) if confidence_scores['nude'] else 0.0,
-        'safe': np.mean(confidence_scores['safe']) if confidence_scores['safe'] else 1.0
-    }
+    avg_confidence = summarize_nudity_predictions(predictions_per_frame)
 
     return frame_count, predictions_per_frame, avg_confidence, nudity_sequences
\ No newline at end of file
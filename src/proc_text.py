@@ -7,13 +7,14 @@ import numpy as np
 import torch
 import torch.nn.functional as F
 
-def classify_text(transcription, bert_model, tokenizer, device):
+def classify_text(transcription, bert_model, tokenizer, device, forward_fn=None):
+    """Classify the transcript with BERT; forward_fn can replace the model call (e.g. a shared batcher)."""
     bert_model.eval()
     text = " ".join(segment["text"] for segment in transcription)
     inputs = tokenizer(text, truncation=True, padding=True, return_tensors="pt").to(device)
 
     with torch.no_grad():
-        logits, attentions = bert_model(
+        logits, attentions = (forward_fn or bert_model)(
             input_ids=inputs['input_ids'],
             attention_mask=inputs['attention_mask']
         )
@@ -1,28 +1,94 @@
 # proc_video_sequence.py
 
 import cv2
+import logging
 import os
 import numpy as np
-import torch
 from torchvision import transforms
 from PIL import Image
-from src.utils import preprocess_image, save_sequence_as_gif
+from src.frame_pipeline import FramePipeline, FrameWriter
+from src.instrumentation import StageTimings
+from src.annotation import draw_label
+from src.clip_writer import ClipWriter, clip_frame
+from src.predictions import FramePredictions
+from src.utils import sequence_clip_annotator
+
+VIOLENCE_CLASSES = ('Safe', 'Violence')
+
+
+def summarize_violence_predictions(total_frames, predictions_per_frame, class_names=VIOLENCE_CLASSES,
+                                   sequence_threshold=0.5):
+    """
+    Turn per-frame violence predictions into the final Safe/Violence scores.
+
+    Args:
+        total_frames: Number of decoded frames
+        predictions_per_frame: FramePredictions (or (frame, class name, confidence) tuples)
+        class_names: Class names of the model
+        sequence_threshold: Confidence above which a violent window counts as a sequence
+
+    Returns:
+        Dict with 'Safe' and 'Violence' scores summing to 1
+    """
+    predictions = FramePredictions.from_tuples(predictions_per_frame, class_names)
+    violent_confidences = predictions.confidences_of('Violence').astype(np.float64)
+    violent_frames = len(violent_confidences)
+    # Every confident violent window counts as one detected sequence
+    num_violence_sequences = int(np.count_nonzero(violent_confidences > sequence_threshold))
+
+    # Calculate frame-level percentages
+    violent_percentage = violent_frames / total_frames if total_frames > 0 else 0.0
+
+    # Calculate average confidence for violent frames only
+    avg_violent_confidence = float(violent_confidences.mean()) if violent_frames > 0 else 0.0
+
+    # Add sequence-based penalty
+    sequence_penalty = min(num_violence_sequences * 0.1, 0.5)  # 10% per sequence, max 50%
+    final_violence_score = min(violent_percentage * avg_violent_confidence + sequence_penalty, 1.0)
+
+    return {
+        'Safe': 1 - final_violence_score,
+        'Violence': final_violence_score
+    }
 
 
 def extract_frame_sequences(video_path, output_dir, model, class_names, sequence_length=10,
-                          batch_size=1, progress_callback=None):
+                          batch_size=1, progress_callback=None, save_frames=True, save_gifs=True,
+                          infer_fn=None, frame_range=None, clip_format=None, timings=None,
+                          clip_frames_dir=None):
+    """
+    Classify every frame of a video with a sliding window of `sequence_length` frames.
+
+    frame_range, if given, is an inclusive (start, end) pair of 1-based frame
+    numbers (end may be None for "until the end"); only those frames are
+    predicted and saved. Up to sequence_length - 1 frames before `start` are
+    decoded first so the first windows match a full run of the video.
+
+    Detected sequences are encoded by a background ClipWriter as
+    clip_format ('gif', 'webp' or 'mp4'; BUDDYGUARD_CLIP_FORMAT by default).
+    Stage spans (decode, preprocess, inference, annotate, encode, gif) are
+    added to `timings`, a StageTimings, when given.
+
+    clip_frames_dir, if given, receives an unlabelled clip-sized copy of every
+    violent frame, from which src/parallel_video.py rebuilds the clips.
+    """
     os.makedirs(output_dir, exist_ok=True)
+    if clip_frames_dir:
+        os.makedirs(clip_frames_dir, exist_ok=True)
     cap = cv2.VideoCapture(video_path)
     fps = cap.get(cv2.CAP_PROP_FPS)  # Get frames per second
     video_name = os.path.splitext(os.path.basename(video_path))[0]  # Get video name
 
-    frame_count = 0
-    sequence_buffer = []
+    start_frame, end_frame = frame_range or (1, None)
+    first_frame = max(start_frame - (sequence_length - 1), 1)
+    if first_frame > 1:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first_frame - 1)
+
+    frame_count = first_frame - 1
     harmful_sequences = []
-    predictions_per_frame = []
-    confidence_scores_by_class = {class_name: [] for class_name in class_names}  # This is correct
-    violence_sequences = []
+    predictions_per_frame = FramePredictions(class_names)  # Columnar, see src/predictions.py
     device = next(model.parameters()).device
+    timings = timings or StageTimings()
 
     # Define transforms
     transform = transforms.Compose([
@@ -41,118 +107,100 @@ def extract_frame_sequences(video_path, output_dir, model, class_names, sequence
         # Add GIF tracking variables
 
     gif_output_dir = os.path.join(output_dir, "detected_sequences")
-    current_sequence = []
-    current_preds = []
-    current_probs = []
-    current_frame_nums = []
+    annotate_clip = sequence_clip_annotator(fps, class_names)
+    # The current run of violent frames; its pixels are streamed to the clip writer, not kept here
+    current_clip = None
+    current_start = current_end = None
+    current_length = 0
+    current_max_conf = 0.0
     sequence_id = 0
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        frame_count += 1
-        output_path = os.path.join(output_dir, f"frame_{frame_count:04d}.jpg")
-
-        # Save EVERY frame immediately
-        cv2.imwrite(output_path, frame)
-
-        if progress_callback:
-            progress_callback()
-
-        processed_frame = preprocess_frame(frame)
-        sequence_buffer.append(processed_frame)
-
-        if len(sequence_buffer) >= sequence_length:
-            input_batch = torch.stack(sequence_buffer[-sequence_length:]).unsqueeze(0).to(device)
-
-            with torch.no_grad():
-                outputs = model(input_batch)
-                probs = torch.nn.functional.softmax(outputs, dim=1).cpu().numpy()
-                pred = np.argmax(probs, axis=1)[0]
-                confidence = float(probs[0][pred])  # Convert to Python float immediately
-
-            predicted_class_name = class_names[pred]
-            predictions_per_frame.append((frame_count, predicted_class_name, confidence))
-
-            # This is safe because we initialized it as a list
-            confidence_scores_by_class[predicted_class_name].append(confidence)
-
-            if pred == 1:  # Violence detected
-                current_sequence.append(frame.copy())
-                current_preds.append(pred)
-                current_probs.append(confidence)
-                current_frame_nums.append(frame_count)
-            elif len(current_sequence) >= sequence_length:
-                # Save completed violence sequence
-                gif_path = save_sequence_as_gif(
-                    current_sequence, current_preds, current_probs,
-                    current_frame_nums, fps, gif_output_dir,
-                    sequence_id, video_name, class_names
-                )
-                print(f"Saved sequence {sequence_id} to {gif_path}")
-                sequence_id += 1
-                current_sequence = []
-                current_preds = []
-                current_probs = []
-                current_frame_nums = []
-
-            if predicted_class_name == "Violence" and confidence > 0.5:
-                violence_sequences.append({
-                    "start_frame": frame_count - sequence_length + 1,
-                    "end_frame": frame_count,
-                    "confidence": confidence,
-                    "frames": sequence_buffer[-sequence_length:],
-                    "type": "violence"
-                })
-
-            # Save the current frame with annotation
-            output_frame = frame.copy()
-            text = f"{predicted_class_name} ({confidence:.2f})"
-            color = (0, 255, 0) if pred == 0 else (0, 0, 255)  # Green/Red
-            cv2.putText(output_frame, text, (50, 50),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2, cv2.LINE_AA)
-
-            # Save frame
-            output_path = os.path.join(output_dir, f"frame_{frame_count:04d}.jpg")
-            cv2.imwrite(output_path, output_frame)
-
-    cap.release()
-
-    # With this:
-    total_frames = frame_count
-    violent_frames = len(confidence_scores_by_class.get('Violence', []))
-    safe_frames = total_frames - violent_frames
-
-    # Calculate frame-level percentages
-    safe_percentage = safe_frames / total_frames if total_frames > 0 else 1.0
-    violent_percentage = violent_frames / total_frames if total_frames > 0 else 0.0
-
-    # Calculate average confidence for violent frames only
-    avg_violent_confidence = np.mean(confidence_scores_by_class.get('Violence', [])) if violent_frames > 0 else 0.0
-
-    # Combine metrics
-    avg_confidence = {
-        'Safe': safe_percentage * 100,
-        'Violence': violent_percentage * avg_violent_confidence * 100  # Weight by both frequency and confidence
-    }
-    # Add sequence-based penalty (NEW CODE)
-    sequence_penalty = min(len(violence_sequences) * 0.1, 0.5)  # 10% per sequence, max 50%
-    final_violence_score = min(violent_percentage * avg_violent_confidence + sequence_penalty, 1.0)
+    def record_sequence():
+        clip_path = current_clip.finish(f"{video_name}_seq_{sequence_id}_{class_names[1]}") if current_clip else None
+        harmful_sequences.append({
+            "start_frame": current_start,
+            "end_frame": current_end,
+            "confidence": current_max_conf,
+            "type": "violence",
+            "clip_path": clip_path
+        })
+        return clip_path
+
+    # Decoding, preprocessing and inference run in background threads (src/frame_pipeline.py);
+    # frames arrive here in order together with the prediction for the window ending on them
+    writer = FrameWriter(timings=timings) if save_frames or clip_frames_dir else None
+    clip_writer = ClipWriter(clip_format, timings=timings) if save_gifs else None
+    pipeline = FramePipeline(
+        cap, preprocess_frame, infer_fn or model, device, window=sequence_length,
+        first_frame=first_frame, start_frame=start_frame, end_frame=end_frame, batch_size=batch_size,
+        timings=timings, model_name="violence",
+    )
+    try:
+        with pipeline:
+            for frame_count, frame, probs in pipeline:
+                output_path = os.path.join(output_dir, f"frame_{frame_count:04d}.jpg")
+
+                # Frames before the window is full are saved without a label
+                if save_frames and probs is None:
+                    writer.write(output_path, frame)
+
+                if progress_callback:
+                    progress_callback()
+
+                if probs is None:
+                    continue  # Window not full yet
+
+                pred = np.argmax(probs)
+                confidence = float(probs[pred])  # Convert to Python float immediately
+
+                predicted_class_name = class_names[pred]
+                predictions_per_frame.append(frame_count, pred, confidence, float(probs[1]))  # 1 is Violence
+
+                if pred == 1:  # Violence detected
+                    if current_length == 0:
+                        current_start = frame_count
+                        current_clip = clip_writer.start(gif_output_dir, annotate_clip) if save_gifs else None
+                    if current_clip:
+                        current_clip.add(frame, pred, confidence, frame_count)
+                    if clip_frames_dir:
+                        writer.write(os.path.join(clip_frames_dir, f"frame_{frame_count:04d}.jpg"), clip_frame(frame))
+                    current_length += 1
+                    current_end = frame_count
+                    current_max_conf = max(current_max_conf, confidence)
+                elif current_length >= sequence_length:
+                    # Save completed violence sequence
+                    clip_path = record_sequence()
+                    if clip_path:
+                        logging.info(f"Queued sequence {sequence_id} as {clip_path}")
+                    sequence_id += 1
+                    current_clip = None
+                    current_length = 0
+                    current_max_conf = 0.0
+
+                # Save the current frame with annotation, drawn straight into the decoded
+                # buffer; the clip above already took its own small copy
+                if save_frames:
+                    with timings.span("annotate"):
+                        text = f"{predicted_class_name} ({confidence:.2f})"
+                        color = (0, 255, 0) if pred == 0 else (0, 0, 255)  # Green/Red
+                        draw_label(frame, text, (50, 50), 1, color, 2, cv2.LINE_AA)
+
+                    # Save frame
+                    writer.write(output_path, frame)
+
+        # Save any remaining sequence at the end
+        if current_length >= sequence_length:
+            record_sequence()
+        elif current_clip:
+            current_clip.discard()
+    finally:
+        cap.release()
+        if writer:
+            writer.close()  # All frames are on disk before they are combined
+        if clip_writer:
+            clip_writer.close()
 
     # Update the confidence scores to use the final adjusted score
-    confidence_scores_by_class = {
-        'Safe': 1 - final_violence_score,
-        'Violence': final_violence_score
-    }
-
-    # Save any remaining sequence at the end
-    if len(current_sequence) >= sequence_length:
-        gif_path = save_sequence_as_gif(
-            current_sequence, current_preds, current_probs,
-            current_frame_nums, fps, gif_output_dir,
-            sequence_id, video_name, class_names
-        )
+    confidence_scores_by_class = summarize_violence_predictions(frame_count, predictions_per_frame, class_names)
 
     return frame_count, predictions_per_frame, confidence_scores_by_class, harmful_sequences
\ No newline at end of file
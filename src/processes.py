@@ -0,0 +1,28 @@
+# src/processes.py
+"""Shared multiprocessing setup for the worker pools.
+
+The job workers (src/jobs.py), the batch CLI (src/batch.py), the segment
+workers (src/parallel_video.py) and the benchmark (src/benchmark.py) all
+start their processes from spawn_context().
+"""
+
+
+# IMPORTS
+# ________________________________________________________________
+import multiprocessing
+
+
+def spawn_context():
+    """
+    Multiprocessing context for processes that load the models.
+
+    A forked child inherits the parent's CUDA state, which cannot be
+    re-initialised, so CUDA fails in it once the parent has touched the GPU.
+    A spawned child starts a fresh interpreter and initialises CUDA itself.
+    It also avoids inheriting the parent's threads (pipeline, clip writer
+    and sweeper threads) in a forked, possibly locked state.
+    """
+    return multiprocessing.get_context("spawn")
+
+# END
+# ________________________________________________________________
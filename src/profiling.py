@@ -0,0 +1,113 @@
+# src/profiling.py
+"""Optional torch profiler capture of the model forward passes of one job.
+
+The vision and BERT models are wrapped as infer_fns (the same hook the
+request batcher uses), so every forward pass is one profiler step. Only a
+bounded window of steps is recorded (schedule: skip, warm up, record), which
+keeps the overhead on long videos to a handful of batches; by default the
+BERT pass and the first frame batch are skipped and warm up, and the next
+16 frame batches are recorded. When the window closes, or the job ends
+first, a Chrome trace (open in chrome://tracing or Perfetto) and an
+operator summary table are written to the video's output directory.
+
+The torch profiler only sees the thread it was started in, so while a job is
+profiled its forward passes are handed to one profiler thread (with the
+caller's grad mode) instead of running in the frame pipeline's thread.
+"""
+
+
+# IMPORTS
+# ________________________________________________________________
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from torch.profiler import ProfilerActivity, profile, record_function, schedule
+
+PROFILE_TRACE_FILE = "profile_trace.json"
+PROFILE_TABLE_FILE = "profile_ops.txt"
+PROFILE_WAIT_STEPS = 1
+PROFILE_WARMUP_STEPS = 1
+PROFILE_ACTIVE_STEPS = 16
+
+
+class ModelProfiler:
+    """
+    Profile the forward passes of one analysis run; call start() and stop() around it.
+
+    Args:
+        output_dir: Directory the trace and operator table are written to
+        active_steps: Number of forward passes recorded
+        wait_steps: Forward passes skipped before warming up
+        warmup_steps: Forward passes run with the profiler on but not recorded
+    """
+
+    def __init__(self, output_dir, active_steps=PROFILE_ACTIVE_STEPS, wait_steps=PROFILE_WAIT_STEPS,
+                 warmup_steps=PROFILE_WARMUP_STEPS):
+        self.trace_path = os.path.join(output_dir, PROFILE_TRACE_FILE)
+        self.table_path = os.path.join(output_dir, PROFILE_TABLE_FILE)
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        self._profiler = profile(
+            activities=activities,
+            schedule=schedule(wait=wait_steps, warmup=warmup_steps, active=active_steps, repeat=1),
+            on_trace_ready=self._save,
+            record_shapes=True,
+        )
+        self._window = wait_steps + warmup_steps + active_steps
+        self._steps = 0
+        self._running = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profiler")
+
+    def start(self):
+        self._executor.submit(self._profiler.start).result()
+        self._running = True
+
+    def stop(self):
+        """Stop profiling and write the outputs if steps were recorded; safe to call twice."""
+        if self._running:
+            self._running = False
+            try:
+                self._executor.submit(self._profiler.stop).result()
+            finally:
+                self._executor.shutdown()
+
+    def wrap(self, name, fn):
+        """Callable running fn as one profiler step labelled `name`."""
+        def profiled(*args, **kwargs):
+            if not self._running or self._steps >= self._window:
+                return fn(*args, **kwargs)  # Outside the recorded window: no hand-off
+            return self._executor.submit(self._step, name, fn, torch.is_grad_enabled(), args, kwargs).result()
+        return profiled
+
+    def wrap_infer_fns(self, models, infer_fns=None):
+        """infer_fns for run_analysis with every model call (or existing override) profiled."""
+        infer_fns = dict(infer_fns or {})
+        for key, model in (('violence', models['violence_model']), ('nudity', models['nudity_model']),
+                           ('bert', models['bert_model'])):
+            infer_fns[key] = self.wrap(f"{key}_forward", infer_fns.get(key) or model)
+        return infer_fns
+
+    def _step(self, name, fn, grad_enabled, args, kwargs):
+        with torch.set_grad_enabled(grad_enabled), record_function(name):
+            output = fn(*args, **kwargs)
+        self._profiler.step()
+        self._steps += 1
+        return output
+
+    def _save(self, prof):
+        try:
+            os.makedirs(os.path.dirname(self.trace_path) or ".", exist_ok=True)
+            prof.export_chrome_trace(self.trace_path)
+            sort_by = "self_cuda_time_total" if torch.cuda.is_available() else "self_cpu_time_total"
+            table = prof.key_averages(group_by_input_shape=True).table(sort_by=sort_by, row_limit=40)
+            with open(self.table_path, "w") as f:
+                f.write(table)
+            logging.info(f"Profiler trace written to {self.trace_path}")
+        except Exception as e:
+            logging.warning(f"Couldn't write profiler output: {str(e)}")
+
+# END
+# ________________________________________________________________
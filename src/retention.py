@@ -0,0 +1,213 @@
+# src/retention.py
+
+
+# IMPORTS
+# ________________________________________________________________
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+from src.clip_writer import CLIP_EXTENSIONS
+from src.utils import get_history_store
+
+OUTPUT_ROOT = "output"
+REPORTS_ROOT = os.path.join("saves", "reports")
+ORPHAN_GRACE_SECONDS = 24 * 60 * 60  # Output folders never saved to history
+# Work roots of the command line tools under output/ (src/batch.py, src/api.py, src/benchmark.py);
+# they hold many jobs each and are never swept as orphans
+TOOL_ROOTS = frozenset({"batch", "api", "benchmark"})
+
+
+class RetentionPolicy:
+    """Limits applied to processed video history; None disables a limit."""
+
+    def __init__(self, max_entries=5, max_age_seconds=None, max_disk_bytes=None):
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.max_disk_bytes = max_disk_bytes
+
+    @classmethod
+    def from_env(cls):
+        """Build a policy from BUDDYGUARD_MAX_ENTRIES, BUDDYGUARD_MAX_AGE_DAYS and BUDDYGUARD_MAX_DISK_MB."""
+        max_entries = _env_number("BUDDYGUARD_MAX_ENTRIES", 5, int)
+        max_age_days = _env_number("BUDDYGUARD_MAX_AGE_DAYS", None, float)
+        max_disk_mb = _env_number("BUDDYGUARD_MAX_DISK_MB", None, float)
+        return cls(
+            max_entries=max_entries,
+            max_age_seconds=max_age_days * 86400 if max_age_days is not None else None,
+            max_disk_bytes=int(max_disk_mb * 1024 * 1024) if max_disk_mb is not None else None,
+        )
+
+
+def directory_size(path):
+    """Total size in bytes of all files below path."""
+    total = 0
+    if not os.path.isdir(path):
+        return os.path.getsize(path) if os.path.isfile(path) else 0
+    stack = [path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            total += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total
+
+
+def video_paths(video_name):
+    """Directories on disk that belong to a processed video."""
+    base_name = os.path.splitext(video_name)[0]
+    return [os.path.join(OUTPUT_ROOT, base_name), os.path.join(REPORTS_ROOT, base_name)]
+
+
+def video_disk_usage(video_name):
+    return sum(directory_size(path) for path in video_paths(video_name))
+
+
+def remove_temp_files(output_dir):
+    """Remove temporary files after video processing while preserving essential results."""
+    temp_files = [
+        os.path.join(output_dir, "video.mp4"),  # Original video
+        os.path.join(output_dir, "output_audio.wav"),  # Temporary audio
+        os.path.join(output_dir, f"{os.path.basename(output_dir)}.mp4")  # Original uploaded file if exists
+    ]
+    frames_dir = os.path.join(output_dir, "processed_frames")
+
+    for file_path in temp_files:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+            logging.info(f"Removed temporary file: {file_path}")
+
+    # Remove frame images but keep the sequence clips and the directory itself
+    if os.path.isdir(frames_dir):
+        with os.scandir(frames_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith(CLIP_EXTENSIONS):
+                    try:
+                        os.remove(entry.path)
+                    except OSError as e:
+                        logging.warning(f"Couldn't remove {entry.path}: {str(e)}")
+
+
+class DiskJanitor(threading.Thread):
+    """Background thread that enforces the retention policy.
+
+    Passes are requested with wake() and picked up here, so cleanup never
+    adds latency to an analysis. A full retention pass also runs every
+    `interval` seconds and refreshes the per-video disk usage report.
+    """
+
+    def __init__(self, policy=None, store=None, interval=300):
+        super().__init__(name="buddyguard-janitor", daemon=True)
+        self.policy = policy or RetentionPolicy.from_env()
+        self.store = store or get_history_store()
+        self.interval = interval
+        self.usage = {}  # video name -> bytes, refreshed on every pass
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+
+    def wake(self):
+        """Request a retention pass as soon as possible."""
+        self._tasks.put(None)
+
+    def run(self):
+        while True:
+            try:
+                self._tasks.get(timeout=self.interval)
+            except queue.Empty:
+                pass
+            try:
+                self.enforce()
+            except Exception as e:
+                logging.warning(f"Janitor pass failed: {str(e)}")
+
+    def enforce(self, now=None):
+        """Apply the retention policy once and return the names of removed videos."""
+        with self._lock:
+            now = time.time() if now is None else now
+            policy = self.policy
+            entries = self.store.list_summaries()  # Newest first
+            usage = {entry['name']: video_disk_usage(entry['name']) for entry in entries}
+
+            expired = []
+            kept_bytes = 0
+            # The newest entry is always kept so a fresh result is never removed
+            for index, entry in enumerate(entries):
+                too_many = policy.max_entries is not None and index >= policy.max_entries
+                too_old = (policy.max_age_seconds is not None
+                           and now - entry['created_at'] > policy.max_age_seconds)
+                too_big = (policy.max_disk_bytes is not None
+                           and kept_bytes + usage[entry['name']] > policy.max_disk_bytes)
+                if index > 0 and (too_many or too_old or too_big):
+                    expired.append(entry['name'])
+                else:
+                    kept_bytes += usage[entry['name']]
+
+            for video_name in expired:
+                self._remove_video(video_name)
+                usage.pop(video_name, None)
+
+            self._remove_orphans(now, set(usage))
+            self.usage = usage
+            return expired
+
+    def _remove_video(self, video_name):
+        self.store.delete(video_name)
+        for path in video_paths(video_name):
+            try:
+                if os.path.exists(path):
+                    shutil.rmtree(path)
+            except Exception as e:
+                logging.warning(f"Could not clean up {path}: {str(e)}")
+        logging.info(f"Retention removed {video_name}")
+
+    def _remove_orphans(self, now, known_names):
+        """Remove per-video output folders that were never saved to history once they are stale."""
+        if not os.path.isdir(OUTPUT_ROOT):
+            return
+        known_dirs = {os.path.splitext(name)[0] for name in known_names}
+        with os.scandir(OUTPUT_ROOT) as entries:
+            for entry in entries:
+                if not entry.is_dir() or entry.name in known_dirs or entry.name in TOOL_ROOTS:
+                    continue
+                if now - entry.stat().st_mtime > ORPHAN_GRACE_SECONDS:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    logging.info(f"Removed orphaned output folder {entry.path}")
+
+
+_janitor = None
+_janitor_lock = threading.Lock()
+
+
+def get_janitor():
+    """Return the process-wide janitor, starting it on first use."""
+    global _janitor
+    with _janitor_lock:
+        if _janitor is None:
+            _janitor = DiskJanitor()
+            _janitor.start()
+            _janitor.wake()
+        return _janitor
+
+
+def _env_number(name, default, cast):
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    if value.strip().lower() == "none":
+        return None
+    return cast(value)
+
+# END
+# ________________________________________________________________
@@ -0,0 +1,127 @@
+# src/synthetic_video.py
+"""Synthetic test videos for benchmarks.
+
+Frames are a moving gradient with a few bouncing shapes and some noise, so
+the encoder and decoder do real work. The middle third of the video shows a
+large red block, which gives the benchmark stub models (see src/benchmark.py)
+something to detect, so sequence clips are produced as well. The optional
+audio track is a voiced, syllable-like tone pattern with pauses, close
+enough to speech for ASR and audio extraction timings.
+"""
+
+
+# IMPORTS
+# ________________________________________________________________
+import os
+import wave
+
+import cv2
+import ffmpeg
+import numpy as np
+
+RESOLUTIONS = {"360p": (640, 360), "720p": (1280, 720), "1080p": (1920, 1080)}
+AUDIO_SAMPLE_RATE = 16000
+
+
+def video_size(resolution, orientation="landscape"):
+    """(width, height) of a named resolution; portrait swaps the sides."""
+    width, height = RESOLUTIONS[resolution]
+    return (height, width) if orientation == "portrait" else (width, height)
+
+
+def render_frame(index, frame_total, width, height, rng):
+    """One BGR frame of the synthetic scene."""
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    shift = (index * 4) % 256
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[..., 0] = ((x + shift) % 256)[None, :]  # Blue gradient scrolling sideways
+    frame[..., 1] = 60
+    frame[..., 2] = 40
+    side = min(width, height)
+    for shape in range(3):
+        period = 40 + 17 * shape
+        phase = (index % period) / period
+        cx = int(width * (0.15 + 0.7 * abs(2 * phase - 1)))
+        cy = int(height * (0.2 + 0.25 * shape))
+        cv2.circle(frame, (cx, cy), side // 12, (255, 255 - 80 * shape, 80 * shape), -1)
+    if frame_total // 3 <= index < 2 * frame_total // 3:
+        # "Harmful" section: a red block covering most of the frame
+        cv2.rectangle(frame, (width // 10, height // 10), (width * 9 // 10, height * 9 // 10), (20, 20, 230), -1)
+    noise = rng.integers(0, 24, size=(height // 4, width // 4, 1), dtype=np.uint8)
+    noise = np.repeat(np.repeat(noise, 4, axis=0), 4, axis=1)
+    region = frame[:noise.shape[0], :noise.shape[1]]
+    np.add(region, np.minimum(noise, 255 - region), out=region)  # Saturating add
+    return frame
+
+
+def speech_like_audio(duration, sample_rate=AUDIO_SAMPLE_RATE, seed=0):
+    """Mono int16 samples: voiced harmonics at a syllable rate, in phrases separated by pauses."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    pitch = 120 + 30 * np.sin(2 * np.pi * 0.3 * t)  # Slowly gliding fundamental
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 2  # ~4 syllables per second
+    phrases = (np.sin(2 * np.pi * t / 5) > -0.5).astype(np.float32)  # Pause every 5 seconds
+    signal = voiced * syllables * phrases + 0.01 * rng.standard_normal(len(t))
+    return (signal / np.abs(signal).max() * 0.6 * 32767).astype(np.int16)
+
+
+def write_wav(path, samples, sample_rate=AUDIO_SAMPLE_RATE):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+
+
+def make_synthetic_video(path, resolution="720p", fps=30, duration=10, orientation="landscape",
+                         audio=True, seed=0):
+    """
+    Write a synthetic H.264 MP4 and return its path.
+
+    Args:
+        path: Output .mp4 path
+        resolution: '360p', '720p' or '1080p'
+        fps: Frame rate
+        duration: Length in seconds
+        orientation: 'landscape' or 'portrait'
+        audio: Add a speech-like AAC audio track
+        seed: Seed of the frame noise and audio
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    width, height = video_size(resolution, orientation)
+    frame_total = int(round(fps * duration))
+    rng = np.random.default_rng(seed)
+    raw_path = f"{path}.raw.mp4"
+    writer = cv2.VideoWriter(raw_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError("Failed to open video writer")
+    try:
+        for index in range(frame_total):
+            writer.write(render_frame(index, frame_total, width, height, rng))
+    finally:
+        writer.release()
+
+    wav_path = f"{path}.wav"
+    try:
+        # Re-encode as H.264 like typical uploads, muxing the audio track if requested
+        streams = [ffmpeg.input(raw_path).video]
+        if audio:
+            write_wav(wav_path, speech_like_audio(duration, seed=seed))
+            streams.append(ffmpeg.input(wav_path).audio)
+        (
+            ffmpeg
+            .output(*streams, path, vcodec='libx264', pix_fmt='yuv420p', preset='veryfast',
+                    acodec='aac', shortest=None)
+            .overwrite_output()
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+    finally:
+        for temp_path in (raw_path, wav_path):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return path
+
+# END
+# ________________________________________________________________
@@ -0,0 +1,93 @@
+# src/uploads.py
+
+
+# IMPORTS
+# ________________________________________________________________
+import os
+
+from src.video_probe import read_header_metadata
+
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB
+HEADER_PROBE_BYTES = 2 * 1024 * 1024  # First header probe once this much has arrived
+MAX_UPLOAD_BYTES = 500 * 1024 * 1024
+# Longest accepted video in seconds; raise it together with BUDDYGUARD_SEGMENT_WORKERS for long uploads
+MAX_VIDEO_SECONDS = float(os.environ.get("BUDDYGUARD_MAX_DURATION", "180"))
+
+
+def check_video_duration(duration, min_duration=10, max_duration=MAX_VIDEO_SECONDS):
+    """Raise ValueError when a video duration is outside the accepted range."""
+    if duration < min_duration:
+        raise ValueError(f"Video is too short ({duration:.1f} seconds). Minimum length is {min_duration} seconds.")
+    if max_duration is not None and duration > max_duration:
+        raise ValueError(f"Video is too long ({duration:.1f} seconds). Maximum length is {max_duration:g} seconds.")
+
+
+def stream_upload_to_disk(source, dest_path, validate=None, validate_partial=None, chunk_size=UPLOAD_CHUNK_SIZE,
+                          max_bytes=MAX_UPLOAD_BYTES, probe_after=HEADER_PROBE_BYTES):
+    """
+    Copy a file-like upload to disk chunk by chunk and validate it as early as possible.
+
+    If `validate_partial` is given, the container header is probed once
+    `probe_after` bytes have been written and again at doubling offsets until it
+    parses, so uploads that are clearly too long are rejected before the rest of
+    the file is copied. A partial file can only be checked against upper limits:
+    containers without a stored duration (MPEG-PS, some WebM and AVI files) get
+    a duration estimated from the bytes written so far, which is too short.
+    The complete file is always probed again and checked with `validate`.
+
+    This bounds memory only for true streams, such as the HTTP API's request body.
+    A Streamlit UploadedFile already holds the whole upload in memory; it is
+    written from slices of its buffer (getbuffer(), no copies), so peak memory is
+    the upload size either way and only the early rejection applies.
+
+    Args:
+        source: Readable binary file-like object (e.g. a Streamlit UploadedFile)
+        dest_path: Path of the file to create
+        validate: Optional callable receiving the metadata of the complete file; raises ValueError to reject
+        validate_partial: Optional callable receiving the metadata probed while copying, which may
+            underestimate the duration; raises ValueError to reject early
+        chunk_size: Number of bytes copied per read
+        max_bytes: Maximum accepted size in bytes
+        probe_after: Number of bytes to write before the first header probe
+
+    Returns:
+        The metadata dict of the complete file, or None if its header could not be parsed
+    """
+    if hasattr(source, "getbuffer"):
+        buffer = source.getbuffer()  # In-memory upload: slice it instead of copying chunks out
+        chunks = (buffer[offset:offset + chunk_size] for offset in range(0, len(buffer), chunk_size))
+    else:
+        if hasattr(source, "seek"):
+            source.seek(0)
+        chunks = iter(lambda: source.read(chunk_size), b"")
+
+    metadata = None
+    written = 0
+    next_probe = probe_after
+    try:
+        with open(dest_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                written += len(chunk)
+                if max_bytes is not None and written > max_bytes:
+                    raise ValueError(f"Video file is too large. Maximum size is {max_bytes // (1024 * 1024)}MB.")
+
+                if validate_partial is not None and metadata is None and written >= next_probe:
+                    f.flush()
+                    metadata = read_header_metadata(dest_path)
+                    next_probe *= 2
+                    if metadata is not None:
+                        validate_partial(metadata)
+
+        metadata = read_header_metadata(dest_path)
+        if metadata is not None and validate is not None:
+            validate(metadata)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+
+    return metadata
+
+# END
+# ________________________________________________________________
@@ -3,7 +3,7 @@
 
 # IMPORTS
 # ________________________________________________________________
-import cv2
+import hashlib
 import json
 import os
 import torch
@@ -12,26 +12,20 @@ import streamlit as st
 import datetime
 import torchvision.transforms as transforms
 from fpdf import FPDF
-from PIL import Image
-import imageio
-from datetime import timedelta
-
-def add_annotation_to_frame(frame, pred, prob, frame_count, fps, class_names):
-    """Add prediction overlay to a frame (same as inference code)"""
-    timestamp = str(timedelta(seconds=frame_count / fps)).split('.')[0]
-    annotated_frame = frame.copy()
-    height, width = annotated_frame.shape[:2]
-
-    label = f"{class_names[pred]} ({prob:.2f})"
-    color = (0, 255, 0) if pred == 0 else (0, 0, 255)  # Green/Red
-
-    cv2.putText(annotated_frame, label, (50, 50),
-                cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2, cv2.LINE_AA)
-    cv2.putText(annotated_frame, f"Time: {timestamp}", (50, 100),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2, cv2.LINE_AA)
-    cv2.putText(annotated_frame, f"Frame: {frame_count}", (50, height - 50),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2, cv2.LINE_AA)
-    return annotated_frame
+from src.annotation import annotate_clip_frame
+from src.clip_writer import CLIP_EXTENSIONS
+from src.history_store import HistoryStore
+from src.metrics import CACHE_REQUESTS
+from src.predictions import PREDICTIONS_FILE, FramePredictions
+from src.video_probe import probe_video
+
+HISTORY_DB = os.path.join("saves", "history.db")
+LEGACY_HISTORY_FILE = os.path.join("saves", "processed_videos.json")
+REPORTS_DIR = os.path.join("saves", "reports")
+# Bump whenever the PDF layout changes so cached reports are regenerated
+REPORT_TEMPLATE_VERSION = 1
+
+_history_store = None
 
 def calculate_average_scores(confidence_scores_by_class):
     averages = {}
@@ -59,52 +53,50 @@ def create_clickable_blog_post_with_image(title, url, summary, image_url, fixed_
 
 
 def get_detected_sequences(output_dir, mode="violence"):
-    """Find all saved GIFs in the processed_frames subfolder"""
+    """Find all saved sequence clips (GIF, WebP or MP4) in the processed_frames subfolder"""
     # Look in the correct directory structure
     sequences_dir = os.path.join(output_dir, "processed_frames")
     if not os.path.exists(sequences_dir):
         return []
 
-    # Find all GIF files
-    gif_files = []
+    # Find all clip files
+    clip_files = []
     for root, dirs, files in os.walk(sequences_dir):
         for file in files:
-            if file.endswith('.gif'):
-                gif_files.append({
-                    'gif_path': os.path.join(root, file),
-                    'name': file.replace('.gif', '')
+            name, extension = os.path.splitext(file)
+            if extension in CLIP_EXTENSIONS:
+                clip_files.append({
+                    'clip_path': os.path.join(root, file),
+                    'name': name
                 })
 
     # Sort by filename to maintain order
-    gif_files.sort(key=lambda x: x['name'])
+    clip_files.sort(key=lambda x: x['name'])
 
-    return gif_files
+    return clip_files
+
+def show_sequence_clip(clip_path):
+    """Display a sequence clip; MP4 clips play as a looping muted video"""
+    if clip_path.endswith('.mp4'):
+        st.video(clip_path, loop=True, autoplay=True, muted=True)
+    else:
+        st.image(clip_path, use_container_width=True)
 
 def get_total_frames(video_path):
-  cap = cv2.VideoCapture(video_path)
-  total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-  cap.release()
-  return total
+    """Get the number of frames in a video from its (cached) container metadata."""
+    return probe_video(video_path)['frame_count']
 
 def get_video_duration(video_path):
     """Get the duration of a video in seconds."""
-    import cv2
-    video = cv2.VideoCapture(video_path)
-    fps = video.get(cv2.CAP_PROP_FPS)
-    frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration = frame_count / fps
-    video.release()
-    return duration
+    return probe_video(video_path)['duration']
 
 def is_portrait_video(video_path):
-    cap = cv2.VideoCapture(video_path)
-    ret, frame = cap.read()
-    if ret:
-        height, width, _ = frame.shape
-        cap.release()
-        return height > width
-    cap.release()
-    return False
+    """Check the displayed orientation of a video, taking rotation metadata into account."""
+    try:
+        metadata = probe_video(video_path)
+    except (OSError, ValueError):
+        return False
+    return metadata['display_height'] > metadata['display_width']
 
 class NumpyTypeEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -128,11 +120,14 @@ def preprocess_image(image):
 
 # In utils.py
 
-def weighted_fusion(bert_scores, visual_scores, mode="violence"):
-    """Updated fusion function to properly handle both violence and nudity modes"""
+def weighted_fusion(bert_scores, visual_scores, mode="violence", bert_weight=0.4, threshold=0.5):
+    """Updated fusion function to properly handle both violence and nudity modes
+
+    bert_weight (the visual weight is 1 - bert_weight) and the decision
+    threshold can be tuned with python -m src.calibration fusion.
+    """
     # Base weights
-    bert_weight = 0.4
-    visual_weight = 0.6
+    visual_weight = 1 - bert_weight
 
     # Get visual score based on mode
     if mode == "violence":
@@ -155,43 +150,102 @@ def weighted_fusion(bert_scores, visual_scores, mode="violence"):
         combined_harmful = max(combined_harmful, visual_harmful * 1.1)  # Boost slightly
         combined_harmful = min(combined_harmful, 1.0)  # Cap at 100%
 
-    final_prediction = "Harmful" if combined_harmful > 0.5 else "Safe"
+    final_prediction = "Harmful" if combined_harmful > threshold else "Safe"
     final_confidence = combined_harmful if final_prediction == "Harmful" else 1 - combined_harmful
 
     return final_prediction, final_confidence
 
-def save_to_pdf(video_name, history_file, output_path=None):
+def get_history_store():
+    """Return the shared history store, importing the legacy JSON history on first use."""
+    global _history_store
+    if _history_store is None:
+        store = HistoryStore(HISTORY_DB, json_cls=NumpyTypeEncoder)
+        store.import_legacy_json(LEGACY_HISTORY_FILE)  # Safe to race; see import_legacy_json
+        _history_store = store
+    return _history_store
+
+def report_cache_key(video_name, results):
+    """Hash of everything that influences a PDF report."""
+    payload = json.dumps(
+        {"template": REPORT_TEMPLATE_VERSION, "video_name": video_name, "results": results},
+        cls=NumpyTypeEncoder, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_pdf_report(video_name, results=None):
+    """
+    Return the PDF report for a processed video as bytes, regenerating it only when needed.
+
+    The report is cached under saves/reports/<video>/ together with the hash of the
+    results and template version it was built from.
+
+    Args:
+        video_name: Name of the video to generate report for
+        results: Optional results dictionary; if None, it is looked up in the history store
+
+    Returns:
+        The PDF file contents
+    """
+    if results is None:
+        results = get_history_store().get_result(video_name)
+        if results is None:
+            raise ValueError(f"Results for '{video_name}' not found in the history store.")
+
+    base_name = os.path.splitext(video_name)[0]
+    report_dir = os.path.join(REPORTS_DIR, base_name)
+    pdf_path = os.path.join(report_dir, f"{base_name}_report.pdf")
+    key_path = pdf_path + ".sha256"
+    cache_key = report_cache_key(video_name, results)
+
+    if os.path.exists(pdf_path) and os.path.exists(key_path):
+        with open(key_path, "r") as f:
+            cached_key = f.read().strip()
+        if cached_key == cache_key:
+            CACHE_REQUESTS.labels("pdf_report", "hit").inc()
+            with open(pdf_path, "rb") as f:
+                return f.read()
+    CACHE_REQUESTS.labels("pdf_report", "miss").inc()
+
+    pdf_bytes = bytes(_render_pdf_report(video_name, results))
+
+    # Write to temp files first so concurrent readers never see a partial report
+    os.makedirs(report_dir, exist_ok=True)
+    tmp_suffix = f".{os.getpid()}.tmp"
+    with open(pdf_path + tmp_suffix, "wb") as f:
+        f.write(pdf_bytes)
+    with open(key_path + tmp_suffix, "w") as f:
+        f.write(cache_key)
+    os.replace(pdf_path + tmp_suffix, pdf_path)
+    os.replace(key_path + tmp_suffix, key_path)
+    return pdf_bytes
+
+def save_to_pdf(video_name, output_path=None, results=None):
     """
     Generate a single-page PDF report for the processed video.
     
     Args:
         video_name: Name of the video to generate report for
-        history_file: Path to the JSON file containing processing history
         output_path: Optional custom path for saving the PDF; if None, uses default location
+        results: Optional results dictionary; if None, it is looked up in the history store
         
     Returns:
         Path to the generated PDF file
     """
-    # If output_path is not provided, use default location
-    if output_path is None:
-        output_dir = os.path.join("saves", "reports", video_name)
-        os.makedirs(output_dir, exist_ok=True)
-        output_path = os.path.join(output_dir, f"{video_name}_report.pdf")
-    else:
-        # Ensure directory exists for custom output path
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-    if not os.path.exists(history_file):
-        raise FileNotFoundError("Processed videos history file not found!")
+    pdf_bytes = get_pdf_report(video_name, results)
 
-    with open(history_file, "r") as f:
-        history = json.load(f)
+    base_name = os.path.splitext(video_name)[0]
+    default_path = os.path.join(REPORTS_DIR, base_name, f"{base_name}_report.pdf")
+    if output_path is None or os.path.abspath(output_path) == os.path.abspath(default_path):
+        return default_path
 
-    if video_name not in history:
-        raise ValueError(f"Results for '{video_name}' not found in the history file.")
-
-    results = history[video_name]
+    # Ensure directory exists for custom output path
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "wb") as f:
+        f.write(pdf_bytes)
+    return output_path
 
+def _render_pdf_report(video_name, results):
+    """Lay out the single-page report and return the PDF bytes."""
     # Create PDF with A4 dimensions
     pdf = FPDF(format='A4')
     pdf.add_page()
@@ -342,44 +396,17 @@ def save_to_pdf(video_name, history_file, output_path=None):
     pdf.set_text_color(150, 150, 150)
     pdf.cell(0, 10, f"Report generated on {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}", 0, 0, 'C')
 
-    pdf.output(output_path)
-    return output_path
+    return pdf.output()
 
-def save_sequence_as_gif(frames, preds, probs, frame_numbers, fps, output_dir, sequence_id, video_name, class_names):
-    """Save an annotated sequence as GIF"""
-    os.makedirs(output_dir, exist_ok=True)
-    gif_path = os.path.join(output_dir, f"{video_name}_seq_{sequence_id}_{class_names[preds[-1]]}.gif")
-
-    pil_frames = []
-    for i, frame in enumerate(frames):
-        annotated_frame = add_annotation_to_frame(
-            frame, preds[i], probs[i], frame_numbers[i], fps, class_names
-        )
-        img = cv2.cvtColor(annotated_frame, cv2.COLOR_BGR2RGB)
-
-        # Check aspect ratio of the original frame
-        height, width = frame.shape[:2]
-        is_portrait = height > width
-
-        # Resize based on aspect ratio
-        if is_portrait:
-            # Portrait (9:16) - maintain height but adjust width
-            target_height = 480
-            target_width = int(target_height * width / height)
-            pil_frames.append(Image.fromarray(img).resize((target_width, target_height)))
-        else:
-            # Landscape (16:9)
-            target_width = 480
-            target_height = 270
-            pil_frames.append(Image.fromarray(img).resize((target_width, target_height)))
-
-    imageio.mimsave(gif_path, pil_frames, duration=200, loop=0)
-    return gif_path
-
-def save_results(output_dir, video_name, results):
-    history_file = "./saves/processed_videos.json"
-    os.makedirs("./saves", exist_ok=True)
+def sequence_clip_annotator(fps, class_names):
+    """Annotation callable for ClipWriter.start; Clip.add then takes (frame, pred, prob, frame_number)"""
+    def annotate(frame, pred, prob, frame_number):
+        color = (0, 255, 0) if pred == 0 else (0, 0, 255)  # Green/Red
+        return annotate_clip_frame(frame, f"{class_names[pred]} ({prob:.2f})", color, frame_number, fps)
+    return annotate
 
+def save_results(output_dir, video_name, results, predictions_per_frame=None):
+    """Persist the results of a processed video into the history store."""
     # Convert results to serializable format
     serializable_results = {}
     for key, value in results.items():
@@ -392,39 +419,16 @@ def save_results(output_dir, video_name, results):
         else:
             serializable_results[key] = value
 
-    # Load existing history
-    if os.path.exists(history_file):
-        with open(history_file, "r") as f:
-            history = json.load(f)
-    else:
-        history = {}
-
-    # Add new result
-    history[video_name] = serializable_results
-
-    # Limit history to last 5 entries and clean up old files
-    if len(history) > 5:
-        # Sort by processing time (newest first)
-        sorted_keys = sorted(history.keys(),
-                             key=lambda x: history[x].get('processing_time', 0),
-                             reverse=True)
-
-        # Keep only the 5 newest
-        history = {k: history[k] for k in sorted_keys[:5]}
-
-        # Clean up files for removed entries
-        for old_key in sorted_keys[5:]:
-            old_dir = os.path.join("output", os.path.splitext(old_key)[0])
-            try:
-                if os.path.exists(old_dir):
-                    import shutil
-                    shutil.rmtree(old_dir)
-            except Exception as e:
-                print(f"Warning: Could not clean up {old_dir}: {str(e)}")
-
-    # Save the limited history
-    with open(history_file, "w") as f:
-        json.dump(history, f, cls=NumpyTypeEncoder, indent=4)
+    # Per-frame predictions go to a columnar .npz next to the other outputs; the store keeps its path
+    if isinstance(predictions_per_frame, FramePredictions):
+        serializable_results["predictions_path"] = predictions_per_frame.save(
+            os.path.join(output_dir, PREDICTIONS_FILE)
+        )
+        serializable_results["prediction_classes"] = predictions_per_frame.class_names
+        predictions_per_frame = None
+
+    # Retention of old entries is handled by the background janitor (src/retention.py)
+    get_history_store().insert_result(video_name, serializable_results, predictions_per_frame=predictions_per_frame)
 
 def select_diverse_frames(nsfw_frames, max_frames=5):
   if not nsfw_frames:
@@ -0,0 +1,163 @@
+# src/video_probe.py
+
+
+# IMPORTS
+# ________________________________________________________________
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import ffmpeg
+
+from src.metrics import CACHE_REQUESTS
+
+PROBE_CACHE_SIZE = 256
+
+_probe_cache = OrderedDict()
+_probe_lock = threading.Lock()
+_probe_stats = {'hits': 0, 'misses': 0}
+
+
+def probe_video(video_path):
+    """
+    Read container metadata for a video once and cache it per path, mtime and size.
+
+    Returns a dict with duration (s), fps, frame_count, width, height (as stored),
+    rotation (degrees), display_width, display_height, video_codec, audio_codec
+    and has_audio. No frames are decoded.
+    """
+    stat = os.stat(video_path)
+    key = (os.path.abspath(video_path), stat.st_mtime_ns, stat.st_size)
+
+    with _probe_lock:
+        if key in _probe_cache:
+            _probe_cache.move_to_end(key)
+            _probe_stats['hits'] += 1
+            CACHE_REQUESTS.labels("probe", "hit").inc()
+            return dict(_probe_cache[key])
+        _probe_stats['misses'] += 1
+        CACHE_REQUESTS.labels("probe", "miss").inc()
+
+    try:
+        metadata = _probe_with_ffprobe(video_path)
+    except (ffmpeg.Error, FileNotFoundError, KeyError, ValueError, StopIteration):
+        # ffprobe missing or unable to parse the container; fall back to OpenCV headers
+        metadata = _probe_with_opencv(video_path)
+
+    with _probe_lock:
+        _probe_cache[key] = metadata
+        _probe_cache.move_to_end(key)
+        while len(_probe_cache) > PROBE_CACHE_SIZE:
+            _probe_cache.popitem(last=False)
+    return dict(metadata)
+
+
+def read_header_metadata(video_path):
+    """
+    Probe a possibly incomplete file with ffprobe only, bypassing the cache.
+
+    Returns the metadata dict, or None if the header cannot be parsed yet
+    (for example an MP4 whose index is stored at the end of the file).
+    """
+    try:
+        metadata = _probe_with_ffprobe(video_path)
+    except (ffmpeg.Error, FileNotFoundError, KeyError, ValueError, StopIteration):
+        return None
+    return metadata if metadata['duration'] > 0 else None
+
+
+def probe_cache_info():
+    """Return cache hit/miss counters and the current number of cached entries."""
+    with _probe_lock:
+        return {**_probe_stats, 'size': len(_probe_cache)}
+
+
+def _probe_with_ffprobe(video_path):
+    info = ffmpeg.probe(video_path)
+    streams = info.get('streams', [])
+    video_stream = next(s for s in streams if s.get('codec_type') == 'video')
+    audio_stream = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+
+    fps = _parse_rate(video_stream.get('avg_frame_rate')) or _parse_rate(video_stream.get('r_frame_rate'))
+    duration = float(video_stream.get('duration') or info.get('format', {}).get('duration') or 0.0)
+    if video_stream.get('nb_frames'):
+        frame_count = int(video_stream['nb_frames'])
+    else:
+        # Matroska/WebM do not store a frame count in the header
+        frame_count = int(round(duration * fps))
+    if not duration and fps:
+        duration = frame_count / fps
+
+    return _build_metadata(
+        duration=duration,
+        fps=fps,
+        frame_count=frame_count,
+        width=int(video_stream['width']),
+        height=int(video_stream['height']),
+        rotation=_parse_rotation(video_stream),
+        video_codec=video_stream.get('codec_name'),
+        audio_codec=audio_stream.get('codec_name') if audio_stream else None,
+    )
+
+
+def _probe_with_opencv(video_path):
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {video_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+        codec = "".join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).strip() or None
+        return _build_metadata(
+            duration=frame_count / fps if fps else 0.0,
+            fps=fps,
+            frame_count=frame_count,
+            width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            rotation=0,
+            video_codec=codec,
+            audio_codec=None,
+        )
+    finally:
+        cap.release()
+
+
+def _build_metadata(duration, fps, frame_count, width, height, rotation, video_codec, audio_codec):
+    rotated = rotation % 180 == 90
+    return {
+        'duration': duration,
+        'fps': fps,
+        'frame_count': frame_count,
+        'width': width,
+        'height': height,
+        'rotation': rotation,
+        'display_width': height if rotated else width,
+        'display_height': width if rotated else height,
+        'video_codec': video_codec,
+        'audio_codec': audio_codec,
+        'has_audio': audio_codec is not None,
+    }
+
+
+def _parse_rate(rate):
+    """Parse an ffprobe rational such as '30000/1001'."""
+    if not rate:
+        return 0.0
+    num, _, den = str(rate).partition('/')
+    den = float(den) if den else 1.0
+    return float(num) / den if den else 0.0
+
+
+def _parse_rotation(video_stream):
+    rotation = video_stream.get('tags', {}).get('rotate')
+    if rotation is None:
+        for side_data in video_stream.get('side_data_list', []):
+            if 'rotation' in side_data:
+                rotation = side_data['rotation']
+                break
+    return int(float(rotation)) % 360 if rotation is not None else 0
+
+# END
+# ________________________________________________________________
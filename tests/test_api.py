@@ -0,0 +1,25 @@
+# tests/test_api.py
+"""Smoke tests of the HTTP API service with the benchmark's stub models."""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from src.api import AnalysisService  # noqa: E402
+from src.benchmark import load_stub_models  # noqa: E402
+
+
+@pytest.fixture
+def service(tmp_path):
+    return AnalysisService(load_stub_models(), max_jobs=1, output_root=str(tmp_path))
+
+
+def test_service_starts_with_batched_models(service):
+    assert set(service.stats()) == {"violence", "nudity", "bert"}
+
+
+def test_batched_classifier_returns_one_output_per_input(service):
+    frames = torch.rand(3, 3, 8, 8)
+    logits = service.infer_fns["nudity"](frames)
+    assert logits.shape == (3, 2)
+    assert service.stats()["nudity"]["recent_batch_sizes"] == [1]
@@ -0,0 +1,88 @@
+# tests/test_calibration.py
+"""Threshold and fusion weight sweeps of src.calibration."""
+
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.calibration import (fused_scores, fusion_sweep, load_batch_scores, operating_points,  # noqa: E402
+                             positive_scores, threshold_sweep)
+
+
+def brute_force_counts(scores, labels, threshold):
+    flagged = scores > threshold
+    return {"tp": int((flagged & labels).sum()), "fp": int((flagged & ~labels).sum()),
+            "fn": int((~flagged & labels).sum()), "tn": int((~flagged & ~labels).sum())}
+
+
+def test_threshold_sweep_matches_brute_force():
+    rng = np.random.default_rng(0)
+    scores = np.round(rng.random(500), 2)  # Ties on the thresholds themselves
+    labels = rng.random(500) < scores
+    thresholds = np.round(np.linspace(0.0, 1.0, 101), 2)
+    sweep = threshold_sweep(scores, labels, thresholds)
+    for index, threshold in enumerate(thresholds):
+        expected = brute_force_counts(scores, labels, threshold)
+        assert {key: int(sweep[key][index]) for key in expected} == expected
+
+
+def test_threshold_sweep_metrics_without_positives_or_predictions():
+    sweep = threshold_sweep([0.2, 0.4], [False, False], [0.5])
+    assert sweep["precision"][0] == 1.0 and sweep["recall"][0] == 0.0 and sweep["f1"][0] == 0.0
+    assert sweep["accuracy"][0] == 1.0
+
+
+def test_positive_scores_argmax_zeroes_frames_won_by_another_class():
+    logits = np.log([[0.6, 0.4], [0.3, 0.7]])
+    assert positive_scores(logits, 0).tolist() == pytest.approx([0.6, 0.3])
+    assert positive_scores(logits, 0, argmax=True).tolist() == pytest.approx([0.6, 0.0])
+
+
+@pytest.mark.parametrize("mode", ["violence", "nudity"])
+def test_fused_scores_match_weighted_fusion(mode):
+    pytest.importorskip("torch")
+    from src.utils import weighted_fusion
+
+    rng = np.random.default_rng(1)
+    bert, visual = rng.random(200), rng.random(200)
+    weights = [0.0, 0.25, 0.4, 1.0]
+    combined = fused_scores(bert, visual, weights, mode)
+    visual_key = "harmful" if mode == "violence" else "nude"
+    for row, weight in enumerate(weights):
+        for index in range(len(bert)):
+            prediction, confidence = weighted_fusion({"harmful": bert[index]}, {visual_key: visual[index]},
+                                                     mode, bert_weight=weight)
+            expected = confidence if prediction == "Harmful" else 1 - confidence
+            assert combined[row, index] == pytest.approx(expected)
+
+
+def test_fusion_sweep_and_operating_points():
+    bert = np.array([0.9, 0.8, 0.2, 0.1])
+    visual = np.array([0.1, 0.9, 0.8, 0.1])
+    labels = np.array([True, True, False, False])
+    sweep = fusion_sweep(bert, visual, labels, bert_weights=[0.0, 1.0], thresholds=[0.5])
+    assert sweep["f1"].shape == (2, 1)
+    points = operating_points(sweep, target_recall=1.0, current={"bert_weight": 0.0, "threshold": 0.5})
+    assert points["best_f1"]["bert_weight"] == 1.0 and points["best_f1"]["f1"] == 1.0
+    assert points["target_recall"]["recall"] == 1.0
+    assert points["current"]["bert_weight"] == 0.0
+
+
+def test_load_batch_scores_labels_videos_by_parent_directory(tmp_path):
+    records = [
+        {"status": "ok", "video_path": "/data/violence/a.mp4",
+         "results": {"mode": "Violence + Audio Detection", "bert_scores": {"harmful": 0.7},
+                     "harmful_score_visual": 0.6}},
+        {"status": "ok", "video_path": "/data/safe/b.mp4",
+         "results": {"mode": "Violence + Audio Detection", "bert_scores": {"harmful": 0.1},
+                     "harmful_score_visual": 0.2}},
+        {"status": "error", "video_path": "/data/violence/c.mp4"},
+    ]
+    path = tmp_path / "results.jsonl"
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    bert, visual, labels, mode = load_batch_scores(str(path), ["Violence"])
+    assert bert.tolist() == [0.7, 0.1] and visual.tolist() == [0.6, 0.2]
+    assert labels.tolist() == [True, False]
+    assert mode == "violence"
@@ -0,0 +1,64 @@
+# tests/test_cascade.py
+"""Student/teacher cascade report and model."""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+import numpy as np  # noqa: E402
+
+from src.cascade import CascadeModel, cascade_report, harmful_class_index  # noqa: E402
+
+
+def logits_for(harmful_probabilities, harmful_index=1):
+    """Two-class logits whose softmax gives the harmful class these probabilities."""
+    p = np.asarray(harmful_probabilities, dtype=np.float64)
+    harmful = np.log(p)
+    other = np.log(1 - p)
+    return np.stack([other, harmful] if harmful_index == 1 else [harmful, other], axis=1)
+
+
+def test_harmful_class_index_skips_safe():
+    assert harmful_class_index(["Safe", "Violence"]) == 1
+    assert harmful_class_index(["nude", "safe"]) == 0
+
+
+def test_cascade_report_counts_escalations_recall_and_compute():
+    student = logits_for([0.05, 0.3, 0.6, 0.9])
+    teacher = logits_for([0.1, 0.8, 0.2, 0.9])
+    labels = [0, 1, 0, 1]
+    rows = cascade_report(student, teacher, labels, harmful_index=1, thresholds=(0.2, 0.95), cost_ratio=0.1)
+    teacher_row, low, high = rows
+
+    assert teacher_row["threshold"] == 0.0 and teacher_row["compute"] == 1.0
+    assert teacher_row["recall"] == 1.0 and teacher_row["precision"] == 1.0
+
+    # 0.2: inputs 2-4 go to the teacher, which answers all of them correctly
+    assert low["escalation_rate"] == 0.75
+    assert low["recall"] == 1.0 and low["recall_retained"] == 1.0 and low["precision"] == 1.0
+    assert low["compute"] == pytest.approx(0.85) and low["compute_saved"] == pytest.approx(0.15)
+
+    # 0.95: the student answers everything and flags its false positive
+    assert high["escalation_rate"] == 0.0
+    assert high["recall"] == 0.5 and high["recall_retained"] == 0.5 and high["precision"] == 0.5
+    assert high["compute"] == pytest.approx(0.1)
+
+
+def test_cascade_model_runs_the_teacher_only_on_flagged_inputs():
+    class Fixed(torch.nn.Module):
+        def __init__(self, harmful_probabilities):
+            super().__init__()
+            self.logits = torch.from_numpy(logits_for(harmful_probabilities)).float()
+            self.seen = []
+
+        def forward(self, x):
+            self.seen.append(x[:, 0].tolist())
+            return self.logits[x[:, 0].long()]
+
+    student, teacher = Fixed([0.1, 0.5, 0.9]), Fixed([0.2, 0.05, 0.99])
+    cascade = CascadeModel(student, teacher, harmful_index=1, threshold=0.4, name="test")
+    inputs = torch.arange(3, dtype=torch.float32)[:, None]
+    probabilities = torch.softmax(cascade(inputs), dim=1)[:, 1]
+
+    assert teacher.seen == [[1.0, 2.0]]
+    assert probabilities.tolist() == pytest.approx([0.1, 0.05, 0.99], abs=1e-6)
@@ -0,0 +1,91 @@
+# tests/test_history_store.py
+"""SQLite history store and the import of the legacy JSON history."""
+
+import json
+import multiprocessing
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from src.history_store import HistoryStore  # noqa: E402
+
+
+def result(prediction="Safe", **extra):
+    return {"mode": "Violence + Audio Detection", "final_prediction": prediction, "final_confidence": 0.9,
+            "processing_time": 1.5, "transcription": [{"text": "hello"}], "highlighted_text": "<b>hello</b>",
+            **extra}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / "history.db"))
+
+
+def test_result_round_trip_keeps_transcript_apart(store):
+    store.insert_result("clip.mp4", result(score=0.25))
+    summary = store.list_summaries()[0]
+    assert summary["name"] == "clip.mp4"
+    assert summary["final_prediction"] == "Safe"
+
+    full = store.get_result("clip.mp4")
+    assert full["score"] == 0.25
+    assert full["transcription"] == [{"text": "hello"}]
+    assert full["highlighted_text"] == "<b>hello</b>"
+    assert store.get_result("missing.mp4") is None
+
+
+def test_insert_replaces_and_delete_cascades(store):
+    store.insert_result("clip.mp4", result("Safe"), predictions_per_frame=[(1, "Safe", 0.9), (2, "Violence", 0.8)])
+    store.insert_result("clip.mp4", result("Harmful"), predictions_per_frame=[(1, "Violence", 0.7)])
+    assert store.count() == 1
+    assert store.get_result("clip.mp4")["final_prediction"] == "Harmful"
+    assert store.get_frame_predictions("clip.mp4") == [(1, "Violence", pytest.approx(0.7))]
+
+    store.delete("clip.mp4")
+    assert not store.has_video("clip.mp4")
+    assert store.get_frame_predictions("clip.mp4") == []
+
+
+def test_summaries_are_newest_first_and_filtered(store):
+    store.insert_result("old.mp4", result("Safe"), created_at=100)
+    store.insert_result("new.mp4", result("Harmful"), created_at=200)
+    assert [entry["name"] for entry in store.list_summaries()] == ["new.mp4", "old.mp4"]
+    assert [entry["name"] for entry in store.list_summaries(verdict="Safe")] == ["old.mp4"]
+    assert store.count(verdict="Harmful") == 1
+
+
+def write_legacy_history(path, names):
+    with open(path, "w") as f:
+        json.dump({name: result() for name in names}, f)
+
+
+def test_legacy_json_is_imported_once_and_renamed(store, tmp_path):
+    history_file = str(tmp_path / "processed_videos.json")
+    write_legacy_history(history_file, ["a.mp4", "b.mp4", "c.mp4"])
+    store.insert_result("b.mp4", result("Harmful"))
+
+    assert store.import_legacy_json(history_file) == 2
+    assert not os.path.exists(history_file)
+    assert os.path.exists(history_file + ".migrated")
+    assert store.get_result("b.mp4")["final_prediction"] == "Harmful"  # Existing entries are kept
+    # The old file listed the newest entry last
+    assert [entry["name"] for entry in store.list_summaries()][:3] == ["b.mp4", "c.mp4", "a.mp4"]
+    assert store.import_legacy_json(history_file) == 0
+
+
+def _import(paths):
+    db_path, history_file = paths
+    return HistoryStore(db_path).import_legacy_json(history_file)
+
+
+def test_concurrent_processes_import_the_legacy_json_once(tmp_path):
+    db_path, history_file = str(tmp_path / "history.db"), str(tmp_path / "processed_videos.json")
+    write_legacy_history(history_file, [f"video_{index}.mp4" for index in range(50)])
+    HistoryStore(db_path)
+
+    with multiprocessing.get_context("spawn").Pool(4) as pool:
+        imported = pool.map(_import, [(db_path, history_file)] * 8)
+    assert sorted(imported) == [0] * 7 + [50]
+    assert HistoryStore(db_path).count() == 50
@@ -0,0 +1,111 @@
+# tests/test_parallel_video.py
+"""Segment planning and the rebuild of sequences after a segmented run, against the serial extractors."""
+
+import os
+
+import pytest
+
+pytest.importorskip("torch")
+cv2 = pytest.importorskip("cv2")
+
+import imageio  # noqa: E402
+import numpy as np  # noqa: E402
+
+from src.benchmark import load_stub_models  # noqa: E402
+from src.clip_writer import ClipWriter  # noqa: E402
+from src.parallel_video import (CLIP_FRAMES_DIR, plan_segments, rebuild_nudity_sequences,  # noqa: E402
+                                rebuild_violence_sequences)
+from src.predictions import FramePredictions  # noqa: E402
+from src.proc_nudity import extract_nudity_sequences  # noqa: E402
+from src.proc_video_sequence import extract_frame_sequences  # noqa: E402
+from src.synthetic_video import render_frame  # noqa: E402
+
+FPS = 15
+FRAMES = 90  # Frames 31-60 show the red "harmful" block
+SEQUENCE_LENGTH = 8
+SEGMENTS = [(1, 40), (41, None)]  # The boundary falls inside the harmful section
+
+
+@pytest.fixture(scope="module")
+def video_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("video") / "synthetic.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, (320, 180))
+    rng = np.random.default_rng(0)
+    for index in range(FRAMES):
+        writer.write(render_frame(index, FRAMES, 320, 180, rng))
+    writer.release()
+    return path
+
+
+@pytest.fixture(scope="module")
+def models():
+    return load_stub_models()
+
+
+def test_plan_segments_covers_every_frame():
+    assert plan_segments(1000, 4, min_segment_frames=100) == [(1, 250), (251, 500), (501, 750), (751, None)]
+    assert plan_segments(250, 4, min_segment_frames=100) == [(1, 125), (126, None)]
+    assert plan_segments(50, 4, min_segment_frames=100) == [(1, None)]
+
+
+def run(kind, models, video_path, output_dir, save_gifs=False, **kwargs):
+    model, class_names = models[f"{kind}_model"], models[f"{kind}_class_names"]
+    extract = extract_frame_sequences if kind == "violence" else extract_nudity_sequences
+    return extract(video_path, output_dir, model, class_names, sequence_length=SEQUENCE_LENGTH,
+                   save_frames=False, save_gifs=save_gifs, clip_format="gif", **kwargs)
+
+
+def run_segmented(kind, models, video_path, output_dir, clip_writer=None):
+    """What analyze_in_segments does, without the worker pool."""
+    class_names = models[f"{kind}_class_names"]
+    clip_frames_dir = os.path.join(output_dir, CLIP_FRAMES_DIR) if clip_writer else None
+    parts = [run(kind, models, video_path, output_dir, frame_range=segment, clip_frames_dir=clip_frames_dir)[1]
+             for segment in SEGMENTS]
+    predictions = FramePredictions.concatenate(parts, class_names)
+    if kind == "violence":
+        sequences = rebuild_violence_sequences(predictions, output_dir, SEQUENCE_LENGTH, "synthetic",
+                                               class_names, clip_writer, FPS)
+    else:
+        sequences = rebuild_nudity_sequences(predictions, output_dir, SEQUENCE_LENGTH, clip_writer, FPS)
+    return predictions, sequences
+
+
+def overlay_regions(frames):
+    """Pixels of the annotate_clip_frame text: label and time at the top left, frame number at the bottom."""
+    return np.concatenate([frames[:, 8:52, 5:220].reshape(len(frames), -1),
+                           frames[:, -30:-5, 5:160].reshape(len(frames), -1)], axis=1)
+
+
+def without_clips(sequences):
+    return [{key: value for key, value in sequence.items() if key != "clip_path"} for sequence in sequences]
+
+
+@pytest.mark.parametrize("kind", ["violence", "nudity"])
+def test_segmented_run_matches_serial_run(kind, models, video_path, tmp_path):
+    _, serial_predictions, _, serial_sequences = run(kind, models, video_path, str(tmp_path / "serial"))
+    predictions, sequences = run_segmented(kind, models, video_path, str(tmp_path / "segments"))
+
+    assert serial_sequences, "the stub model should detect the red section"
+    assert predictions.frames.tolist() == serial_predictions.frames.tolist()
+    assert predictions.class_ids.tolist() == serial_predictions.class_ids.tolist()
+    assert without_clips(sequences) == pytest.approx(without_clips(serial_sequences))
+
+
+@pytest.mark.parametrize("kind", ["violence", "nudity"])
+def test_rebuilt_clips_look_like_serial_clips(kind, models, video_path, tmp_path):
+    serial = run(kind, models, video_path, str(tmp_path / "serial"), save_gifs=True)[3]
+    output_dir = str(tmp_path / "segments")
+    clip_writer = ClipWriter("gif")
+    try:
+        _, rebuilt = run_segmented(kind, models, video_path, output_dir, clip_writer)
+    finally:
+        clip_writer.close()
+
+    assert len(rebuilt) == len(serial)
+    for serial_sequence, rebuilt_sequence in zip(serial, rebuilt):
+        serial_frames = np.stack(imageio.mimread(serial_sequence["clip_path"])).astype(np.float32)
+        rebuilt_frames = np.stack(imageio.mimread(rebuilt_sequence["clip_path"])).astype(np.float32)
+        assert rebuilt_frames.shape == serial_frames.shape
+        # Same label, time and frame number overlay; only the JPEG round trip of the clip frames differs
+        difference = np.abs(overlay_regions(rebuilt_frames) - overlay_regions(serial_frames)).mean()
+        assert difference < 10  # About 16 when the rebuilt clips have no overlay
@@ -0,0 +1,56 @@
+# tests/test_pdf_report.py
+"""Cache key and invalidation of the PDF reports."""
+
+import os
+
+import pytest
+
+pytest.importorskip("torch")
+
+from src import utils  # noqa: E402
+
+RESULTS = {"final_prediction": "Safe", "final_confidence": 0.8, "transcription": []}
+
+
+@pytest.fixture
+def renders(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # REPORTS_DIR is relative
+    calls = []
+
+    def render(video_name, results):
+        calls.append(results)
+        return f"%PDF {video_name} {len(calls)}".encode()
+
+    monkeypatch.setattr(utils, "_render_pdf_report", render)
+    return calls
+
+
+def test_cache_key_covers_results_and_template(monkeypatch):
+    key = utils.report_cache_key("clip.mp4", RESULTS)
+    assert key == utils.report_cache_key("clip.mp4", dict(RESULTS))
+    assert key != utils.report_cache_key("other.mp4", RESULTS)
+    assert key != utils.report_cache_key("clip.mp4", {**RESULTS, "final_confidence": 0.81})
+    monkeypatch.setattr(utils, "REPORT_TEMPLATE_VERSION", utils.REPORT_TEMPLATE_VERSION + 1)
+    assert key != utils.report_cache_key("clip.mp4", RESULTS)
+
+
+def test_report_is_rendered_once_per_results(renders):
+    first = utils.get_pdf_report("clip.mp4", RESULTS)
+    assert utils.get_pdf_report("clip.mp4", dict(RESULTS)) == first
+    assert len(renders) == 1
+    assert os.path.exists(os.path.join("saves", "reports", "clip", "clip_report.pdf"))
+
+    changed = utils.get_pdf_report("clip.mp4", {**RESULTS, "final_prediction": "Harmful"})
+    assert changed != first
+    assert len(renders) == 2
+
+
+def test_report_without_matching_key_file_is_rendered_again(renders):
+    utils.get_pdf_report("clip.mp4", RESULTS)
+    key_path = os.path.join("saves", "reports", "clip", "clip_report.pdf.sha256")
+    with open(key_path, "w") as f:
+        f.write("stale")
+    utils.get_pdf_report("clip.mp4", RESULTS)
+    os.remove(key_path)
+    utils.get_pdf_report("clip.mp4", RESULTS)
+    assert len(renders) == 3
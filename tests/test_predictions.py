@@ -0,0 +1,74 @@
+# tests/test_predictions.py
+"""Columnar per-frame predictions."""
+
+import pickle
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.predictions import FramePredictions  # noqa: E402
+
+CLASSES = ("nude", "safe")
+
+
+def make(rows, capacity=2):
+    predictions = FramePredictions(CLASSES, capacity=capacity)
+    for row in rows:
+        predictions.append(*row)
+    return predictions
+
+
+def test_append_grows_and_iterates_as_tuples():
+    predictions = make([(frame, frame % 2, 0.5 + frame / 100, 0.25) for frame in range(1, 6)])
+    assert len(predictions) == 5
+    assert list(predictions)[:2] == [(1, "safe", pytest.approx(0.51)), (2, "nude", pytest.approx(0.52))]
+    assert predictions.confidences_of("nude").tolist() == pytest.approx([0.52, 0.54])
+    assert predictions.harmful_scores.tolist() == [0.25] * 5
+
+
+def test_save_load_and_pickle_round_trip(tmp_path):
+    predictions = make([(1, 0, 0.9, 0.9), (2, 1, 0.6, 0.4)])
+    path = predictions.save(str(tmp_path / "predictions.npz"))
+    assert path.endswith("predictions.npz") and not (tmp_path / "predictions.npz.npz").exists()
+
+    for copy in (FramePredictions.load(path, CLASSES), pickle.loads(pickle.dumps(predictions))):
+        assert list(copy) == list(predictions)
+        assert copy.harmful_scores.tolist() == pytest.approx([0.9, 0.4])
+
+
+def test_concatenate_merges_segments_in_frame_order():
+    late = make([(5, 0, 0.9, 0.9), (6, 1, 0.8, 0.2)])
+    early = make([(1, 1, 0.7, 0.3), (2, 0, 0.95, 0.95)])
+    merged = FramePredictions.concatenate([late, early], CLASSES)
+    assert merged.frames.tolist() == [1, 2, 5, 6]
+    assert merged.harmful_scores.tolist() == pytest.approx([0.3, 0.95, 0.9, 0.2])
+    assert len(FramePredictions.concatenate([], CLASSES)) == 0
+
+
+def test_from_tuples_keeps_instances_and_leaves_scores_unknown():
+    predictions = make([(1, 0, 0.9)])
+    assert FramePredictions.from_tuples(predictions, CLASSES) is predictions
+    rebuilt = FramePredictions.from_tuples([(1, "nude", 0.9), (2, "safe", 0.8)], CLASSES)
+    assert rebuilt.class_ids.tolist() == [0, 1]
+    assert np.isnan(rebuilt.harmful_scores).all()
+
+
+def test_timeline_plots_the_stored_harmful_probability():
+    # A nude frame below the nudity threshold is labelled 'safe' but keeps its nude confidence
+    predictions = make([(1, 0, 0.9, 0.9), (2, 1, 0.7, 0.7), (3, 1, 0.8, 0.2)])
+    frames, scores = predictions.timeline("nude")
+    assert frames.tolist() == [1, 2, 3]
+    assert scores.tolist() == pytest.approx([0.9, 0.7, 0.2])
+
+
+def test_timeline_falls_back_to_the_label_without_stored_scores():
+    rebuilt = FramePredictions.from_tuples([(1, "nude", 0.9), (2, "safe", 0.8)], CLASSES)
+    assert rebuilt.timeline("nude")[1].tolist() == pytest.approx([0.9, 0.2])
+
+
+def test_timeline_max_pools_long_videos():
+    predictions = make([(frame, 1, 0.9, 0.8 if frame == 7 else 0.1) for frame in range(1, 11)])
+    frames, scores = predictions.timeline("nude", max_points=4)
+    assert frames.tolist() == [1, 4, 7, 10]
+    assert scores.tolist() == pytest.approx([0.1, 0.1, 0.8, 0.1])
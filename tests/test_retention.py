@@ -0,0 +1,77 @@
+# tests/test_retention.py
+"""DiskJanitor retention passes and removal of orphaned output folders."""
+
+import os
+
+import pytest
+
+pytest.importorskip("torch")
+
+from src.history_store import HistoryStore  # noqa: E402
+from src.retention import ORPHAN_GRACE_SECONDS, DiskJanitor, RetentionPolicy  # noqa: E402
+
+NOW = 1_000_000_000.0
+DAY = 24 * 60 * 60
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # OUTPUT_ROOT and REPORTS_ROOT are relative
+    return HistoryStore(str(tmp_path / "history.db"))
+
+
+def add_video(store, name, created_at, size=10):
+    store.insert_result(name, {"final_prediction": "Safe"}, created_at=created_at)
+    folder = os.path.join("output", os.path.splitext(name)[0])
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "result.bin"), "wb") as f:
+        f.write(b"x" * size)
+    return folder
+
+
+def make_folder(name, age):
+    folder = os.path.join("output", name)
+    os.makedirs(folder)
+    os.utime(folder, (NOW - age, NOW - age))
+    return folder
+
+
+def names(store):
+    return {entry["name"] for entry in store.list_summaries()}
+
+
+def test_max_entries_removes_the_oldest_videos(store):
+    folders = [add_video(store, f"v{index}.mp4", NOW - 100 + index) for index in range(4)]
+    janitor = DiskJanitor(RetentionPolicy(max_entries=2), store=store)
+
+    assert sorted(janitor.enforce(now=NOW)) == ["v0.mp4", "v1.mp4"]
+    assert names(store) == {"v2.mp4", "v3.mp4"}
+    assert [os.path.exists(folder) for folder in folders] == [False, False, True, True]
+    assert janitor.usage == {"v2.mp4": 10, "v3.mp4": 10}
+
+
+def test_age_and_disk_limits_always_keep_the_newest_video(store):
+    add_video(store, "old.mp4", NOW - 10 * DAY, size=100)
+    add_video(store, "older.mp4", NOW - 20 * DAY, size=100)
+    janitor = DiskJanitor(RetentionPolicy(max_entries=None, max_age_seconds=DAY), store=store)
+    assert janitor.enforce(now=NOW) == ["older.mp4"]
+    assert names(store) == {"old.mp4"}
+
+    add_video(store, "new.mp4", NOW, size=100)
+    janitor.policy = RetentionPolicy(max_entries=None, max_disk_bytes=150)
+    assert janitor.enforce(now=NOW) == ["old.mp4"]
+    assert names(store) == {"new.mp4"}
+
+
+def test_stale_orphans_are_removed_but_tool_roots_are_not(store):
+    add_video(store, "kept.mp4", NOW)
+    os.utime(os.path.join("output", "kept"), (NOW - 2 * ORPHAN_GRACE_SECONDS,) * 2)
+    stale = make_folder("never_saved", 2 * ORPHAN_GRACE_SECONDS)
+    fresh = make_folder("in_progress", 60)
+    tool_roots = [make_folder(name, 2 * ORPHAN_GRACE_SECONDS) for name in ("batch", "api", "benchmark")]
+
+    DiskJanitor(RetentionPolicy(), store=store).enforce(now=NOW)
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
+    assert os.path.exists(os.path.join("output", "kept"))
+    assert all(os.path.exists(folder) for folder in tool_roots)